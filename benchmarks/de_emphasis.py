@@ -0,0 +1,49 @@
+"""
+Throughput of the de-emphasis filter applied to emphasized tracks when ripped:
+
+    python -m benchmarks.de_emphasis [--seconds 600] [--chunk-seconds 1]
+
+Feeds noise through DeEmphasisFilter in chunks of the size the ripper reads
+from cd-paranoia and reports how many times faster than real time that is.
+Ripping at 8x or more needs the filter to be well past that, with CPU left
+for the FLAC encoders.
+"""
+import argparse
+import time
+
+import numpy
+
+from hifi_appliance.constants import CHANNELS
+from hifi_appliance.constants import SAMPLE_RATE
+from hifi_appliance.constants import SAMPLE_WIDTH
+from hifi_appliance.rip import DeEmphasisFilter
+
+
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--seconds', type=int, default=600, help='seconds of audio to filter')
+    parser.add_argument('--chunk-seconds', type=float, default=1, help='seconds of audio per chunk')
+    options = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    chunk_size = int(options.chunk_seconds * SAMPLE_RATE) * CHANNELS * SAMPLE_WIDTH
+    chunk = rng.integers(-32768, 32767, size=chunk_size // SAMPLE_WIDTH, dtype='<i2').tobytes()
+    chunks = max(1, options.seconds * BYTES_PER_SECOND // chunk_size)
+
+    de_emphasis = DeEmphasisFilter()
+    started = time.process_time()
+    for _ in range(chunks):
+        de_emphasis.process(chunk)
+    elapsed = time.process_time() - started
+
+    audio_seconds = chunks * chunk_size / BYTES_PER_SECOND
+    print('%.0f s of audio in %.2f s CPU: %.0fx real time, %.2f ms per chunk of %.2f s' % (
+        audio_seconds, elapsed, audio_seconds / elapsed, elapsed / chunks * 1000, options.chunk_seconds
+    ))
+
+
+if __name__ == '__main__':
+    main()
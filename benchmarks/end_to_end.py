@@ -0,0 +1,273 @@
+"""
+End-to-end benchmark of Commander, Ripping and Playback on the simulated
+drive from tests/sim, without any hardware:
+
+    python -m benchmarks.end_to_end [--disc tests/data/musicbrainz/cd_08]
+
+The daemons run in debug mode (no forking) with the stand-in executables
+first on PATH, the discid stand-in on PYTHONPATH, a local MusicBrainz
+stand-in and the miniaudio null backend. Reports insert-to-first-audio
+latency, rip throughput and CPU time used by each daemon. Once the ripped
+album is indexed, it's played again from the library to measure how soon
+audio starts without the drive.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+import zmq
+
+REPO_PATH = Path(__file__).resolve().parent.parent
+SIM_PATH = REPO_PATH.joinpath('tests', 'sim')
+
+# reading TOC fixtures imports hifi_appliance.disc, which needs libdiscid
+# unless the stand-in comes first
+sys.path.insert(0, str(SIM_PATH.joinpath('pylib')))
+
+from hifi_appliance.db import TrackDBClient
+from hifi_appliance.message_bus import command as channel_command
+from hifi_appliance.message_bus import state as channel_state
+from hifi_appliance.state import PlayerSources
+from hifi_appliance.state import PlayerStates
+from hifi_appliance.state import RipperStates
+from tests.sim.drive import BYTES_PER_SECOND
+from tests.sim.drive import SimulatedDisc
+from tests.sim.musicbrainz import MusicbrainzStandIn
+
+DAEMONS = ['start_commander.py', 'start_ripper.py', 'start_player.py']
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Benchmark(object):
+    def __init__(self, options):
+        self.options = options
+        self.work_path = Path(tempfile.mkdtemp(prefix='cdp-sa-bench-'))
+        self.disc = SimulatedDisc.from_file(options.disc, options.scale)
+        self.processes = {}
+
+        self.stand_in = MusicbrainzStandIn()
+        if options.disc_meta:
+            self.stand_in.register(self.disc.disc_id, json.loads(Path(options.disc_meta).read_text()))
+
+        context = zmq.Context.instance()
+        self.state_socket = context.socket(zmq.SUB)
+        for address in channel_state._pub_addresses.values():
+            self.state_socket.connect(address)
+        self.state_socket.set(zmq.SUBSCRIBE, b'')
+
+        self.command_socket = context.socket(zmq.PUSH)
+        self.command_socket.connect(channel_command._address)
+
+    def write_config(self):
+        music_path = self.work_path.joinpath('music')
+        music_path.mkdir()
+
+        config = {
+            'DEBUG': True,
+            'LOGGING_LEVEL': 'WARNING',
+            'MUSIC_PATH_NAME': str(music_path),
+            'DB_FILE_PATH': str(self.work_path.joinpath('tracks.db')),
+            'ACCURATERIP_DB_PATH': str(self.work_path.joinpath('accuraterip')),
+            'META_CACHE_PATH': str(self.work_path.joinpath('meta_cache.db')),
+            'OFFLINE_META_INDEX_PATH': str(self.work_path.joinpath('musicbrainz.db')),
+            'PLAY_QUEUE_PATH': str(self.work_path.joinpath('play_queue')),
+            'READAHEAD_CACHE_PATH': str(self.work_path.joinpath('readahead')),
+            'RESUME_POSITIONS_PATH': str(self.work_path.joinpath('resume_positions')),
+            'RESAMPLE_CACHE_PATH': str(self.work_path.joinpath('resampled')),
+            'AUDIO_BACKENDS': ['null'],
+            'MUSICBRAINZ_HOST': self.stand_in.host,
+            'MUSICBRAINZ_USE_HTTPS': False,
+        }
+        config_path = self.work_path.joinpath('cdp-sa.yaml')
+        config_path.write_text(yaml.dump(config))
+        return config_path
+
+    def environment(self, config_path):
+        env = dict(os.environ)
+        env['PATH'] = '%s:%s' % (SIM_PATH.joinpath('bin'), env['PATH'])
+        env['PYTHONPATH'] = str(SIM_PATH.joinpath('pylib'))
+        env['CDP_SA_CONFIG'] = str(config_path)
+        env['CDP_SIM_DISC'] = str(Path(self.options.disc).resolve())
+        env['CDP_SIM_SCALE'] = str(self.options.scale)
+        env['CDP_SIM_READ_SPEED'] = str(self.options.read_speed)
+        env['CDP_SIM_ERROR_RATE'] = str(self.options.error_rate)
+        return env
+
+    def start_daemons(self):
+        env = self.environment(self.write_config())
+        for script in DAEMONS:
+            log = open(self.work_path.joinpath(script.replace('.py', '.log')), 'w')
+            self.processes[script] = subprocess.Popen(
+                [sys.executable, str(REPO_PATH.joinpath(script))],
+                cwd=str(REPO_PATH), env=env, stdout=log, stderr=log
+            )
+
+    def stop_daemons(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def send(self, *command):
+        self.command_socket.send_multipart([part.encode('ascii') for part in command])
+
+    def receive_states(self, timeout):
+        """
+        Yields (sender, state) until the timeout (seconds) runs out, and
+        (None, None) whenever nothing was received for 100ms.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.state_socket.poll(100):
+                (sender, message) = self.state_socket.recv_multipart()
+                yield (sender.decode('ascii'), json.loads(message))
+            else:
+                yield (None, None)
+
+    def wait_until_ready(self):
+        seen = set()
+        for attempt in range(100):
+            self.send('state')
+            for (sender, state) in self.receive_states(0.2):
+                seen.add(sender)
+            if {'playback', 'ripping'} <= seen:
+                return
+            self.check_daemons()
+        raise BenchmarkError('daemons did not come up, see logs in %s' % self.work_path)
+
+    def check_daemons(self):
+        for script, process in self.processes.items():
+            if process.poll() is not None:
+                raise BenchmarkError('%s exited, see logs in %s' % (script, self.work_path))
+
+    def run(self):
+        self.stand_in.start()
+        self.start_daemons()
+        try:
+            self.wait_until_ready()
+            return self.measure()
+        finally:
+            self.stop_daemons()
+            self.stand_in.stop()
+
+    def measure(self):
+        results = {}
+        inserted = time.monotonic()
+        self.send('disc')
+
+        play_sent = None
+        player_state = None
+        rip_started = None
+        for (sender, state) in self.receive_states(self.options.timeout):
+            now = time.monotonic()
+
+            if sender is None and play_sent and 'insert_to_first_audio' not in results:
+                # Commander drops PLAY until it has seen the player stop, which
+                # may be after we did: keep asking
+                if player_state == PlayerStates.STOPPED and now - play_sent > 0.5:
+                    self.send('play')
+                    play_sent = now
+                # playback only publishes on state changes, ask for the position
+                # until the first frame has been played
+                self.send('state')
+
+            elif sender == 'playback':
+                player_state = PlayerStates(state['state'])
+                if player_state == PlayerStates.STOPPED and not play_sent:
+                    results['insert_to_ready'] = now - inserted
+                    self.send('play')
+                    play_sent = now
+                elif player_state == PlayerStates.PLAYING and state['current_frame'] and 'insert_to_first_audio' not in results:
+                    results['insert_to_first_audio'] = now - inserted
+
+            elif sender == 'ripping':
+                ripper_state = RipperStates(state['state'])
+                if ripper_state == RipperStates.RIPPING and rip_started is None:
+                    rip_started = now
+                elif ripper_state == RipperStates.DONE and 'rip_seconds' not in results:
+                    results['rip_seconds'] = now - rip_started
+
+            if 'rip_seconds' in results and 'insert_to_first_audio' in results:
+                break
+
+            self.check_daemons()
+        else:
+            raise BenchmarkError('disc was not ripped and played in %ss, see logs in %s' % (
+                self.options.timeout, self.work_path))
+
+        audio_seconds = sum(self.disc.track_bytes(n) for n in range(1, self.disc.track_count + 1)) / BYTES_PER_SECOND
+        results['audio_seconds'] = audio_seconds
+        results['rip_speed'] = audio_seconds / results['rip_seconds']
+        results['cpu_seconds'] = {script: cpu_seconds(process.pid) for script, process in self.processes.items()}
+
+        self.send('stop')
+        results.update(self.measure_library_playback())
+        return results
+
+    def measure_library_playback(self):
+        track_db = TrackDBClient()
+        try:
+            deadline = time.monotonic() + self.options.timeout
+            while not track_db.has_disc(self.disc.disc_id):
+                if time.monotonic() > deadline:
+                    raise BenchmarkError('ripped disc was not indexed, see logs in %s' % self.work_path)
+                time.sleep(0.1)
+        finally:
+            track_db.close()
+
+        requested = time.monotonic()
+        self.send('play_album', self.disc.disc_id)
+        for (sender, state) in self.receive_states(self.options.timeout):
+            if sender is None:
+                self.send('state')
+            elif sender == 'playback' and state['source'] == PlayerSources.LIBRARY and state['current_frame']:
+                self.send('stop')
+                return {'library_to_first_audio': time.monotonic() - requested}
+            self.check_daemons()
+
+        raise BenchmarkError('album was not played from the library, see logs in %s' % self.work_path)
+
+
+def cpu_seconds(pid):
+    """User and system CPU time of a process, from /proc."""
+    fields = Path('/proc/%d/stat' % pid).read_text().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--disc', default=str(REPO_PATH.joinpath('tests', 'data', 'musicbrainz', 'cd_08')),
+                        help='MusicBrainz response or cdrdao TOC from tests/data describing the disc')
+    parser.add_argument('--disc-meta', default=str(REPO_PATH.joinpath('tests', 'data', 'musicbrainz', 'cd_08')),
+                        help='MusicBrainz response served for the disc, empty for an unknown disc')
+    parser.add_argument('--scale', type=float, default=0.05, help='factor applied to track lengths')
+    parser.add_argument('--read-speed', type=float, default=20, help='drive speed as a multiple of real time')
+    parser.add_argument('--error-rate', type=float, default=0, help='read errors per second of audio')
+    parser.add_argument('--timeout', type=float, default=300)
+    options = parser.parse_args()
+
+    results = Benchmark(options).run()
+
+    print('insert to ready:        %6.2f s' % results['insert_to_ready'])
+    print('insert to first audio:  %6.2f s' % results['insert_to_first_audio'])
+    print('library to first audio: %6.2f s' % results['library_to_first_audio'])
+    print('rip:                    %6.2f s for %.0f s of audio (%.1fx real time)' % (
+        results['rip_seconds'], results['audio_seconds'], results['rip_speed']))
+    for script, seconds in results['cpu_seconds'].items():
+        print('cpu %-20s%6.2f s' % (script.replace('start_', '').replace('.py', ':'), seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark of library browse and search on a synthetic library:
+
+    python -m benchmarks.library_index [--albums 10000] [--tracks 10]
+
+Builds the LibraryIndex the track DB keeps in memory, then times pages of
+album and artist lists and searches for common and rare words, prefixes
+as typed and several words at once. Names are drawn from a fixed
+vocabulary with a Zipf-like distribution, so a few words are on most
+albums, as 'the' and 'love' are in a real library.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from hifi_appliance.config import LIBRARY_PAGE_SIZE
+from hifi_appliance.db import LibraryIndex
+from hifi_appliance.db import ORDER_TITLE
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'be', 'do', 'fa', 'gu', 'ja', 'po', 'zé', 'ström']
+
+
+def generate_albums(albums, tracks, seed=0):
+    rng = random.Random(seed)
+    words = sorted({
+        ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(20000)
+    })
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    artists = [' '.join(rng.choices(words, weights, k=rng.randint(1, 3))).title() for _ in range(albums // 5)]
+
+    def name():
+        return ' '.join(rng.choices(words, weights, k=rng.randint(1, 5))).capitalize()
+
+    generated = []
+    for number in range(albums):
+        artist = rng.choice(artists)
+        generated.append({
+            'disc_id': 'disc-%08d' % number,
+            'artist': artist,
+            'title': name(),
+            'track_count': tracks,
+            'duration': None,
+            'tracks': [(artist, name()) for _ in range(tracks)],
+        })
+    return (generated, words)
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - started, result)
+
+
+def report(label, durations, totals=None):
+    line = '%-28s median %7.3f ms, max %7.3f ms' % (
+        label, statistics.median(durations) * 1000, max(durations) * 1000
+    )
+    if totals:
+        line += ', %d results on average' % statistics.mean(totals)
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--albums', type=int, default=10000)
+    parser.add_argument('--tracks', type=int, default=10, help='tracks per album')
+    parser.add_argument('--queries', type=int, default=200, help='queries of each kind')
+    options = parser.parse_args()
+
+    (albums, words) = generate_albums(options.albums, options.tracks)
+    (duration, library) = timed(LibraryIndex, albums)
+    print('built index of %d albums, %d tracks in %.2f s' % (
+        len(library), options.albums * options.tracks, duration
+    ))
+
+    rng = random.Random(1)
+    pages = max(1, options.albums // LIBRARY_PAGE_SIZE)
+
+    def run(label, func, make_args):
+        durations = []
+        totals = []
+        for _ in range(options.queries):
+            (duration, page) = timed(func, *make_args())
+            durations.append(duration)
+            totals.append(page['total'])
+        report(label, durations, totals if func == library.search else None)
+
+    def page_args():
+        return (rng.randrange(pages) * LIBRARY_PAGE_SIZE, LIBRARY_PAGE_SIZE)
+
+    run('albums by artist', library.albums, page_args)
+    run('albums by title', lambda offset, limit: library.albums(offset, limit, ORDER_TITLE), page_args)
+    run('artists', library.artists, page_args)
+
+    common = words[:20]
+    run('search common word', library.search, lambda: (rng.choice(common), 0, LIBRARY_PAGE_SIZE))
+    run('search rare word', library.search, lambda: (rng.choice(words), 0, LIBRARY_PAGE_SIZE))
+    run('search 1-letter prefix', library.search, lambda: (rng.choice(SYLLABLES)[0], 0, LIBRARY_PAGE_SIZE))
+    run('search 3-letter prefix', library.search, lambda: (rng.choice(words)[:3], 0, LIBRARY_PAGE_SIZE))
+    run('search two words', library.search, lambda: (
+        '%s %s' % (rng.choice(common), rng.choice(words)[:4]), 0, LIBRARY_PAGE_SIZE
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of library indexing on a generated tree of albums:
+
+    python -m benchmarks.library_scan [--albums 50000] [--latency 0.002]
+
+Builds the track database from scratch, then times a full rebuild and an
+incremental scan of the unchanged library, once with a single scanner
+thread and once with DB_SCAN_WORKERS. With --latency every stat, directory
+listing and file open sleeps first, as on a NAS mounted over NFS or SMB.
+"""
+import argparse
+import builtins
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+REPO_PATH = Path(__file__).resolve().parent.parent
+SIM_PATH = REPO_PATH.joinpath('tests', 'sim')
+
+sys.path.insert(0, str(SIM_PATH.joinpath('pylib')))
+
+from hifi_appliance.config import DB_SCAN_WORKERS
+from hifi_appliance.db import TrackDB
+from tests.sim.drive import write_flac
+
+
+def generate_library(music_path, albums, tracks):
+    """Artist/Album folders of empty FLAC files, ten albums per artist."""
+    for album in range(albums):
+        folder = music_path.joinpath('Artist %05d' % (album // 10), 'Album %05d' % album)
+        folder.mkdir(parents=True)
+        folder.joinpath('.disc_id').write_text('disc-%08d' % album)
+        for track in range(1, tracks + 1):
+            write_flac(str(folder.joinpath('%02d Track %d.flac' % (track, track))), b'')
+
+
+@contextmanager
+def injected_latency(latency):
+    """Makes every stat, listing and open by Python code wait `latency` seconds first."""
+    if not latency:
+        yield
+        return
+
+    def delayed(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(latency)
+            return func(*args, **kwargs)
+        return wrapper
+
+    with patch('os.stat', delayed(os.stat)), \
+            patch('os.scandir', delayed(os.scandir)), \
+            patch('os.listdir', delayed(os.listdir)), \
+            patch('builtins.open', delayed(builtins.open)):
+        yield
+
+
+def measure(work_path, music_path, workers, latency):
+    db_path = work_path.joinpath('tracks-%d-%s.db' % (workers, latency))
+    results = {}
+
+    with patch('hifi_appliance.db.db.DB_FILE_PATH', str(db_path)), \
+            patch('hifi_appliance.db.db.MUSIC_PATH_NAME', str(music_path)), \
+            patch('hifi_appliance.db.db.DB_SCAN_WORKERS', workers), \
+            injected_latency(latency):
+        db = TrackDB()
+        started = time.monotonic()
+        db.rebuild()
+        results['build'] = time.monotonic() - started
+
+        started = time.monotonic()
+        db.rebuild()
+        results['rebuild'] = time.monotonic() - started
+
+        started = time.monotonic()
+        db.scan()
+        results['scan'] = time.monotonic() - started
+
+        results['discs'] = db.count()
+        db.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--albums', type=int, default=50000)
+    parser.add_argument('--tracks', type=int, default=10, help='tracks per album')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds added to every file system call')
+    parser.add_argument('--library', help='existing tree to index instead of generating one')
+    options = parser.parse_args()
+
+    work_path = Path(tempfile.mkdtemp(prefix='cdp-sa-scan-'))
+
+    try:
+        if options.library:
+            music_path = Path(options.library)
+        else:
+            music_path = work_path.joinpath('music')
+            started = time.monotonic()
+            generate_library(music_path, options.albums, options.tracks)
+            print('generated %d albums in %.1f s' % (options.albums, time.monotonic() - started))
+
+        for latency in sorted({0, options.latency}):
+            for workers in sorted({1, DB_SCAN_WORKERS}):
+                results = measure(work_path, music_path, workers, latency)
+                print('latency %4.1f ms, %2d workers: build %7.2f s, rebuild %7.2f s, scan %6.2f s (%d discs)' % (
+                    latency * 1000, workers, results['build'], results['rebuild'], results['scan'], results['discs']
+                ))
+    finally:
+        shutil.rmtree(str(work_path))
+
+
+if __name__ == '__main__':
+    main()
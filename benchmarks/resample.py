@@ -0,0 +1,46 @@
+"""
+Throughput of the resampler used for tracks not at the device rate:
+
+    python -m benchmarks.resample [--seconds 60] [--source-rate 96000] [--target-rate 44100]
+
+Resamples noise at each quality setting the way the audio sink does, a
+whole track in blocks quantized to 32 bit, and reports how many times
+faster than real time that is. A track has to be resampled before it's
+played, so this is the delay the first play of a track adds when it isn't
+cached yet.
+"""
+import argparse
+import time
+
+import numpy
+
+from hifi_appliance.audio import PolyphaseResampler
+from hifi_appliance.audio.resample import QUALITIES
+from hifi_appliance.constants import CHANNELS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--seconds', type=int, default=60, help='seconds of audio to resample')
+    parser.add_argument('--source-rate', type=int, default=96000, help='sample rate of the track')
+    parser.add_argument('--target-rate', type=int, default=44100, help='sample rate of the device')
+    options = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    samples = rng.integers(-2 ** 30, 2 ** 30, size=(options.seconds * options.source_rate, CHANNELS), dtype='<i4')
+
+    for quality in QUALITIES:
+        resampler = PolyphaseResampler(options.source_rate, options.target_rate, quality)
+        started = time.process_time()
+        for block in resampler.blocks(samples):
+            numpy.clip(numpy.rint(block), -2 ** 31, 2 ** 31 - 1).astype('<i4').tobytes()
+        elapsed = time.process_time() - started
+
+        print('%-6s %d -> %d Hz, %d taps: %.0f s of audio in %.2f s CPU, %.0fx real time' % (
+            quality, options.source_rate, options.target_rate, resampler.taps,
+            options.seconds, elapsed, options.seconds / elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
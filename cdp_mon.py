@@ -22,6 +22,7 @@ class MessageMonitor(CdpDaemon):
             name='monitor',
             io_loop=self.io_loop,
             callbacks={
+                'commander': None,
                 'playback': None,
                 'ripping': None
             },
@@ -1,3 +1,7 @@
 import sys
 
-from .miniaudio import MiniaudioSink
\ No newline at end of file
+from .miniaudio import MiniaudioSink
+from .readahead import ReadAheadCache
+from .resample import PolyphaseResampler
+from .resample import ResampleCache
+from .transitions import TransitionEngine
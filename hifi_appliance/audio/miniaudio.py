@@ -1,21 +1,120 @@
+from collections import deque
+from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor
+import functools
 import io
 import logging
 import subprocess
 import threading
 
 import miniaudio
+import mutagen
+import numpy
 from ringbuf import RingBuffer
 
+from ..config import AUDIO_BACKENDS
+from ..config import AUDIO_OUTPUT_RATES
+from ..config import AUDIO_PASSTHROUGH
+from ..config import CROSSFADE_SECONDS
+from ..config import RESAMPLE_QUALITY
+from ..config import SILENCE_THRESHOLD_DB
+from ..config import TRANSITION
+from ..config import TRANSITION_BETWEEN_ALBUMS
 from ..constants import BUFFER_SIZE
 from ..constants import CHANNELS
 from ..constants import SAMPLE_RATE
 from ..constants import SAMPLE_WIDTH
+from .resample import PolyphaseResampler
+from .transitions import TransitionEngine
 
 
 logger = logging.getLogger(__name__)
 
 
+TrackFormat = namedtuple('TrackFormat', ['sample_rate', 'bits_per_sample', 'audio_md5'])
+
+CD_FORMAT = TrackFormat(SAMPLE_RATE, SAMPLE_WIDTH * 8, None)
+
+_SAMPLE_FORMATS = {
+    SAMPLE_WIDTH: miniaudio.SampleFormat.SIGNED16,
+    4: miniaudio.SampleFormat.SIGNED32,
+}
+
+
+def probe_track(track_file_name):
+    """The `TrackFormat` of a track, CD audio when it can't be read."""
+    try:
+        info = mutagen.File(track_file_name).info
+    except (mutagen.MutagenError, AttributeError):
+        logger.warning('Could not read the audio format of %s, assuming CD audio', track_file_name)
+        return CD_FORMAT
+
+    return TrackFormat(
+        info.sample_rate,
+        getattr(info, 'bits_per_sample', None) or CD_FORMAT.bits_per_sample,
+        getattr(info, 'md5_signature', None) or None
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def device_capabilities():
+    """
+    (sample rates, sample formats) the playback device takes natively, None
+    where it takes anything. Asked once, a device plugged in later is seen
+    after a restart.
+    """
+    rates = None if AUDIO_OUTPUT_RATES == 'auto' else set(AUDIO_OUTPUT_RATES)
+    try:
+        playbacks = miniaudio.Devices([getattr(miniaudio.Backend, backend.upper()) for backend in AUDIO_BACKENDS]).get_playbacks()
+    except miniaudio.MiniaudioError:
+        logger.exception('Could not query the playback device')
+        return (rates, None)
+    if not playbacks or not playbacks[0].get('formats'):
+        return (rates, None)
+
+    native = playbacks[0]['formats']
+    if rates is None and all(native_format['samplerate'] for native_format in native):
+        rates = {native_format['samplerate'] for native_format in native}
+
+    formats = None
+    if all(native_format['format'] != 'Unknown' for native_format in native):
+        names = {_format_name(sample_format): sample_format for sample_format in miniaudio.SampleFormat}
+        formats = {names.get(native_format['format']) for native_format in native}
+
+    return (rates, formats)
+
+
+def _format_name(sample_format):
+    return miniaudio.ffi.string(miniaudio.lib.ma_get_format_name(sample_format.value)).decode()
+
+
+def negotiate_output(track_format, device_rates=None, device_formats=None):
+    """
+    (sample rate, sample width) to open the device with for a stream that
+    starts with a track of `track_format`. The track's own rate when the
+    device takes it, else the device rate that's the simplest to convert
+    to: a multiple or fraction of it, then the highest below it. 32 bit
+    samples for tracks with more than 16 bits when the device takes them.
+    """
+    if not AUDIO_PASSTHROUGH:
+        return (SAMPLE_RATE, SAMPLE_WIDTH)
+
+    rate = track_format.sample_rate
+    if device_rates and rate not in device_rates:
+        rate = min(
+            device_rates,
+            key=lambda device_rate: (
+                max(device_rate, rate) % min(device_rate, rate) != 0,
+                device_rate > rate,
+                abs(device_rate - rate)
+            )
+        )
+
+    if track_format.bits_per_sample > 16 and (device_formats is None or _SAMPLE_FORMATS[4] in device_formats):
+        return (rate, 4)
+    return (rate, SAMPLE_WIDTH)
+
+
 class MiniaudioSink(object):
     """
     Audio device interface. Internally uses a stream from which frames are read
@@ -26,15 +125,25 @@ class MiniaudioSink(object):
     a healthy headroom gapless playback is achieved with no special effort.
 
     `ffmpeg` is invoked to perform conversion to PCM. Tracks are loaded at once into
-    memory.
+    memory. How one track leads into the next, gapless or crossfaded for
+    example, is up to the `TransitionEngine`.
+
+    The device is opened when the first track is buffered, at that track's
+    sample rate and bit depth if the device takes them: the samples reach
+    it untouched. Later tracks in another rate are resampled to the rate
+    the device was opened at, through `resample_cache` when there is one.
+    Frame counts in and out are in CD frames (44.1 kHz) whatever the
+    device rate, that's what the player counts in.
     """
     def __init__(
         self,
         playback_stopped_callback = lambda: print('playback stopped'),
-        frames_played_callback = lambda: print(".", end="", flush=True)
+        frames_played_callback = lambda: print(".", end="", flush=True),
+        resample_cache = None
     ):
         self.playback_stopped_callback = playback_stopped_callback
         self.frames_played_callback = frames_played_callback
+        self.resample_cache = resample_cache
 
         # the audio stops and should be started
         # from scratch as soon as this lock is released
@@ -44,10 +153,35 @@ class MiniaudioSink(object):
         self.playing = threading.Event()
         self.pause()
 
-        self.stream = RingBuffer(format='B', capacity=BUFFER_SIZE)
+        # set once the device is opened, see `_open()`
+        self.output_rate = None
+        self.sample_width = None
+        self.stream = None
+        self.transitions = None
+        self.thread = None
+
+        # track data that didn't fit into the stream yet
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+        self.transitions_lock = threading.Lock()
 
+        self.device_frames_played = 0
+        self.frames_reported = 0
         self.frames_callback_executor = ThreadPoolExecutor(max_workers=1)
 
+    @property
+    def frame_size(self):
+        return CHANNELS * self.sample_width
+
+    def _open(self, output_rate, sample_width):
+        logger.info('Opening audio device at %d Hz, %d bit', output_rate, sample_width * 8)
+        self.output_rate = output_rate
+        self.sample_width = sample_width
+        self.stream = RingBuffer(format='B', capacity=BUFFER_SIZE // self.frame_size * self.frame_size)
+        self.transitions = TransitionEngine(
+            output_rate, sample_width, TRANSITION, TRANSITION_BETWEEN_ALBUMS, CROSSFADE_SECONDS, SILENCE_THRESHOLD_DB
+        )
+
         self.thread = threading.Thread(
             target=self._start_device,
             name='audio device'
@@ -57,10 +191,10 @@ class MiniaudioSink(object):
 
     def _start_device(self):
         with miniaudio.PlaybackDevice(
-            output_format=miniaudio.SampleFormat.SIGNED16,
-            backends=[miniaudio.Backend.PULSEAUDIO],
+            output_format=_SAMPLE_FORMATS[self.sample_width],
+            backends=[getattr(miniaudio.Backend, backend.upper()) for backend in AUDIO_BACKENDS],
             nchannels=CHANNELS,
-            sample_rate=SAMPLE_RATE) as device:
+            sample_rate=self.output_rate) as device:
 
             generator = self._read_frames()
             next(generator)
@@ -71,36 +205,124 @@ class MiniaudioSink(object):
         required_frames = yield b''
         while True:
             self.playing.wait()
-            required_bytes = required_frames * CHANNELS * SAMPLE_WIDTH
+            required_bytes = required_frames * self.frame_size
+            if self.stream.read_available < required_bytes and not self.pending:
+                self._release_held_data()
             sample_data = self.stream.pop(required_bytes)
 
             if not sample_data:
                 self.playback_stopped_callback()
                 break
 
-            self._on_frames_played(required_frames)
+            if self.pending:
+                self._fill()
+            self._on_frames_played(len(sample_data) // self.frame_size)
             required_frames = yield sample_data
 
     def _on_frames_played(self, frames):
-        self.frames_callback_executor.submit(self.frames_played_callback, frames)
+        self.device_frames_played += frames
+        frames_played = self.to_cd_frames(self.device_frames_played)
+        if frames_played > self.frames_reported:
+            self.frames_callback_executor.submit(self.frames_played_callback, frames_played - self.frames_reported)
+            self.frames_reported = frames_played
+
+    def to_cd_frames(self, device_frames):
+        return device_frames * SAMPLE_RATE // self.output_rate
+
+    def buffer_track(self, track_file_name, start_frame=0, album_changed=False):
+        """
+        Appends the track from `start_frame` on. ffmpeg seeks in the input
+        through the FLAC seek table and only decodes from the seek point
+        before `start_frame`, not from the start of the track.
+        `album_changed` when it's the first track of another album than
+        the one before.
+        """
+        logger.debug('Loading track %s into buffer from frame %s', track_file_name, start_frame)
+
+        track_format = probe_track(track_file_name)
+        if self.stream is None:
+            self._open(*negotiate_output(track_format, *device_capabilities()))
 
-    def buffer_track(self, track_file_name):
-        logger.debug('Loading track %s into buffer', track_file_name)
+        if track_format.sample_rate == self.output_rate:
+            pcm_data = self._decode(track_file_name, start_frame, self.sample_width)
+        else:
+            pcm_data = self._resample(track_file_name, track_format, start_frame)
 
-        pcm_data = subprocess.run(
+        with self.transitions_lock:
+            (chunks, frames) = self.transitions.append(pcm_data, album_changed)
+        with self.pending_lock:
+            self.pending.extend(chunks)
+        self._fill()
+        return self.to_cd_frames(frames)
+
+    def _release_held_data(self):
+        """
+        Called from the device when the stream runs low: with no next track
+        buffered in time the end of the last one is played as it is.
+        """
+        if self.transitions_lock.acquire(blocking=False):
+            try:
+                held = self.transitions.flush()
+            finally:
+                self.transitions_lock.release()
+            if held:
+                with self.pending_lock:
+                    self.pending.append(held)
+                self._fill()
+
+    def _fill(self):
+        """Moves pending track data into the stream as far as it fits."""
+        with self.pending_lock:
+            while self.pending:
+                remaining = self.stream.push(self.pending[0])
+                if remaining is None:
+                    self.pending.popleft()
+                else:
+                    self.pending[0] = memoryview(remaining)
+                    break
+
+    def _decode(self, track_file_name, start_frame, sample_width):
+        seek_args = ["-ss", "%.6f" % (start_frame / SAMPLE_RATE)] if start_frame else []
+        pcm_format = 's16le' if sample_width == SAMPLE_WIDTH else 's32le'
+        return subprocess.run(
             [
                 "ffmpeg", "-v", "fatal", "-hide_banner", "-nostdin",
-                "-i", track_file_name, "-f", "s16le", "-acodec", "pcm_s16le",
-                "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-"
+            ] + seek_args + [
+                "-i", track_file_name, "-f", pcm_format, "-acodec", "pcm_" + pcm_format,
+                "-ac", str(CHANNELS), "-"
             ],
             capture_output=True
         ).stdout
 
-        self.stream.push(pcm_data)
-        return self.get_frame_count(pcm_data)
+    def _resample(self, track_file_name, track_format, start_frame):
+        """
+        The track resampled to the device rate. Whole tracks are cached and
+        seeks into them sliced from the cached copy, a seek into a track
+        that isn't cached only resamples what's played.
+        """
+        key = None
+        if self.resample_cache:
+            key = self.resample_cache.key(
+                track_file_name, track_format.audio_md5, self.output_rate, self.sample_width, RESAMPLE_QUALITY
+            )
+            pcm_data = self.resample_cache.get(key)
+            if pcm_data is not None:
+                logger.debug('Resampled %s from the cache', track_file_name)
+                return pcm_data[start_frame * self.output_rate // SAMPLE_RATE * self.frame_size:]
+
+        logger.info('Resampling %s from %d Hz to %d Hz', track_file_name, track_format.sample_rate, self.output_rate)
+        decoded = numpy.frombuffer(self._decode(track_file_name, start_frame, 4), dtype='<i4')
+        samples = decoded[:len(decoded) // CHANNELS * CHANNELS].reshape(-1, CHANNELS)
+
+        resampler = PolyphaseResampler(track_format.sample_rate, self.output_rate, RESAMPLE_QUALITY)
+        pcm_data = io.BytesIO()
+        for block in resampler.blocks(samples):
+            pcm_data.write(_quantize(block, self.sample_width))
+        pcm_data = pcm_data.getvalue()
 
-    def get_frame_count(self, pcm_data):
-        return len(pcm_data) // (CHANNELS * SAMPLE_WIDTH)
+        if key and not start_frame:
+            self.resample_cache.put(key, pcm_data)
+        return pcm_data
 
     def pause(self):
         self.playing.clear()
@@ -114,3 +336,10 @@ class MiniaudioSink(object):
         cannot be used anymore.
         """
         self.running.release()
+
+
+def _quantize(samples, sample_width):
+    """Float samples scaled to 32 bit to little endian PCM of `sample_width`."""
+    if sample_width == SAMPLE_WIDTH:
+        return numpy.clip(numpy.rint(samples / 65536), -32768, 32767).astype('<i2').tobytes()
+    return numpy.clip(numpy.rint(samples), -2 ** 31, 2 ** 31 - 1).astype('<i4').tobytes()
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from collections import namedtuple
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+_CHUNK_SIZE = 256 * 1024
+
+# copies are named by the SHA-1 of the track's path, see `_copy()`
+_COPY_NAME = re.compile(r'[0-9a-f]{40}\.(flac|tmp)')
+
+_CacheEntry = namedtuple('_CacheEntry', ['local_path', 'size', 'mtime_ns'])
+
+
+class ReadAheadCache(object):
+    """
+    Local copies of the tracks about to be played, so that a slow or
+    briefly unavailable network mount doesn't stall playback or leave a
+    gap between tracks.
+
+    `prefetch()` is told which tracks come next, a background thread copies
+    them in that order into `path` (an SSD or tmpfs). Copies are throttled
+    to `rate` bytes per second and held back entirely while playback reads
+    a track that isn't cached, see `playback_read()`. The cache holds at
+    most `max_bytes`, the least recently used tracks that aren't coming up
+    are evicted first.
+
+    A copy is checked before it's used: its digest is compared with the
+    one of the data read from the network once written, and the source
+    must not have changed while it was copied. `local_path()` only hands
+    out copies whose size and mtime are still the ones checked.
+    """
+    def __init__(self, path, max_bytes, rate):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.rate = rate
+
+        # copies don't survive restarts, their digests aren't kept; other
+        # files in the directory aren't ours to delete
+        self.path.mkdir(parents=True, exist_ok=True)
+        for entry in os.scandir(str(self.path)):
+            if entry.is_file(follow_symlinks=False) and _COPY_NAME.fullmatch(entry.name):
+                os.unlink(entry.path)
+
+        self._condition = threading.Condition()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._upcoming = []
+        self._pending = []
+        self._playback_reads = 0
+        self._stopped = False
+
+        self.thread = threading.Thread(target=self._copy_loop, name='read-ahead')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self.thread.join()
+
+    def prefetch(self, track_files):
+        """Tracks to have copied, in the order they'll be played."""
+        track_files = list(track_files)
+        with self._condition:
+            if track_files == self._upcoming:
+                return
+            self._upcoming = track_files
+            self._pending = [track_file for track_file in track_files if track_file not in self._entries]
+            self._condition.notify_all()
+
+    def local_path(self, track_file):
+        """The checked local copy of `track_file`, else `track_file` itself."""
+        with self._condition:
+            entry = self._entries.get(track_file)
+            if entry is None:
+                return track_file
+            self._entries.move_to_end(track_file)
+
+        try:
+            stat = os.stat(entry.local_path)
+            if (stat.st_size, stat.st_mtime_ns) == (entry.size, entry.mtime_ns):
+                return entry.local_path
+        except OSError:
+            pass
+
+        logger.warning('Cached copy of %s changed, reading the original', track_file)
+        with self._condition:
+            self._evict(track_file)
+        return track_file
+
+    def is_cached(self, track_file):
+        with self._condition:
+            return track_file in self._entries
+
+    @contextmanager
+    def playback_read(self):
+        """Holds back copying while playback reads from the network."""
+        with self._condition:
+            self._playback_reads += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._playback_reads -= 1
+                self._condition.notify_all()
+
+    #
+    # Copying
+
+    def _copy_loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped and not self._pending:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                track_file = self._pending.pop(0)
+                if track_file in self._entries:
+                    continue
+
+            try:
+                self._copy(track_file)
+            except OSError as e:
+                logger.warning('Could not copy %s ahead: %s', track_file, e)
+
+    def _copy(self, track_file):
+        source_stat = os.stat(track_file)
+        if not self._make_room(track_file, source_stat.st_size):
+            return
+
+        local_path = self.path.joinpath(hashlib.sha1(os.fsencode(track_file)).hexdigest() + '.flac')
+        tmp_path = local_path.with_suffix('.tmp')
+        digest = hashlib.blake2b()
+
+        started = time.monotonic()
+        copied = 0
+        try:
+            with open(track_file, 'rb') as source, tmp_path.open('wb') as destination:
+                while True:
+                    if not self._wait_for_turn():
+                        return
+                    chunk = source.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    destination.write(chunk)
+                    copied += len(chunk)
+                    self._throttle(started, copied)
+
+            if (source_stat.st_size, source_stat.st_mtime_ns) != _size_and_mtime(os.stat(track_file)):
+                logger.info('%s changed while copied ahead, not cached', track_file)
+                return
+            if copied != source_stat.st_size or _digest(tmp_path) != digest.digest():
+                logger.warning('Copy of %s is corrupt, not cached', track_file)
+                return
+
+            os.replace(str(tmp_path), str(local_path))
+            local_stat = os.stat(str(local_path))
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        with self._condition:
+            self._evict(track_file)
+            self._entries[track_file] = _CacheEntry(str(local_path), *_size_and_mtime(local_stat))
+            self._size += local_stat.st_size
+        logger.debug('Copied %s ahead', track_file)
+
+    def _make_room(self, track_file, size):
+        """Evicts tracks not coming up, False when that isn't enough."""
+        with self._condition:
+            upcoming = set(self._upcoming)
+            for cached_file in list(self._entries):
+                if self._size + size <= self.max_bytes:
+                    break
+                if cached_file not in upcoming:
+                    self._evict(cached_file)
+
+            if self._size + size > self.max_bytes:
+                logger.debug('Read-ahead cache full, not copying %s', track_file)
+                self._pending = []
+                return False
+        return True
+
+    def _evict(self, track_file):
+        entry = self._entries.pop(track_file, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        try:
+            os.unlink(entry.local_path)
+        except OSError:
+            pass
+
+    def _wait_for_turn(self):
+        """Waits out playback reads, False when stopped."""
+        with self._condition:
+            while not self._stopped and self._playback_reads:
+                self._condition.wait()
+            return not self._stopped
+
+    def _throttle(self, started, copied):
+        if not self.rate:
+            return
+        ahead = copied / self.rate - (time.monotonic() - started)
+        if ahead > 0:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopped, timeout=ahead)
+
+
+def _size_and_mtime(stat):
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _digest(path):
+    digest = hashlib.blake2b()
+    with open(str(path), 'rb') as local_file:
+        for chunk in iter(lambda: local_file.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.digest()
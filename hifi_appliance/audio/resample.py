@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import math
+import os
+from pathlib import Path
+import threading
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+logger = logging.getLogger(__name__)
+
+
+# taps per phase, passband edge as a fraction of the lower Nyquist frequency
+# and Kaiser window beta; taps are what the CPU time scales with
+QUALITIES = {
+    'low': (16, 0.85, 5.0),
+    'medium': (32, 0.91, 7.5),
+    'high': (64, 0.95, 10.0),
+}
+
+
+class PolyphaseResampler(object):
+    """
+    Converts audio between two sample rates by the rational factor between
+    them, 147/320 from 96 kHz to 44.1 kHz for example. The low-pass filter,
+    a Kaiser windowed sinc, is split into `up` phases of `taps` coefficients:
+    every output frame is one phase applied to the `taps` input frames
+    around it, whatever the ratio.
+
+    Output frames that use the same phase are evenly spaced and read evenly
+    spaced windows of the input, so each phase is a single matrix product
+    over a strided view of the input rather than a loop over samples.
+    Samples are (frames, channels) arrays.
+
+    A track is resampled whole, with its first and last frames repeated
+    past its edges. The result only depends on the track, which is what
+    lets it be cached.
+    """
+    def __init__(self, source_rate, target_rate, quality='medium'):
+        divisor = math.gcd(source_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = source_rate // divisor
+
+        (self.taps, passband, beta) = QUALITIES[quality]
+        self.filters = self._design(passband, beta)
+
+    def _design(self, passband, beta):
+        half = self.taps // 2
+        cutoff = 0.5 * passband * min(1.0, self.up / self.down)  # cycles per input frame
+
+        # input frame positions relative to the output frame, per phase
+        offsets = numpy.arange(1 - half, half + 1)[numpy.newaxis, :] - (numpy.arange(self.up) / self.up)[:, numpy.newaxis]
+        window = numpy.i0(beta * numpy.sqrt(numpy.clip(1 - (offsets / half) ** 2, 0, None))) / numpy.i0(beta)
+        filters = 2 * cutoff * numpy.sinc(2 * cutoff * offsets) * window
+
+        # every phase passes DC unchanged
+        return filters / filters.sum(axis=1, keepdims=True)
+
+    def output_frames(self, input_frames):
+        return -(-input_frames * self.up // self.down)
+
+    def process(self, samples):
+        """The resampled `samples` as float64."""
+        samples = numpy.asarray(samples)
+        blocks = list(self.blocks(samples))
+        return numpy.concatenate(blocks) if blocks else numpy.zeros((0,) + samples.shape[1:])
+
+    def blocks(self, samples, block_frames=65536):
+        """
+        The output in float64 blocks of about `block_frames`, so a whole
+        track never needs to be held in floating point at once.
+        """
+        input_frames = len(samples)
+        output_frames = self.output_frames(input_frames)
+        half = self.taps // 2
+        step = max(1, block_frames // self.up) * self.up  # a whole cycle of phases
+
+        for block_start in range(0, output_frames, step):
+            block_end = min(output_frames, block_start + step)
+
+            # the input frames the block's windows cover, edges repeated
+            first_input = block_start // self.up * self.down - (half - 1)
+            last_input = (block_end - 1) * self.down // self.up + half + 1
+            block = numpy.pad(
+                samples[max(first_input, 0):min(last_input, input_frames)],
+                ((max(-first_input, 0), max(last_input - input_frames, 0)), (0, 0)),
+                mode='edge'
+            )
+
+            # one row per channel keeps every window contiguous
+            windows = sliding_window_view(numpy.ascontiguousarray(block.T, dtype=numpy.float64), self.taps, axis=1)
+            output = numpy.empty((samples.shape[1], block_end - block_start))
+            for first in range(min(self.up, output.shape[1])):
+                (base, phase) = divmod(first * self.down, self.up)
+                count = len(range(first, output.shape[1], self.up))
+                output[:, first::self.up] = windows[:, base:base + (count - 1) * self.down + 1:self.down] @ self.filters[phase]
+
+            yield output.T
+
+
+class ResampleCache(object):
+    """
+    Resampled tracks as raw PCM files in `path`, so a track played again
+    at the same output format isn't resampled again. Files are named by
+    what they were made from: the audio MD5 of the FLAC stream info, or
+    path, size and mtime of files without one, plus output rate, sample
+    width and quality. Files are written in the background. The least
+    recently used go first once `max_bytes` are taken.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in os.scandir(str(self.path)) if entry.name.endswith('.pcm'))
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='resample cache')
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+
+    def key(self, track_file, audio_md5, rate, sample_width, quality):
+        if audio_md5:
+            source = 'md5:%032x' % audio_md5
+        else:
+            stat = os.stat(track_file)
+            source = '%s:%d:%d' % (os.path.abspath(track_file), stat.st_size, stat.st_mtime_ns)
+        return hashlib.sha1(('%s/%d/%d/%s' % (source, rate, sample_width, quality)).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        cached_path = self.path.joinpath(key + '.pcm')
+        try:
+            data = cached_path.read_bytes()
+            os.utime(str(cached_path))  # recently used
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        self._writer.submit(self._write, key, data)
+
+    def _write(self, key, data):
+        cached_path = self.path.joinpath(key + '.pcm')
+        tmp_path = cached_path.with_suffix('.tmp')
+        try:
+            with self._lock:
+                if cached_path.exists() or len(data) > self.max_bytes:
+                    return
+                self._make_room(len(data))
+                tmp_path.write_bytes(data)
+                os.replace(str(tmp_path), str(cached_path))
+                self._size += len(data)
+        except OSError:
+            logger.exception('Could not cache resampled track %s', key)
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _make_room(self, size):
+        if self._size + size <= self.max_bytes:
+            return
+
+        entries = sorted(
+            (entry for entry in os.scandir(str(self.path)) if entry.name.endswith('.pcm')),
+            key=lambda entry: entry.stat().st_mtime_ns
+        )
+        for entry in entries:
+            if self._size + size <= self.max_bytes:
+                break
+            entry_size = entry.stat().st_size
+            os.unlink(entry.path)
+            self._size -= entry_size
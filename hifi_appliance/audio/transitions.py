@@ -0,0 +1,144 @@
+import math
+
+import numpy
+
+from ..constants import CHANNELS
+
+
+TRANSITIONS = ('gapless', 'crossfade', 'trim')
+
+# the end of a track held back for the next one, and silence trimmed, at
+# most; the next track is buffered well before that much is left
+MAX_HELD_SECONDS = 10
+
+
+class TransitionEngine(object):
+    """
+    Joins the tracks of a stream. `append()` is given the PCM data of each
+    track as it's buffered and returns what goes into the stream for it.
+    The end of every track is held back until the next one comes, then the
+    two are joined with one of these:
+
+    - 'gapless': the next track follows as it is, no sample changed
+    - 'crossfade': the last `crossfade_seconds` of the track and the start
+      of the next one overlap, faded out and in along equal power curves
+    - 'trim': silence at the end of the track and at the start of the next
+      one is dropped, up to MAX_HELD_SECONDS of each
+
+    `within_album` is used between the tracks of an album, `between_albums`
+    before the first track of another one. All of the work is done when the
+    next track is buffered, well ahead of playing it. With no next track
+    coming `flush()` hands out the end held back, as it is.
+
+    The frame counts returned count an overlap, and silence dropped from
+    the end of a track, as part of that track.
+    """
+    def __init__(
+        self,
+        sample_rate,
+        sample_width,
+        within_album='gapless',
+        between_albums='gapless',
+        crossfade_seconds=4,
+        silence_threshold_db=-60
+    ):
+        for transition in (within_album, between_albums):
+            if transition not in TRANSITIONS:
+                raise ValueError('Unknown transition %r, expected one of %s' % (transition, ', '.join(TRANSITIONS)))
+
+        self.within_album = within_album
+        self.between_albums = between_albums
+        self.frame_size = CHANNELS * sample_width
+        self.dtype = '<i%d' % sample_width
+        self.max_held_frames = MAX_HELD_SECONDS * sample_rate
+
+        self.crossfade_frames = int(min(crossfade_seconds, MAX_HELD_SECONDS) * sample_rate)
+        self.fade_curves = _fade_curves(self.crossfade_frames)
+
+        full_scale = 2 ** (8 * sample_width - 1)
+        self.silence_threshold = int(full_scale * 10 ** (silence_threshold_db / 20))
+
+        self.tail = memoryview(b'')
+        self.has_tracks = False
+
+    def append(self, pcm_data, album_changed=False):
+        """
+        (chunks, frames): the bytes-like chunks to add to the stream for
+        the track in `pcm_data` and the frames that adds to the stream.
+        """
+        data = memoryview(pcm_data).cast('B')
+        data = data[:len(data) // self.frame_size * self.frame_size]
+        (tail, self.tail) = (self.tail, memoryview(b''))
+        transition = self.between_albums if album_changed else self.within_album
+
+        if transition == 'trim' and self.has_tracks:
+            # the tail is empty when the track before ended loud, the start
+            # of this one is trimmed all the same; not so for the first
+            # track of the stream, which may be a seek into the track
+            trailing = self._trailing_silence(tail) * self.frame_size
+            leading = self._leading_silence(data) * self.frame_size
+            chunks = [tail[:len(tail) - trailing], data[leading:]]
+        elif not tail or transition == 'gapless':
+            chunks = [tail, data]
+        else:
+            overlap = min(self.crossfade_frames * self.frame_size, len(tail), len(data))
+            chunks = [
+                tail[:len(tail) - overlap],
+                self._crossfade(tail[len(tail) - overlap:], data[:overlap]),
+                data[overlap:]
+            ]
+
+        # the end of the track waits for the next one
+        last = chunks.pop()
+        held = min(self._frames_to_hold(data) * self.frame_size, len(last))
+        chunks += [last[:len(last) - held]]
+        self.tail = last[len(last) - held:]
+        self.has_tracks = True
+
+        chunks = [chunk for chunk in chunks if len(chunk)]
+        frames = (sum(len(chunk) for chunk in chunks) + len(self.tail) - len(tail)) // self.frame_size
+        return (chunks, frames)
+
+    def flush(self):
+        """The end of the last track held back, to be played as it is."""
+        (tail, self.tail) = (self.tail, memoryview(b''))
+        return tail
+
+    def _samples(self, data):
+        return numpy.frombuffer(data, dtype=self.dtype).reshape(-1, CHANNELS)
+
+    def _frames_to_hold(self, data):
+        transitions = {self.within_album, self.between_albums}
+        held = 0
+        if 'crossfade' in transitions:
+            held = self.crossfade_frames
+        if 'trim' in transitions:
+            held = max(held, self._trailing_silence(data[-self.max_held_frames * self.frame_size:]))
+        return min(held, self.max_held_frames)
+
+    def _loud_frames(self, data):
+        samples = self._samples(data)
+        return numpy.flatnonzero(((samples > self.silence_threshold) | (samples < -self.silence_threshold)).any(axis=1))
+
+    def _leading_silence(self, data):
+        """Silent frames at the start, none when it's all silent."""
+        loud = self._loud_frames(data[:self.max_held_frames * self.frame_size])
+        return int(loud[0]) if len(loud) else 0
+
+    def _trailing_silence(self, data):
+        loud = self._loud_frames(data)
+        return len(data) // self.frame_size - (int(loud[-1]) + 1 if len(loud) else 0)
+
+    def _crossfade(self, fading_out, fading_in):
+        frames = len(fading_out) // self.frame_size
+        (fade_out, fade_in) = self.fade_curves if frames == self.crossfade_frames else _fade_curves(frames)
+
+        mixed = self._samples(fading_out) * fade_out + self._samples(fading_in) * fade_in
+        info = numpy.iinfo(self.dtype)
+        return numpy.clip(numpy.rint(mixed), info.min, info.max).astype(self.dtype).tobytes()
+
+
+def _fade_curves(frames):
+    """(fade out, fade in) gains per frame, their powers add up to one."""
+    angles = (numpy.arange(frames) + 0.5) / max(frames, 1) * (math.pi / 2)
+    return (numpy.cos(angles)[:, numpy.newaxis], numpy.sin(angles)[:, numpy.newaxis])
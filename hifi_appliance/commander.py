@@ -1,19 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 import os
+import subprocess
 import time
 
-from . import db as track_db
+from .config import CD_DEVICE
+from .config import DISC_LOOKUP_DEADLINE
+from .config import LIBRARY_PAGE_SIZE
+from .config import META_CACHE_MAX_ENTRIES
+from .config import META_CACHE_NEGATIVE_TTL
+from .config import META_CACHE_PATH
+from .config import META_CACHE_TTL
+from .config import OFFLINE_META_INDEX_PATH
 from .daemons import CdpDaemon
-from .disc import read_disc_id
-from .disc import read_disc_meta
+from .db import ORDER_ARTIST
+from .db import TrackDB
+from .disc import DiscSession
 from .message_bus import Receiver
 from .message_bus import Sender
 from .message_bus import command as channel_command
 from .message_bus import command_playback as channel_playback_command
 from .message_bus import command_ripping as channel_ripping_command
+from .message_bus import query_db as channel_query_db
 from .message_bus import state as channel_state
+from .meta import CachedMetaLookup
+from .meta import DiscMetaCache
 from .meta import LocalMeta
+from .meta import OfflineMeta
 from .meta import RemoteMeta
 from .playback import PlaybackCommand
 from .ripping import RippingCommand
@@ -24,25 +38,52 @@ from .state import RipperStates
 logger = logging.getLogger(__name__)
 
 
+# disc reads and meta look-ups of a couple of drives at once
+_LOOKUP_WORKERS = 4
+
+
 class CdpCommand(object):
     PLAY = 'play'
     STOP = 'stop'
     PAUSE = 'pause'
     NEXT = 'next'
     PREV = 'prev'
+    SEEK = 'seek'
+    SCAN_FORWARD = 'scan_forward'
+    SCAN_BACKWARD = 'scan_backward'
     EJECT = 'eject'
 
 
 class Commander(CdpDaemon):
     def __init__(self, daemon_config, debug=False):
-        self.db = track_db
+        # opened after forking, indexed once the daemon is up
+        self.db = None
 
         self.local_meta = LocalMeta()
-        self.remote_meta = RemoteMeta()
+        self.offline_meta = OfflineMeta(OFFLINE_META_INDEX_PATH)
+        self.remote_meta = CachedMetaLookup(
+            RemoteMeta(),
+            DiscMetaCache(META_CACHE_PATH, META_CACHE_TTL, META_CACHE_NEGATIVE_TTL, META_CACHE_MAX_ENTRIES)
+        )
 
         self.playback_state = None
         self.ripping_state = None
 
+        # one per drive with a disc in it, keeps what was read off the disc
+        self.disc_sessions = {}
+        self.disc_lookup_deadlines = {}
+        # meta the ripper was started with, per drive with a new disc
+        self.ripping_disc_meta = {}
+        # drives whose CD-TEXT is still being read, online meta that came
+        # first waits there for the pre-emphasis flags
+        self.reading_cd_text = set()
+        self.held_disc_meta = {}
+        # discs taken as new before the library was indexed, looked up again after
+        self.discs_identified_while_indexing = {}
+        self.lookup_executor = ThreadPoolExecutor(max_workers=_LOOKUP_WORKERS)
+        # one worker, so albums reach the play queue in the order requested
+        self.library_executor = ThreadPoolExecutor(max_workers=1)
+
         super(Commander, self).__init__(daemon_config, debug)
 
     def setup_postfork(self):
@@ -73,14 +114,35 @@ class Commander(CdpDaemon):
 
         self.command_receiver = self.setup_command_receiver(channel_command)
 
+        self.db = TrackDB()
+        self.query_receiver = self.setup_query_receiver(channel_query_db)
+
     def run(self):
         self.command_state(None)
+        self.io_loop.add_callback(self.start_indexing)
 
         # for i in range(15):
         #     self.io_loop.add_timeout(time.time() + i, self.send_current_state)
 
         self.io_loop.start()
 
+    def start_indexing(self):
+        self.db.start(on_indexed=lambda: self.io_loop.add_callback(self.on_indexed))
+        self.send_current_state()
+
+    def on_indexed(self):
+        logger.info('Library indexed, %s discs', self.db.count())
+        self.send_current_state()
+
+        (disc_sessions, self.discs_identified_while_indexing) = (self.discs_identified_while_indexing, {})
+        for disc_session in disc_sessions.values():
+            self.submit_lookup(disc_session, self.on_identified_after_indexing, self.find_known_disc, disc_session)
+
+    def send_current_state(self):
+        self.state_sender.send(json.dumps({
+            'db': 'indexing' if self.db.is_indexing() else 'ready'
+        }))
+
     #
     # Receive state updates
 
@@ -90,57 +152,244 @@ class Commander(CdpDaemon):
 
     def update_ripping_state(self, receiver, args):
         ripping_state = json.loads(args[1])
+        if ripping_state.get('device', CD_DEVICE) != CD_DEVICE:
+            return
         self.ripping_state = RipperStates(ripping_state['state'])
 
     #
     # Disc look-up
+    #
+    # Reading the drive and looking meta up online take seconds, so they run
+    # in lookup_executor and post their results back to the io_loop: eject
+    # and stop keep working meanwhile. Results for a disc that has since
+    # been ejected are dropped.
+
+    def submit_lookup(self, disc_session, callback, func, *args):
+        future = self.lookup_executor.submit(func, *args)
+        self.io_loop.add_future(
+            future,
+            lambda future: self.on_lookup_done(disc_session, callback, future)
+        )
+
+    def on_lookup_done(self, disc_session, callback, future):
+        if self.disc_sessions.get(disc_session.device) is not disc_session:
+            logger.debug('Disc in %s changed during look-up, dropping result', disc_session.device)
+            return
+
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception('Disc look-up failed')
+            result = None
+
+        callback(disc_session, result)
+
+    def identify_disc(self, disc_session):
+        """
+        Returns (known, track_list, disc_meta, indexed), None when the disc
+        can't be read. `indexed` is False when the library was still being
+        indexed, a disc not found may then be ripped already.
+        """
+        disc_id = disc_session.read_toc()
+        if not disc_id:
+            return None
+
+        # read before the DB is asked, a scan finishing in between has
+        # indexed the disc or not
+        indexed = not self.db.is_indexing()
+        return self.find_known_disc(disc_session) + (indexed,)
+
+    def find_known_disc(self, disc_session):
+        """Returns (known, track_list, disc_meta) for a disc whose TOC was read."""
+        disc_id = disc_session.disc_id
+        if self.db.has_disc(disc_id):
+            return (True,) + self.get_known_disc(disc_id)
+
+        # another pressing of an album already ripped needs no rip of its own
+        similar_disc_id = self.db.find_similar_disc(disc_session.track_durations())
+        if similar_disc_id:
+            logger.info('Disc %s matches %s by its TOC', disc_id, similar_disc_id)
+            return (True,) + self.get_known_disc(similar_disc_id)
+
+        return (False, [], None)
 
     def get_known_disc(self, disc_id):
-        logger.info('Disc already indexed: reading meta from file system')
-        track_list = self.db.get_track_list(disc_id)
-        disc_meta = self.local_meta.query(disc_id, track_list)
+        (track_list, disc_meta) = self.db.get_disc(disc_id)
+        if disc_meta is None:
+            logger.info('Disc already indexed without tags: reading meta from file system')
+            disc_meta = self.local_meta.query(disc_id, track_list)
         return (track_list, disc_meta)
 
-    def get_new_disc(self, disc_id):
-        logger.info('New disc: reading meta online or from the disc itself')
-        disc_meta = self.remote_meta.query(disc_id)
+    def get_remote_disc_meta(self, disc_session):
+        # the offline MusicBrainz index answers in milliseconds, and without
+        # a network connection
+        disc_meta = self.offline_meta.query(disc_session.disc_id)
         if not disc_meta:
-            disc_meta = read_disc_meta(disc_id)
-        return ([], disc_meta)
+            disc_meta = self.remote_meta.query(disc_session.disc_id, disc_session.track_durations())
+        if disc_meta:
+            disc_meta['toc'] = disc_session.toc
+        return disc_meta
 
-    #
-    # Control commands
+    def on_disc_identified(self, disc_session, identified):
+        is_playback_drive = disc_session.device == CD_DEVICE
 
-    def command_disc(self, args):
-        """Triggered by OS when new Audio CD inserted."""
+        if not identified:
+            if is_playback_drive:
+                self.playback_command.send(PlaybackCommand.UNKNOWN_DISC)
+            return
 
-        disc_id = read_disc_id()
+        (known, track_list, disc_meta, indexed) = identified
 
-        if not disc_id:
-            self.playback_command.send(PlaybackCommand.UNKNOWN_DISC)
+        if known:
+            logger.info('Disc in %s already indexed', disc_session.device)
+            if is_playback_drive:
+                if disc_meta:
+                    self.playback_command.send(PlaybackCommand.START, json.dumps(track_list), json.dumps(disc_meta))
+                else:
+                    self.playback_command.send(PlaybackCommand.UNKNOWN_DISC)
+            self.send_ripper_command(disc_session, RippingCommand.KNOWN_DISC)
             return
 
-        disc_query_func = self.get_known_disc if self.db.has_disc(disc_id) else self.get_new_disc
-        (track_list, disc_meta) = disc_query_func(disc_id)
+        # New disc: the TOC is enough to start playing. Ripping starts once
+        # CD-TEXT is read, which has the pre-emphasis flags; with MusicBrainz
+        # names if it answered by then, which replace CD-TEXT names if it
+        # answers later but before the deadline.
+        logger.info('New disc: reading meta online and from the disc itself')
+        if is_playback_drive:
+            self.playback_command.send(PlaybackCommand.START, json.dumps([]), json.dumps(disc_session.toc_meta()))
+
+        self.disc_lookup_deadlines[disc_session.device] = self.io_loop.add_timeout(
+            time.time() + DISC_LOOKUP_DEADLINE,
+            lambda: self.on_disc_lookup_deadline(disc_session)
+        )
+        self.reading_cd_text.add(disc_session.device)
+        self.submit_lookup(disc_session, self.on_remote_disc_meta, self.get_remote_disc_meta, disc_session)
+        self.submit_lookup(disc_session, self.on_local_disc_meta, disc_session.disc_meta)
+
+        # until the library is indexed, a disc that isn't in the DB yet may
+        # still be ripped already: it's looked up again once it is
+        if not indexed:
+            if self.db.is_indexing():
+                logger.info('Library still being indexed, disc in %s taken as new for now', disc_session.device)
+                self.discs_identified_while_indexing[disc_session.device] = disc_session
+            else:
+                self.submit_lookup(disc_session, self.on_identified_after_indexing, self.find_known_disc, disc_session)
+
+    def on_identified_after_indexing(self, disc_session, identified):
+        """A disc being ripped as new turned out to be in the library after all."""
+        is_new_disc = disc_session.device in self.disc_lookup_deadlines or disc_session.device in self.ripping_disc_meta
+        if not is_new_disc or not identified or not identified[0]:
+            return
+
+        logger.info('Disc in %s found in the library once indexed, stopping its rip', disc_session.device)
+        # drops what's still being looked up for it
+        self.cancel_disc_lookup(disc_session.device)
+
+        (_, track_list, disc_meta) = identified
+        if disc_session.device == CD_DEVICE:
+            self.playback_command.send(PlaybackCommand.EJECT)
+            if disc_meta:
+                self.playback_command.send(PlaybackCommand.START, json.dumps(track_list), json.dumps(disc_meta))
+            else:
+                self.playback_command.send(PlaybackCommand.UNKNOWN_DISC)
+        self.send_ripper_command(disc_session, RippingCommand.EJECT)
+        self.send_ripper_command(disc_session, RippingCommand.KNOWN_DISC)
+
+    def on_local_disc_meta(self, disc_session, disc_meta):
+        self.reading_cd_text.discard(disc_session.device)
+
+        held_disc_meta = self.held_disc_meta.pop(disc_session.device, None)
+        if held_disc_meta is not None:
+            # only pre-emphasis comes from the disc, a track ripped without
+            # its flag would not be de-emphasized
+            if disc_session.add_pre_emphasis(held_disc_meta):
+                logger.info('Disc in %s has emphasized tracks', disc_session.device)
+            self.send_disc_meta(disc_session, held_disc_meta)
+            return
+
+        self.send_disc_meta(disc_session, disc_meta or disc_session.toc_meta())
+
+    def on_remote_disc_meta(self, disc_session, disc_meta):
+        deadline = self.disc_lookup_deadlines.pop(disc_session.device, None)
+        if deadline is None:
+            logger.debug('Online meta for disc in %s arrived after the deadline', disc_session.device)
+            return
+        self.io_loop.remove_timeout(deadline)
 
         if not disc_meta:
-            self.playback_command.send(PlaybackCommand.UNKNOWN_DISC)
+            return
+        if disc_session.device in self.reading_cd_text:
+            logger.info('Disc in %s named online, ripping waits for CD-TEXT', disc_session.device)
+            self.held_disc_meta[disc_session.device] = disc_meta
             return
 
-        self.playback_command.send(
-            PlaybackCommand.START,
-            json.dumps(track_list),
-            json.dumps(disc_meta)
-        )
+        disc_session.add_pre_emphasis(disc_meta)
+        self.send_disc_meta(disc_session, disc_meta)
 
-        if self.db.has_disc(disc_id):
-            self.ripper_command.send(RippingCommand.KNOWN_DISC)
+    def on_disc_lookup_deadline(self, disc_session):
+        logger.warning('No online meta for disc in %s within %ss', disc_session.device, DISC_LOOKUP_DEADLINE)
+        self.disc_lookup_deadlines.pop(disc_session.device, None)
+
+    def send_disc_meta(self, disc_session, disc_meta):
+        """Names the disc: starts ripping with the first meta, updates it after."""
+        ripping_disc_meta = self.ripping_disc_meta.get(disc_session.device)
+        is_update = ripping_disc_meta is not None
+
+        if is_update and len(ripping_disc_meta['tracks']) != len(disc_meta['tracks']):
+            logger.warning('Online meta for disc in %s has a different track count, keeping CD-TEXT', disc_session.device)
+            return
+        self.ripping_disc_meta[disc_session.device] = disc_meta
+
+        if disc_session.device == CD_DEVICE:
+            self.playback_command.send(PlaybackCommand.DISC_META_UPDATE, json.dumps(disc_meta))
+
+        if is_update:
+            self.send_ripper_command(disc_session, RippingCommand.DISC_META_UPDATE, json.dumps(disc_meta))
         else:
-            self.ripper_command.send(RippingCommand.START, json.dumps(disc_meta))
+            self.send_ripper_command(disc_session, RippingCommand.START, json.dumps(disc_meta))
+
+    def send_ripper_command(self, disc_session, command, *args):
+        """Commands for bulk-ingest drives name the drive, CD_DEVICE is implied."""
+        if disc_session.device != CD_DEVICE:
+            args += (disc_session.device,)
+        self.ripper_command.send(command, *args)
+
+    def cancel_disc_lookup(self, device):
+        self.disc_sessions.pop(device, None)
+        self.ripping_disc_meta.pop(device, None)
+        self.discs_identified_while_indexing.pop(device, None)
+        self.reading_cd_text.discard(device)
+        self.held_disc_meta.pop(device, None)
+        deadline = self.disc_lookup_deadlines.pop(device, None)
+        if deadline is not None:
+            self.io_loop.remove_timeout(deadline)
+
+    #
+    # Control commands
+
+    def command_disc(self, args):
+        """Triggered by OS when new Audio CD inserted. The drive's device node
+        may be given as the only argument, CD_DEVICE is assumed otherwise.
+        Discs in bulk-ingest drives are only ripped, never played."""
+
+        device = args[0].decode('ascii') if args else CD_DEVICE
+        self.cancel_disc_lookup(device)
+
+        disc_session = DiscSession(device)
+        self.disc_sessions[device] = disc_session
+        self.submit_lookup(disc_session, self.on_disc_identified, self.identify_disc, disc_session)
 
     def command_eject(self, args):
+        device = args[0].decode('ascii') if args else CD_DEVICE
+        self.cancel_disc_lookup(device)
+
+        if device != CD_DEVICE:
+            self.ripper_command.send(RippingCommand.EJECT, device)
+            subprocess.call(['eject', device])
+            return
+
         self.playback_command.send(PlaybackCommand.EJECT)
-        self.ripper_command.send(PlaybackCommand.EJECT)
+        self.ripper_command.send(RippingCommand.EJECT)
         os.system('eject -T')
 
 
@@ -177,15 +426,101 @@ class Commander(CdpDaemon):
         else:
             logger.debug('Received PREV but player is in %s' % self.playback_state)
 
+    def command_seek(self, args):
+        if self.playback_state in (PlayerStates.PLAYING, PlayerStates.PAUSED):
+            self.playback_command.send(PlaybackCommand.SEEK, args[0].decode('ascii'))
+        else:
+            logger.debug('Received SEEK but player is in %s' % self.playback_state)
+
+    def command_scan_forward(self, args):
+        if self.playback_state in (PlayerStates.PLAYING, PlayerStates.PAUSED):
+            self.playback_command.send(PlaybackCommand.SCAN_FORWARD)
+        else:
+            logger.debug('Received SCAN_FORWARD but player is in %s' % self.playback_state)
+
+    def command_scan_backward(self, args):
+        if self.playback_state in (PlayerStates.PLAYING, PlayerStates.PAUSED):
+            self.playback_command.send(PlaybackCommand.SCAN_BACKWARD)
+        else:
+            logger.debug('Received SCAN_BACKWARD but player is in %s' % self.playback_state)
+
+    #
+    # Library playback
+
+    def command_play_album(self, args):
+        """Plays a ripped album by its disc ID, the drive isn't read."""
+        self.send_library_album(PlaybackCommand.PLAY_ALBUM, args[0].decode('ascii'))
+
+    def command_queue_album(self, args):
+        """Queues a ripped album to play after the current one."""
+        self.send_library_album(PlaybackCommand.QUEUE_ALBUM, args[0].decode('ascii'))
+
+    def command_queue_clear(self, args):
+        self.playback_command.send(PlaybackCommand.QUEUE_CLEAR)
+
+    def send_library_album(self, command, disc_id):
+        if not self.db.has_disc(disc_id):
+            logger.warning('Album %s is not in the library', disc_id)
+            return
+
+        future = self.library_executor.submit(self.get_known_disc, disc_id)
+        self.io_loop.add_future(future, lambda future: self.on_library_album(command, future))
+
+    def on_library_album(self, command, future):
+        try:
+            (track_list, disc_meta) = future.result()
+        except Exception:
+            logger.exception('Could not read album from the library')
+            return
+
+        self.playback_command.send(command, json.dumps(track_list), json.dumps(disc_meta))
+
+    #
+    # Track DB queries, for other daemons and clients
+
+    def query_has_disc(self, args):
+        return self.db.has_disc(args[0])
+
+    def query_track_list(self, args):
+        return self.db.get_track_list(args[0])
+
+    def query_albums(self, args):
+        """args: [offset, limit, order, artist], all optional"""
+        (offset, limit) = self.page_args(args)
+        order = args[2] if len(args) > 2 and args[2] else ORDER_ARTIST
+        artist = args[3] if len(args) > 3 and args[3] else None
+        return self.db.library.albums(offset, limit, order, artist)
+
+    def query_artists(self, args):
+        """args: [offset, limit], all optional"""
+        return self.db.library.artists(*self.page_args(args))
+
+    def query_search(self, args):
+        """args: [text, offset, limit]"""
+        return self.db.library.search(args[0], *self.page_args(args[1:]))
+
+    def page_args(self, args):
+        offset = int(args[0]) if len(args) > 0 and args[0] else 0
+        limit = int(args[1]) if len(args) > 1 and args[1] else LIBRARY_PAGE_SIZE
+        return (offset, limit)
+
+    def query_stat(self, args):
+        return {'discs': self.db.count(), 'indexing': self.db.is_indexing()}
+
+    def query_rebuild(self, args):
+        self.lookup_executor.submit(self.db.rebuild)
+        return True
+
     #
     # Debug commands
 
     def command_state(self, args):
+        self.send_current_state()
         self.playback_command.send(PlaybackCommand.STATE)
         self.ripper_command.send(RippingCommand.STATE)
 
     def command_db_rebuild(self, args):
-        self.db.rebuild()
+        self.lookup_executor.submit(self.db.rebuild)
 
     def command_db_stat(self, args):
-        print('%s discs indexed' % self.db.count())
+        print('%s discs indexed%s' % (self.db.count(), ', indexing' if self.db.is_indexing() else ''))
@@ -0,0 +1,19 @@
+AUDIO_BACKENDS = ['pulseaudio']  # miniaudio backend names, 'null' discards audio
+PLAY_QUEUE_PATH = '/var/lib/cdp-sa/play_queue'  # albums queued to play, kept across restarts
+READAHEAD = 'auto'  # copy upcoming tracks to READAHEAD_CACHE_PATH: True, False or 'auto' when MUSIC_PATH_NAME is a network mount
+READAHEAD_CACHE_PATH = '/var/cache/cdp-sa/readahead'  # local disk or tmpfs
+READAHEAD_CACHE_SIZE = 1024 * 1024 * 1024  # bytes
+READAHEAD_RATE = 4 * 1024 * 1024  # bytes per second read from MUSIC_PATH_NAME for copies
+SCAN_STEP_SECONDS = 5  # seek per fast forward or rewind command, repeated while the key is held
+RESUME_PLAYBACK = True  # a disc played before continues at the track and frame it was left at
+RESUME_POSITIONS_PATH = '/var/lib/cdp-sa/resume_positions'  # last position per disc ID
+RESUME_SAVE_INTERVAL = 10  # seconds between writes of the position while playing
+AUDIO_PASSTHROUGH = True  # open the device at the rate and bit depth of the file played when it takes them, else 44.1 kHz 16 bit
+AUDIO_OUTPUT_RATES = 'auto'  # sample rates the device plays natively, 'auto' asks the device
+RESAMPLE_QUALITY = 'medium'  # 'low', 'medium' or 'high' for 16, 32 or 64 filter taps per output sample
+RESAMPLE_CACHE_PATH = '/var/cache/cdp-sa/resampled'  # resampled tracks as raw PCM, None to not keep them
+RESAMPLE_CACHE_SIZE = 4 * 1024 * 1024 * 1024  # bytes
+TRANSITION = 'gapless'  # between the tracks of an album: 'gapless', 'crossfade' or 'trim' to drop the silence in between
+TRANSITION_BETWEEN_ALBUMS = 'gapless'  # between an album and the next one queued, same choices
+CROSSFADE_SECONDS = 4  # overlap of a 'crossfade' transition, up to 10
+SILENCE_THRESHOLD_DB = -60  # level below which 'trim' takes the end or start of a track as silence
@@ -1 +1,3 @@
-CD_DEVICE = '/dev/sr0'
\ No newline at end of file
+CD_DEVICE = '/dev/sr0'  # playback drive
+CD_DEVICES = []  # additional bulk-ingest drives, ripped in parallel
+CD_READ_OFFSET = 0  # drive read offset in samples, required for AccurateRip matches
@@ -1,2 +1,8 @@
 DB_FILE_PATH = '/tmp/example.db'
-DB_REBUILD_INTERVAL = 45 * 60
\ No newline at end of file
+DB_SCAN_INTERVAL = 10 * 60  # seconds between scans of directories whose mtime changed
+DB_SCAN_WORKERS = 8  # threads listing directories and reading albums, mostly waiting on network mounts
+DB_SCAN_BATCH_SIZE = 500  # directories written per transaction
+DB_REBUILD_INTERVAL = 24 * 60 * 60  # seconds between full walks that check every album
+DB_WATCH = True  # inotify on local file systems
+DB_WATCH_DELAY = 2  # seconds without file system events before changes are indexed
+LIBRARY_PAGE_SIZE = 50  # albums per page of browse and search results
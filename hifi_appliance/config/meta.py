@@ -0,0 +1,9 @@
+MUSICBRAINZ_HOST = 'musicbrainz.org'
+MUSICBRAINZ_USE_HTTPS = True
+DISC_LOOKUP_DEADLINE = 10  # seconds online meta may take to replace CD-TEXT names of a new disc
+META_CACHE_PATH = '/var/lib/cdp-sa/meta_cache.db'
+META_CACHE_TTL = 30 * 24 * 60 * 60  # seconds
+META_CACHE_NEGATIVE_TTL = 60 * 60  # seconds, for discs MusicBrainz didn't know
+META_CACHE_MAX_ENTRIES = 5000
+OFFLINE_META_INDEX_PATH = '/var/lib/cdp-sa/musicbrainz.db'  # built by import_musicbrainz_dump.py
+TOC_MATCH_TOLERANCE = 2  # seconds per track between pressings of the same disc
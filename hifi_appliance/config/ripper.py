@@ -1,3 +1,9 @@
 ALBUM_FOLDER_NAME_TEMPLATE = '{artist} - {title}'
 VA_ALBUM_FOLDER_NAME_TEMPLATE = '{title}'
-TRACK_FILE_NAME_TEMPLATE = '{track_number} {artist} - {title}.flac'
\ No newline at end of file
+TRACK_FILE_NAME_TEMPLATE = '{track_number} {artist} - {title}.flac'
+ACCURATERIP_DB_PATH = '/var/lib/cdp-sa/accuraterip'
+RIP_STRATEGY = 'adaptive'  # 'adaptive': fast pass, secure re-read of suspect tracks; 'secure': always secure
+RIP_FAST_PARANOIA_ARGS = ['-Y']
+RIP_SECURE_PARANOIA_ARGS = ['-S', '4']
+RIP_ENCODER_WORKERS = 2  # FLAC encoders shared by all drives
+RIP_DE_EMPHASIS = True  # undo the treble boost of tracks flagged PRE_EMPHASIS in the TOC while ripping
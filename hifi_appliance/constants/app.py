@@ -1 +1,4 @@
-CONFIG_PATH_NAME = '/etc/cdp-sa.yaml'
\ No newline at end of file
+import os
+
+
+CONFIG_PATH_NAME = os.environ.get('CDP_SA_CONFIG', '/etc/cdp-sa.yaml')
@@ -1,4 +1,5 @@
 import grp
+import json
 import logging
 import os
 import pathlib
@@ -217,6 +218,44 @@ class CdpDaemon(object):
     def handle_unknown_command(self, receiver, msg_parts):
         logger.error('Unknown command received %s', msg_parts)
 
+    def setup_query_receiver(self, channel):
+        """Answers requests on an RPC channel with the query_* methods.
+        Replies are 'ok' and the JSON encoded result, or 'error' and a
+        message.
+        """
+        callbacks = {}
+        for name in dir(self):
+            if name.startswith('query_'):
+                func = getattr(self, name)
+                if callable(func):
+                    callbacks[name[6:]] = (
+                        lambda receiver, msg, func2 = func: self.handle_query(msg, func2)
+                    )
+
+        return Receiver(
+            channel,
+            io_loop = self.io_loop,
+            callbacks = callbacks,
+            fallback = self.handle_unknown_query
+        )
+
+    def handle_query(self, msg_parts, query_function):
+        args = [msg_part.decode('utf-8') for msg_part in msg_parts]
+        query = args[0]
+        arguments = args[1:]
+
+        logger.debug('Received query %s with arguments %s', query, arguments)
+
+        try:
+            return ['ok', json.dumps(query_function(arguments))]
+        except Exception as e:
+            logger.exception('Error executing query')
+            return ['error', str(e)]
+
+    def handle_unknown_query(self, receiver, msg_parts):
+        logger.error('Unknown query received %s', msg_parts)
+        return ['error', 'unknown query']
+
     def create_pid_directory(self, pid_file_path):
         directory = pathlib.Path(pid_file_path).parents[0]
         if not directory.exists():
@@ -225,7 +264,7 @@ class CdpDaemon(object):
             shutil.chown(str(directory), user=self._daemon_config.user, group=self._daemon_config.group)
 
 
-class DaemonIOLoop(IOLoop):
+class DaemonIOLoop(IOLoop.configured_class()):
     def handle_callback_exception(self, callback):
         self._cod_daemon.log('Unhandled exception:\n{}', traceback.format_exc())
         sys.exit(1)
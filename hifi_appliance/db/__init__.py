@@ -1,6 +1,6 @@
-import sys
-
+from .client import TrackDBClient
+from .client import TrackDBQueryError
 from .db import TrackDB
-
-
-sys.modules[__name__] = TrackDB()
+from .library import LibraryIndex
+from .library import ORDER_ARTIST
+from .library import ORDER_TITLE
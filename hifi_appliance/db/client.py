@@ -0,0 +1,57 @@
+import json
+
+from ..message_bus import RPCClient
+from ..message_bus import query_db as channel_query_db
+from .library import ORDER_ARTIST
+
+
+class TrackDBQueryError(Exception):
+    pass
+
+
+class TrackDBClient(object):
+    """
+    Queries the track DB that commander keeps indexed, over the query_db
+    channel. Other processes share its warm index instead of opening the
+    database themselves. Raises RPCTimeoutError when commander doesn't
+    answer within `timeout` seconds.
+    """
+    def __init__(self, timeout=5):
+        self.client = RPCClient(channel_query_db, timeout)
+
+    def _query(self, name, *args):
+        (status, result) = self.client.request(name, *args)
+        if status != 'ok':
+            raise TrackDBQueryError(result)
+        return json.loads(result)
+
+    def has_disc(self, disc_id):
+        return self._query('has_disc', disc_id)
+
+    def get_track_list(self, disc_id):
+        return self._query('track_list', disc_id)
+
+    def list_albums(self, offset=0, limit=None, order=ORDER_ARTIST, artist=None):
+        """A page of albums, see `LibraryIndex.albums`. limit defaults to LIBRARY_PAGE_SIZE."""
+        return self._query('albums', str(offset), _str(limit), order, artist or '')
+
+    def list_artists(self, offset=0, limit=None):
+        return self._query('artists', str(offset), _str(limit))
+
+    def search_albums(self, text, offset=0, limit=None):
+        return self._query('search', text, str(offset), _str(limit))
+
+    def stat(self):
+        """{'discs': count, 'indexing': bool}"""
+        return self._query('stat')
+
+    def rebuild(self):
+        """Starts a rebuild, doesn't wait for it."""
+        return self._query('rebuild')
+
+    def close(self):
+        self.client.close()
+
+
+def _str(value):
+    return '' if value is None else str(value)
@@ -1,75 +1,612 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from contextlib import contextmanager
+from itertools import groupby
+import json
 import logging
+from operator import itemgetter
 import os
 import re
 from pathlib import Path
+import sqlite3
 import threading
 import time
 
-from filelock import FileLock
-import pickledb
+import mutagen
 
+from ..constants import CHANNELS
 from ..config import DB_FILE_PATH
 from ..config import DB_REBUILD_INTERVAL
+from ..config import DB_SCAN_BATCH_SIZE
+from ..config import DB_SCAN_INTERVAL
+from ..config import DB_SCAN_WORKERS
+from ..config import DB_WATCH
+from ..config import DB_WATCH_DELAY
 from ..config import MUSIC_PATH_NAME
+from ..config import TOC_MATCH_TOLERANCE
+from ..meta.toc_match import TocFingerprintIndex
+from ..util import is_network_filesystem
+from .inotify import DIRECTORY_CHANGES
+from .inotify import IN_Q_OVERFLOW
+from .inotify import Inotify
+from .library import LibraryIndex
 
 
 _TRACK_REGEX = re.compile(r'^\d\d .*\.flac$', re.IGNORECASE)
 
+_SQLITE_HEADER = b'SQLite format 3\x00'
+
+# bumped when tables change, the DB is then built again from the library
+_SCHEMA_VERSION = 2
+_TABLES = ['discs', 'tracks', 'file_stats', 'dir_stats']
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS discs (disc_id TEXT PRIMARY KEY, folder TEXT)''',
+    '''CREATE UNIQUE INDEX IF NOT EXISTS discs_folder ON discs (folder)''',
+    '''CREATE TABLE IF NOT EXISTS tracks (
+        disc_id TEXT, position INTEGER, path TEXT,
+        duration INTEGER, artist TEXT, title TEXT, album TEXT,
+        PRIMARY KEY (disc_id, position)
+    )''',
+    '''CREATE UNIQUE INDEX IF NOT EXISTS tracks_path ON tracks (path)''',
+    '''CREATE TABLE IF NOT EXISTS file_stats (path TEXT PRIMARY KEY, folder TEXT, size INTEGER, mtime_ns INTEGER)''',
+    '''CREATE INDEX IF NOT EXISTS file_stats_folder ON file_stats (folder)''',
+    '''CREATE TABLE IF NOT EXISTS dir_stats (path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT)''',
+]
+
+# directories modified this recently may change again within the same mtime
+# tick on coarse file systems, so they aren't trusted until the next scan
+_MTIME_SETTLE_NS = 2 * 10**9
+
 
 logger = logging.getLogger(__name__)
 
 
 class TrackDB(object):
+    """
+    Ripped discs and their tracks in SQLite. The database is in WAL mode, so
+    other processes can read while the library is being indexed. Track tags
+    and durations are read once when indexing, known discs don't need their
+    FLAC files opened to be played.
+
+    Each album folder is updated in its own transaction. File sizes and
+    modification times are kept, so a rebuild only reads the folders that
+    changed since the last one.
+
+    Directory mtimes are kept as well: `scan()` only lists directories whose
+    mtime changed and stats the rest. On local file systems inotify triggers
+    a scan of the changed directories within DB_WATCH_DELAY seconds. Every
+    DB_SCAN_INTERVAL the whole library is scanned in case events were
+    missed, and every DB_REBUILD_INTERVAL `rebuild()` checks every album.
+
+    Albums are kept in memory as well, `library` is a `LibraryIndex` for
+    browse and search. Commander answers queries of other processes from
+    it, see `TrackDBClient`.
+
+    Opening the DB doesn't index anything, `start()` does that in the
+    background, the TOC and library indexes included. Until the first scan
+    is done the DB answers from what it had stored, see `is_indexing()`.
+    """
     def __init__(self):
-        self._lock = FileLock('%s%s' % (DB_FILE_PATH, '.lock'))
-        self._db = pickledb.load(DB_FILE_PATH, False)
-        if not Path(DB_FILE_PATH).is_file():
-            self.rebuild()
+        self.path = Path(DB_FILE_PATH)
+        self._scan_lock = threading.RLock()
+
+        if self.path.is_file() and not self._is_sqlite_file():
+            logger.warning('%s is not an SQLite database, replacing it', self.path)
+            self.path.unlink()
+        is_new = not self.path.is_file()
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            if connection.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+                for table in _TABLES:
+                    connection.execute('DROP TABLE IF EXISTS %s' % table)
+                connection.execute('PRAGMA user_version = %d' % _SCHEMA_VERSION)
+                is_new = True
+            for statement in _SCHEMA:
+                connection.execute(statement)
 
+        self.is_new = is_new
+        # loaded by the indexing thread, empty until then
+        self.toc_index = TocFingerprintIndex(TOC_MATCH_TOLERANCE)
+        self.library = LibraryIndex([])
+
+        self._indexed = threading.Event()
+        self._stopped = threading.Event()
+        self.updater = None
+        self.watcher = None
+
+    def start(self, on_indexed=None):
+        """
+        Starts indexing in the background. `on_indexed` is called from the
+        indexing thread when the first scan is done.
+        """
         self.updater = threading.Thread(
-            target=self._rebuild_loop,
+            target=self._index_loop,
+            args=(on_indexed,),
             name='db builder'
         )
         self.updater.daemon = True
         self.updater.start()
 
+    def close(self):
+        """Stops indexing."""
+        self._stopped.set()
+        if self.updater:
+            self.updater.join()
+        if self.watcher:
+            self.watcher.join()
+
+    def is_indexing(self):
+        """True until the first scan after `start()` is done."""
+        return not self._indexed.is_set()
+
+    def wait_until_indexed(self, timeout=None):
+        return self._indexed.wait(timeout)
+
+    def _is_sqlite_file(self):
+        """Older versions kept the DB as JSON."""
+        with self.path.open('rb') as db_file:
+            header = db_file.read(len(_SQLITE_HEADER))
+        return header in (b'', _SQLITE_HEADER)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(str(self.path), timeout=10)
+        try:
+            connection.execute('PRAGMA synchronous = NORMAL')
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
     def has_disc(self, disc_id):
-        return self._db.exists(disc_id)
+        with self._connect() as connection:
+            return connection.execute('SELECT 1 FROM discs WHERE disc_id = ?', (disc_id,)).fetchone() is not None
+
+    def find_similar_disc(self, durations):
+        """
+        Disc ID of another pressing of the disc with these track durations
+        (PCM frames) that's already ripped, or None.
+        """
+        return self.toc_index.match(durations)
 
     def get_track_list(self, disc_id):
-        return self._db.get(disc_id)['track_files']
+        with self._connect() as connection:
+            return [
+                path for (path,) in connection.execute(
+                    'SELECT path FROM tracks WHERE disc_id = ? ORDER BY position', (disc_id,)
+                )
+            ]
+
+    def get_disc(self, disc_id):
+        """
+        Returns (track_list, disc_meta) in the shape `MutagenTagReader` reads
+        from the files. disc_meta is None when tags of a track are missing.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT path, duration, artist, title, album FROM tracks WHERE disc_id = ? ORDER BY position',
+                (disc_id,)
+            ).fetchall()
 
-    def store_track_list(self, disc_id, track_files):
-        self._db.set(disc_id, track_files)
+        track_list = [path for (path, _, _, _, _) in rows]
+        if not rows or any(None in (duration, artist, title) for (_, duration, artist, title, _) in rows):
+            return (track_list, None)
 
-    def persist(self):
-        with self._lock:
-            self._db().dump()
+        disc_meta = {
+            'disc_id': disc_id,
+            'title': rows[-1][4],
+            'tracks': [
+                {
+                    'artist': artist,
+                    'title': title,
+                    'duration': duration // CHANNELS
+                }
+                for (_, duration, artist, title, _) in rows
+            ]
+        }
+        disc_meta['duration'] = sum(track['duration'] for track in disc_meta['tracks'])
+
+        return (track_list, disc_meta)
 
     def count(self):
-        return self._db.totalkeys()
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM discs').fetchone()[0]
+
+    def update_folder(self, folder):
+        """
+        Brings the album in `folder` up to date, returns True when it had
+        changed. A folder without a .disc_id is not an album (any more).
+        """
+        folder = str(Path(folder))
+        try:
+            file_names = os.listdir(folder)
+        except OSError:
+            file_names = []
+
+        with self._connect() as connection:
+            update = self._read_folder(connection, folder, file_names)
+            if update is None:
+                return False
+            return self._write_folder(connection, update)
+
+    def _read_folder(self, connection, folder, file_names):
+        """
+        Reads the album in `folder` if its files changed since stored.
+        Returns None when unchanged, else (folder, album) where album is None
+        for a folder that isn't an album, or (disc_id, tracks, file_stats)
+        with (path, duration, artist, title, album) per track.
+        Only reads from the DB, runs in scanner threads.
+        """
+        stored_stats = {
+            path: (size, mtime_ns) for (path, size, mtime_ns) in connection.execute(
+                'SELECT path, size, mtime_ns FROM file_stats WHERE folder = ?', (folder,)
+            )
+        }
+
+        if '.disc_id' not in file_names:
+            return (folder, None) if stored_stats else None
+
+        disc_id_path = os.path.join(folder, '.disc_id')
+        track_files = sorted(os.path.join(folder, name) for name in file_names if _TRACK_REGEX.match(name))
+        file_stats = _stat_files([disc_id_path] + track_files)
+        if stored_stats == file_stats:
+            return None
+
+        try:
+            with open(disc_id_path) as disc_id_file:
+                disc_id = disc_id_file.read().replace('\n', '')
+        except OSError:
+            return (folder, None)
+
+        return (folder, (disc_id, [(path,) + _read_track(path) for path in track_files], file_stats))
+
+    def _write_folder(self, connection, update):
+        """Stores the result of `_read_folder`, returns True when anything changed."""
+        (folder, album) = update
+        deleted = self._delete_folder(connection, folder)
+        if album is None:
+            return deleted
+
+        (disc_id, tracks, file_stats) = album
+        connection.execute('DELETE FROM tracks WHERE disc_id = ?', (disc_id,))
+        connection.execute('INSERT OR REPLACE INTO discs VALUES (?, ?)', (disc_id, folder))
+        connection.executemany(
+            'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(disc_id, int(os.path.basename(track[0])[:2])) + track for track in tracks]
+        )
+        connection.executemany(
+            'INSERT INTO file_stats VALUES (?, ?, ?, ?)',
+            [(path, folder, size, mtime_ns) for (path, (size, mtime_ns)) in file_stats.items()]
+        )
+        return True
+
+    def remove_folder(self, folder):
+        """Forgets the album in `folder`, returns True when there was one."""
+        with self._connect() as connection:
+            return self._delete_folder(connection, str(Path(folder)))
+
+    def _delete_folder(self, connection, folder):
+        disc_ids = [
+            disc_id for (disc_id,) in connection.execute(
+                'SELECT disc_id FROM discs WHERE folder = ?', (folder,)
+            )
+        ]
+        connection.executemany('DELETE FROM tracks WHERE disc_id = ?', [(disc_id,) for disc_id in disc_ids])
+        connection.execute('DELETE FROM discs WHERE folder = ?', (folder,))
+        deleted_stats = connection.execute('DELETE FROM file_stats WHERE folder = ?', (folder,)).rowcount
+        return bool(disc_ids) or deleted_stats > 0
 
     def rebuild(self):
+        """Full walk of the library, checks every album folder."""
         logger.info('Rebuilding track database')
+        changed = self.scan(full=True)
+        logger.info('Track database rebuilt, %s discs indexed, %s folders changed', self.count(), changed)
 
-        discs = {}
-        for root, _, files in os.walk(MUSIC_PATH_NAME):
-            if '.disc_id' in files:
-                disc_id = Path(root).joinpath('.disc_id').read_text().replace('\n', '')
-                track_files = sorted([str(Path(root).joinpath(file)) for file in files if _TRACK_REGEX.match(file)])
-                discs[disc_id] = {
-                    'track_files': track_files
+    def scan(self, root=None, full=False):
+        """
+        Updates the albums under `root` (the whole library by default).
+        `root` itself is always listed, its subdirectories only when their
+        mtime changed or when `full`. Returns the number of changed albums.
+
+        On network file systems every stat and read waits on the server, so
+        directories are walked and albums read by DB_SCAN_WORKERS threads.
+        Results are written in transactions of DB_SCAN_BATCH_SIZE folders.
+        """
+        root = str(Path(root or MUSIC_PATH_NAME))
+
+        with self._scan_lock:
+            with self._connect() as connection:
+                stored_dirs = {
+                    path: (mtime_ns, subdirs) for (path, mtime_ns, subdirs) in connection.execute(
+                        "SELECT path, mtime_ns, subdirs FROM dir_stats WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                        (root, _like_prefix(root))
+                    )
                 }
 
-        with self._lock:
-            self._db.deldb()
-            for disc_id in discs:
-                self.store_track_list(disc_id, discs[disc_id])
-            self._db.dump()
+            scanner = _DirectoryScanner(self, stored_dirs, root, full)
+            changed = 0
+            batch = []
+            with ThreadPoolExecutor(max_workers=DB_SCAN_WORKERS, thread_name_prefix='db scanner') as executor:
+                for result in scanner.run(executor, max_in_flight=DB_SCAN_WORKERS * 4):
+                    batch.append(result)
+                    if len(batch) >= DB_SCAN_BATCH_SIZE:
+                        changed += self._write_scan_results(batch)
+                        batch = []
+            changed += self._write_scan_results(batch)
+            scanner.close()
+
+            gone = [path for path in stored_dirs if path not in scanner.seen]
+            with self._connect() as connection:
+                for path in gone:
+                    changed += self._delete_folder(connection, path)
+                connection.executemany('DELETE FROM dir_stats WHERE path = ?', [(path,) for path in gone])
+
+            if changed:
+                self._load_indexes()
 
-        logger.info('Track database rebuilt, %s discs indexed', self.count())
+        return changed
 
-    def _rebuild_loop(self):
-        while True:
-            time.sleep(DB_REBUILD_INTERVAL)
+    def _write_scan_results(self, results):
+        changed = 0
+        with self._connect() as connection:
+            for (dir_stat, update) in results:
+                if update is not None:
+                    changed += self._write_folder(connection, update)
+                connection.execute('INSERT OR REPLACE INTO dir_stats VALUES (?, ?, ?)', dir_stat)
+        return changed
+
+    def _known_dirs(self, root):
+        with self._connect() as connection:
+            return [
+                path for (path,) in connection.execute(
+                    "SELECT path FROM dir_stats WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                    (root, _like_prefix(root))
+                )
+            ]
+
+    def _load_indexes(self):
+        self.toc_index = self._build_toc_index()
+        self.library = self._build_library()
+
+    def _build_toc_index(self):
+        toc_index = TocFingerprintIndex(TOC_MATCH_TOLERANCE)
+        with self._connect() as connection:
+            rows = connection.execute('SELECT disc_id, duration FROM tracks ORDER BY disc_id, position').fetchall()
+        for (disc_id, disc_rows) in groupby(rows, key=itemgetter(0)):
+            durations = [duration for (_, duration) in disc_rows]
+            if None not in durations:
+                toc_index.add(disc_id, durations)
+        return toc_index
+
+    def _build_library(self):
+        """
+        Browse and search index of every album, a disc's artist is None
+        when its tracks are by various artists.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT discs.disc_id, discs.folder, tracks.artist, tracks.title, tracks.album, tracks.duration '
+                'FROM discs JOIN tracks ON tracks.disc_id = discs.disc_id '
+                'ORDER BY discs.disc_id, tracks.position'
+            ).fetchall()
+
+        albums = []
+        for (disc_id, disc_rows) in groupby(rows, key=itemgetter(0)):
+            disc_rows = list(disc_rows)
+            folder = disc_rows[0][1]
+            artists = {artist for (_, _, artist, _, _, _) in disc_rows}
+            durations = [duration for (_, _, _, _, _, duration) in disc_rows]
+            albums.append({
+                'disc_id': disc_id,
+                'artist': artists.pop() if len(artists) == 1 else None,
+                'title': disc_rows[-1][4] or os.path.basename(folder),
+                'track_count': len(disc_rows),
+                'duration': sum(durations) // CHANNELS if None not in durations else None,
+                'tracks': [(artist, title) for (_, _, artist, title, _, _) in disc_rows],
+            })
+
+        return LibraryIndex(albums)
+
+    def _index_loop(self, on_indexed):
+        # what was stored is answered from while the library is scanned,
+        # albums found by the scan are added to the indexes again
+        if not self.is_new:
+            self._load_indexes()
+
+        # catch up with changes made while we weren't running, watches are
+        # set on the directories found
+        if self.is_new:
             self.rebuild()
+        else:
+            self.scan()
+        self._indexed.set()
+        if on_indexed:
+            on_indexed()
+
+        if DB_WATCH and not self._stopped.is_set():
+            self.watcher = threading.Thread(
+                target=self._watch_loop,
+                name='db watcher'
+            )
+            self.watcher.daemon = True
+            self.watcher.start()
+
+        last_rebuild = time.time()
+
+        while not self._stopped.wait(DB_SCAN_INTERVAL):
+            if time.time() - last_rebuild >= DB_REBUILD_INTERVAL:
+                self.rebuild()
+                last_rebuild = time.time()
+            else:
+                self.scan()
+
+    def _watch_loop(self):
+        if is_network_filesystem(MUSIC_PATH_NAME):
+            logger.info('%s is a network file system, relying on periodic scans', MUSIC_PATH_NAME)
+            return
+
+        try:
+            inotify = Inotify()
+        except OSError:
+            logger.exception('Could not set up inotify, relying on periodic scans')
+            return
+
+        try:
+            self._watch(inotify)
+        finally:
+            inotify.close()
+
+    def _watch(self, inotify):
+        if not self._add_watches(inotify, self._known_dirs(str(Path(MUSIC_PATH_NAME)))):
+            return
+        # changes between the last scan and the watches being set
+        self.scan()
+        if not self._add_watches(inotify, self._known_dirs(str(Path(MUSIC_PATH_NAME)))):
+            return
+
+        # events come in bursts while a disc is ripped, changed directories
+        # are indexed once things have been quiet for DB_WATCH_DELAY
+        changed_dirs = set()
+        while not self._stopped.is_set():
+            events = inotify.read_events(timeout=DB_WATCH_DELAY if changed_dirs else 1)
+            for (path, mask, _) in events:
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning('Missed file system events, scanning the library')
+                    changed_dirs.add(str(Path(MUSIC_PATH_NAME)))
+                elif path is not None:
+                    changed_dirs.add(path)
+
+            if events or not changed_dirs:
+                continue
+
+            for path in changed_dirs:
+                self.scan(path)
+                if not self._add_watches(inotify, self._known_dirs(path)):
+                    return
+            changed_dirs = set()
+
+    def _add_watches(self, inotify, directories):
+        for path in directories:
+            if inotify.is_watched(path):
+                continue
+            try:
+                inotify.add_watch(path, DIRECTORY_CHANGES)
+            except FileNotFoundError:
+                continue
+            except OSError:
+                logger.exception('Could not watch %s, relying on periodic scans', path)
+                return False
+        return True
+
+class _DirectoryScanner(object):
+    """
+    Walks a directory tree for `TrackDB.scan` on a thread pool. Threads stat
+    and list directories and read changed albums, each with its own
+    read-only DB connection. `run()` yields (dir_stat, update) for every
+    directory listed, for the caller to write.
+    """
+    def __init__(self, track_db, stored_dirs, root, full):
+        self.track_db = track_db
+        self.stored_dirs = stored_dirs
+        self.root = root
+        self.full = full
+        self.seen = set()
+        self.settled_ns = time.time_ns() - _MTIME_SETTLE_NS
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def run(self, executor, max_in_flight):
+        pending = deque([self.root])
+        in_flight = set()
+
+        while pending or in_flight:
+            while pending and len(in_flight) < max_in_flight:
+                in_flight.add(executor.submit(self._scan_directory, pending.popleft()))
+
+            (done, in_flight) = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                (path, subdirs, result) = future.result()
+                if path is None:
+                    continue
+                self.seen.add(path)
+                pending.extend(subdirs)
+                if result is not None:
+                    yield result
+
+    def _scan_directory(self, path):
+        (stored_mtime_ns, stored_subdirs) = self.stored_dirs.get(path, (None, '[]'))
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return (None, [], None)
+        except OSError:
+            # e.g. a network mount that's gone away, what's stored is kept
+            logger.warning('Could not stat %s', path)
+            return (path, json.loads(stored_subdirs), None)
+        if not self.full and path != self.root and mtime_ns == stored_mtime_ns:
+            return (path, json.loads(stored_subdirs), None)
+
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            logger.warning('Could not list %s', path)
+            return (path, json.loads(stored_subdirs), None)
+
+        subdirs = sorted(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+        file_names = [entry.name for entry in entries]
+
+        update = None
+        if '.disc_id' in file_names or path in self.stored_dirs:
+            update = self.track_db._read_folder(self._connection(), path, file_names)
+
+        dir_stat = (path, mtime_ns if mtime_ns < self.settled_ns else None, json.dumps(subdirs))
+        return (path, subdirs, (dir_stat, update))
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.track_db.path), timeout=10, check_same_thread=False)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+
+def _stat_files(paths):
+    file_stats = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        file_stats[path] = (stat.st_size, stat.st_mtime_ns)
+    return file_stats
+
+
+def _read_track(path):
+    """(duration, artist, title, album) of a FLAC file, duration in PCM frames."""
+    try:
+        flac_data = mutagen.File(path)
+        duration = flac_data.info.total_samples
+    except (mutagen.MutagenError, AttributeError):
+        logger.warning('Could not read %s', path)
+        return (None, None, None, None)
+
+    tags = flac_data.tags or {}
+    return (duration,) + tuple(
+        tags[key][0] if key in tags else None for key in ('artist', 'title', 'album')
+    )
+
+
+def _like_prefix(path):
+    """LIKE pattern for everything below `path`."""
+    return path.rstrip('/').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
@@ -0,0 +1,96 @@
+"""
+Minimal inotify binding through ctypes, enough to watch a directory tree.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# changes that leave a directory's entries or their content different
+DIRECTORY_CHANGES = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class Inotify(object):
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            self._raise_errno()
+
+        self.paths = {}
+        self.watches = {}
+
+    def _raise_errno(self, path=None):
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), path)
+
+    def add_watch(self, path, mask=DIRECTORY_CHANGES):
+        """Watches a directory, raises OSError (ENOSPC when out of watches)."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask | IN_ONLYDIR)
+        if wd < 0:
+            self._raise_errno(path)
+
+        self.paths[wd] = path
+        self.watches[path] = wd
+        return wd
+
+    def is_watched(self, path):
+        return path in self.watches
+
+    def read_events(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for events, returns a list of
+        (directory, mask, name). Watches of removed directories are dropped.
+        """
+        (readable, _, _) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        position = 0
+        while position < len(data):
+            (wd, mask, _, name_length) = _EVENT_HEADER.unpack_from(data, position)
+            position += _EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + name_length].rstrip(b'\0'))
+            position += name_length
+
+            path = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                if self.watches.get(path) == wd:
+                    del self.watches[path]
+                continue
+
+            events.append((path, mask, name))
+
+        return events
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,132 @@
+import bisect
+import re
+import unicodedata
+
+import numpy
+
+
+_TOKEN_REGEX = re.compile(r'\w+')
+
+ORDER_ARTIST = 'artist'
+ORDER_TITLE = 'title'
+
+
+class LibraryIndex(object):
+    """
+    Browse and search over the albums of the track DB, built in memory
+    once per change of the library and read-only after.
+
+    Albums are numbered in browse order, by artist then title. Search is
+    an inverted index from the tokens of album artists and titles and of
+    track artists and titles to album numbers. Tokens are sorted, so all
+    tokens starting with a query word are a contiguous range, and their
+    postings are a contiguous slice of one array. Every query word must
+    prefix some token of an album for it to match, which also makes
+    search-as-you-type work.
+
+    Results are pages: {'total': count, 'offset': offset, 'items': [...]}.
+    """
+    def __init__(self, albums):
+        albums = sorted(albums, key=_browse_key)
+        self._albums = [_album_summary(album) for album in albums]
+        self._disc_ids = {album['disc_id']: album for album in self._albums}
+
+        self._by_title = sorted(range(len(albums)), key=lambda number: _sort_name(albums[number]['title']))
+
+        self._artists = {}
+        for (number, album) in enumerate(albums):
+            self._artists.setdefault(album['artist'], []).append(number)
+        self._artist_list = [
+            {'artist': artist, 'album_count': len(numbers)}
+            for (artist, numbers) in self._artists.items()
+        ]
+
+        postings = {}
+        for (number, album) in enumerate(albums):
+            names = [album['artist'], album['title']] + [name for track in album['tracks'] for name in track]
+            for token in set(token for name in names for token in tokenize(name)):
+                postings.setdefault(token, []).append(number)
+
+        self._tokens = sorted(postings)
+        lengths = numpy.array([len(postings[token]) for token in self._tokens], dtype=numpy.int64)
+        self._starts = numpy.concatenate(([0], numpy.cumsum(lengths)))
+        self._postings = numpy.fromiter(
+            (number for token in self._tokens for number in postings[token]),
+            dtype=numpy.int32,
+            count=int(self._starts[-1])
+        )
+
+    def __len__(self):
+        return len(self._albums)
+
+    def get_album(self, disc_id):
+        return self._disc_ids.get(disc_id)
+
+    def albums(self, offset=0, limit=None, order=ORDER_ARTIST, artist=None):
+        """
+        Albums sorted by artist or title, only those of `artist` when
+        given. None is the artist of albums by various artists.
+        """
+        if artist is not None:
+            numbers = self._artists.get(artist, [])
+        elif order == ORDER_TITLE:
+            numbers = self._by_title
+        elif order == ORDER_ARTIST:
+            numbers = range(len(self._albums))
+        else:
+            raise ValueError('Unknown order %s' % order)
+
+        return self._page(numbers, offset, limit)
+
+    def artists(self, offset=0, limit=None):
+        """Artists in browse order, with their album counts."""
+        return _page(self._artist_list, offset, limit)
+
+    def search(self, text, offset=0, limit=None):
+        """Albums matching every word of `text`, in browse order."""
+        words = tokenize(text)
+        if not words:
+            return self._page([], offset, limit)
+
+        matches = None
+        # longer words match fewer tokens, start with the most selective
+        for word in sorted(set(words), key=len, reverse=True):
+            start = bisect.bisect_left(self._tokens, word)
+            end = bisect.bisect_left(self._tokens, word + '\U0010ffff', start)
+            numbers = numpy.unique(self._postings[self._starts[start]:self._starts[end]])
+            matches = numbers if matches is None else numpy.intersect1d(matches, numbers, assume_unique=True)
+            if not matches.size:
+                break
+
+        return self._page(matches.tolist(), offset, limit)
+
+    def _page(self, numbers, offset, limit):
+        page = _page(numbers, offset, limit)
+        page['items'] = [self._albums[number] for number in page['items']]
+        return page
+
+
+def tokenize(text):
+    """Words of `text` without case and accents, 'Björk' is ['bjork']."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_REGEX.findall(text)
+
+
+def _page(items, offset, limit):
+    end = len(items) if limit is None else offset + limit
+    return {'total': len(items), 'offset': offset, 'items': items[offset:end]}
+
+
+def _sort_name(name):
+    return (name or '').casefold()
+
+
+def _browse_key(album):
+    return (_sort_name(album['artist']), _sort_name(album['title']), album['disc_id'])
+
+
+def _album_summary(album):
+    return {key: value for (key, value) in album.items() if key != 'tracks'}
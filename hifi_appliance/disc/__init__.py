@@ -1,2 +1,3 @@
-from .disc import read_disc_id
-from .disc import read_disc_meta
\ No newline at end of file
+from .disc import read_disc
+from .disc import read_disc_toc
+from .session import DiscSession
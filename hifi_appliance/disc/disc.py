@@ -1,73 +1,43 @@
 import logging
 import os
-from pathlib import Path
 import subprocess
-import tempfile
 
 import discid
-from coolname import generate
 
-from .toc import Toc, TOCError
 from ..config import CD_DEVICE
 
 
 logger = logging.getLogger(__name__)
 
 
-def read_disc_id():
+def read_disc(device=CD_DEVICE):
+    """
+    Reads the TOC through libdiscid, blocks while the drive spins up.
+    Returns the disc ID and the TOC, None when there's no readable disc.
+    """
     try:
-        disc = discid.read(CD_DEVICE)
-        logger.info('Disc identified as %s', disc.id)
-        return disc.id
+        disc = discid.read(device)
     except discid.disc.DiscError:
-        logger.error('Could not identify disc.')
+        logger.error('Could not read TOC of disc in %s', device)
         return None
 
-
-def _read_toc_into_file(toc_filepath):
-    with open(os.devnull, 'w') as dev_null:
-        try:
-            subprocess.call(['cdrdao', 'read-toc', '--fast-toc', toc_filepath], stdout=dev_null, stderr=dev_null)
-        except subprocess.CalledProcessError as e:
-            logger.error('Failed to call cdrdao for TOC extraction')
-
-
-def _convert_track_info(toc_track_info):
-    duration = toc_track_info['file_length']
-    if 'pregap_silence' in toc_track_info.keys():
-        duration += toc_track_info['pregap_silence']
-
-    artist = toc_track_info['artist'] if 'artist' in toc_track_info.keys() else 'Unknown Artist'
-    title = toc_track_info['title'] if 'title' in toc_track_info.keys() else 'Unknown Title'
-
-    return {
-        'duration': duration,
-        'artist': artist,
-        'title': title
+    toc = {
+        'first_track': disc.first_track_num,
+        'offsets': [track.offset for track in disc.tracks],
+        'leadout': disc.sectors,
+        'freedb_id': disc.freedb_id
     }
+    return (disc.id, toc)
 
 
-def read_disc_meta(disc_id, toc_filepath=tempfile.NamedTemporaryFile().name):
-    logger.info('Reading disc meta from the disc')
-    _read_toc_into_file(toc_filepath)
-
-    try:
-        toc = Toc(Path(toc_filepath).read_text())
-        disc_meta = toc.disc_meta
-        if 'title' not in disc_meta.keys():
-            disc_meta['title'] = 'Unknown Album %s' % ''.join(x.capitalize() for x in generate())
+def read_disc_toc(device=CD_DEVICE):
+    disc = read_disc(device)
+    return disc[1] if disc else None
 
-        tracks = [_convert_track_info(track) for track in disc_meta['tracks']]
-        duration = sum(track['duration'] for track in tracks)
 
-        return {
-            'disc_id': disc_id,
-            'title': disc_meta['title'],
-            'tracks': tracks,
-            'duration': duration,
-            'cd': 1,
-            'total_cds': 1
-        }
-    except TOCError:
-        logger.error('Could not parse disc TOC')
-        return None
+def read_toc_into_file(toc_filepath, device=CD_DEVICE):
+    with open(os.devnull, 'w') as dev_null:
+        try:
+            subprocess.call(['cdrdao', 'read-toc', '--fast-toc', '--device', device, toc_filepath], stdout=dev_null, stderr=dev_null)
+        except subprocess.CalledProcessError as e:
+            logger.error('Failed to call cdrdao for TOC extraction')
@@ -0,0 +1,130 @@
+import logging
+from pathlib import Path
+import tempfile
+import threading
+
+from coolname import generate
+
+from .disc import read_disc
+from .disc import read_toc_into_file
+from .toc import Toc, TOCError
+from ..config import CD_DEVICE
+from ..constants import PCM_FRAMES_PER_CD_FRAME
+
+
+logger = logging.getLogger(__name__)
+
+
+class DiscSession(object):
+    """
+    The disc currently in a drive, from insert until eject. The TOC is read
+    once, through libdiscid, by `read_toc()`: disc ID, track durations and
+    the TOC used for AccurateRip all come from that one read.
+
+    CD-TEXT and the pre-emphasis flags are not part of what libdiscid reads
+    and need a full cdrdao run, so they're only read when asked for and then
+    kept for the session.
+    """
+    def __init__(self, device=CD_DEVICE):
+        self.device = device
+        self.disc_id = None
+        self.toc = None
+        self._cd_text = None
+        self._cd_text_lock = threading.Lock()
+        self._unknown_album_title = None
+
+    def read_toc(self):
+        """Blocks while the drive spins up, returns the disc ID or None."""
+        disc = read_disc(self.device)
+        if not disc:
+            return None
+
+        (self.disc_id, self.toc) = disc
+        logger.info('Disc identified as %s', self.disc_id)
+        return self.disc_id
+
+    def track_durations(self):
+        """Track durations in PCM frames, from the TOC track offsets."""
+        offsets = self.toc['offsets']
+        ends = offsets[1:] + [self.toc['leadout']]
+        return [(end - start) * PCM_FRAMES_PER_CD_FRAME for start, end in zip(offsets, ends)]
+
+    def cd_text(self):
+        """Disc and track names from CD-TEXT, an empty dict when there are none."""
+        with self._cd_text_lock:
+            if self._cd_text is None:
+                self._cd_text = self._read_cd_text()
+            return self._cd_text
+
+    def add_pre_emphasis(self, disc_meta):
+        """
+        Flags emphasized tracks in disc meta from elsewhere, e.g. MusicBrainz.
+        Doesn't wait for CD-TEXT, nothing is flagged before it has been read.
+        Returns whether a flag was added.
+        """
+        text_tracks = (self._cd_text or {}).get('tracks', [])
+        if len(text_tracks) != len(disc_meta['tracks']):
+            return False
+
+        added = False
+        for (track, text_track) in zip(disc_meta['tracks'], text_tracks):
+            if text_track.get('pre_emphasis') and not track.get('pre_emphasis'):
+                track['pre_emphasis'] = True
+                added = True
+        return added
+
+    def _read_cd_text(self):
+        logger.info('Reading CD-TEXT from the disc in %s', self.device)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            toc_filepath = str(Path(tmp_dir).joinpath('disc.toc'))
+            read_toc_into_file(toc_filepath, self.device)
+
+            try:
+                return Toc(Path(toc_filepath).read_text()).disc_meta
+            except (OSError, TOCError):
+                logger.error('Could not read CD-TEXT')
+                return {}
+
+    def toc_meta(self):
+        """Disc meta from the TOC alone, with placeholder names."""
+        return self._build_disc_meta({})
+
+    def disc_meta(self):
+        """Disc meta from the disc itself: durations from the TOC, names from CD-TEXT."""
+        if not self.toc:
+            return None
+        return self._build_disc_meta(self.cd_text())
+
+    def _build_disc_meta(self, cd_text):
+        if not self.toc:
+            return None
+
+        text_tracks = cd_text.get('tracks', [])
+
+        tracks = []
+        for i, duration in enumerate(self.track_durations()):
+            text_track = text_tracks[i] if i < len(text_tracks) else {}
+            tracks.append({
+                'duration': duration,
+                'artist': text_track.get('artist') or 'Unknown Artist',
+                'title': text_track.get('title') or 'Unknown Title'
+            })
+            if text_track.get('pre_emphasis'):
+                tracks[-1]['pre_emphasis'] = True
+
+        return {
+            'disc_id': self.disc_id,
+            'title': cd_text.get('title') or self.unknown_album_title(),
+            'tracks': tracks,
+            'duration': sum(track['duration'] for track in tracks),
+            'cd': 1,
+            'total_cds': 1,
+            'toc': self.toc
+        }
+
+    def unknown_album_title(self):
+        """Random album name, kept for the session so provisional and final meta agree."""
+        if self._unknown_album_title is None:
+            self._unknown_album_title = 'Unknown Album %s' % ''.join(x.capitalize() for x in generate())
+        return self._unknown_album_title
@@ -42,10 +42,14 @@ class Toc(object):
 
             # Ignore some track flags that don't matter to us
             elif line in ('TWO_CHANNEL_AUDIO',
-                          'COPY', 'NO COPY',
-                          'PRE_EMPHASIS', 'NO PRE_EMPHASIS'):
+                          'COPY', 'NO COPY'):
                 pass
 
+            # Emphasized tracks need de-emphasis when ripped
+            elif line in ('PRE_EMPHASIS', 'NO PRE_EMPHASIS'):
+                if track is not None:
+                    track['pre_emphasis'] = line == 'PRE_EMPHASIS'
+
             # Anyone ever seen one of these discs?
             elif line == 'FOUR_CHANNEL_AUDIO':
                 raise TOCError('no support for four-channel audio')
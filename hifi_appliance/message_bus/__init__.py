@@ -1,5 +1,5 @@
-from .api import Receiver, Sender, setup_command_receiver
-from .channel import Queue, Topic
+from .api import Receiver, RPCClient, RPCTimeoutError, Sender, setup_command_receiver
+from .channel import Queue, RPC, Topic
 
 
 # State changes
@@ -40,3 +40,10 @@ command_ripping = Queue(
     name='command_ripping',
     address='tcp://127.0.0.1:7963',
 )
+
+
+# Track database queries, answered by commander
+query_db = RPC(
+    name='query_db',
+    address='tcp://127.0.0.1:7952',
+)
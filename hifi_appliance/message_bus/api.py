@@ -1,5 +1,8 @@
+import zmq
 from zmq.eventloop.ioloop import IOLoop
 
+from .context import get_zmq_context
+
 from .util import keys_to_ascii
 
 
@@ -55,6 +58,14 @@ class Receiver(object):
             self._stream.close()
             self._stream = None
 
+    def flush(self):
+        """Handles the messages already received right away, instead of
+        one per io_loop iteration. Returns how many there were.
+        """
+        if not self._stream:
+            return 0
+        return self._stream.flush(zmq.POLLIN)
+
     def _on_message(self, msg_parts):
         """Callback when receiving a message on the channel.  Dispatches the
         message to the matching callback (or callbacks).
@@ -101,6 +112,48 @@ class Sender(object):
             self._stream = None
 
 
+class RPCTimeoutError(Exception):
+    pass
+
+
+class RPCClient(object):
+    """A blocking client for RPC channels, for processes and threads that
+    don't run an io_loop.
+    """
+
+    def __init__(self, channel, timeout = 5):
+        """Create a client of an RPC channel. Requests not answered
+        within timeout seconds raise RPCTimeoutError.
+        """
+        self.channel = channel
+        self.timeout = timeout
+        self._socket = None
+
+    def __str__(self):
+        return '<RPCClient for {0}>'.format(str(self.channel))
+
+    def request(self, *msg_parts):
+        """Send a multipart request and return the reply parts as strings.
+        """
+        if self._socket is None:
+            self._socket = get_zmq_context().socket(zmq.REQ)
+            self._socket.connect(self.channel.address)
+
+        self._socket.send_multipart([msg_part.encode('utf-8') for msg_part in msg_parts])
+        if not self._socket.poll(self.timeout * 1000):
+            # a REQ socket can't send again before it got its reply, so
+            # start over with a new one
+            self.close()
+            raise RPCTimeoutError(msg_parts[0])
+
+        return [reply_part.decode('utf-8') for reply_part in self._socket.recv_multipart()]
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close(linger = 0)
+            self._socket = None
+
+
 def setup_command_receiver(obj, channel):
     callbacks = {}
     for name in dir(obj):
@@ -134,3 +134,46 @@ class Queue(Channel):
         func = callbacks.get(msg_parts[0], fallback)
         if func:
             func(receiver, msg_parts)
+
+
+class RPC(Channel):
+    """A request/reply channel where any number of clients query a single
+    service. Every request gets exactly one reply.
+    """
+    def __init__(self, address, name = None):
+        """Define an RPC channel, the service listening on address.
+        MessageHandler event names must match the received request name
+        exactly to invoke a callback, which returns the reply parts.
+        """
+        self.name = name.encode('ascii')
+        self._address = address
+
+    def __str__(self):
+        return '<RPC {0} on {1}>'.format(self.name or id(self), self._address)
+
+    @property
+    def address(self):
+        return self._address
+
+    def get_receiver_stream(self, subscriptions, io_loop = None):
+        """Return a REP socket stream.
+        """
+        socket = get_zmq_context().socket(zmq.REP)
+        socket.bind(self._address)
+        return ZMQStream(socket, io_loop)
+
+    def get_sender_stream(self, name, io_loop = None):
+        """Return a REQ socket stream.
+        """
+        socket = get_zmq_context().socket(zmq.REQ)
+        socket.connect(self._address)
+        return ZMQStream(socket, io_loop)
+
+    def dispatch_message(self, stream, callbacks, fallback, receiver, msg_parts):
+        """Send the request to the callback matching its name and the
+        callback's return value back as the reply. A REP socket must reply
+        before it can receive again, so unanswered requests get an empty one.
+        """
+        func = callbacks.get(msg_parts[0], fallback)
+        reply = func(receiver, msg_parts) if func else None
+        stream.send_multipart([part.encode('utf-8') for part in (reply or [''])])
@@ -1,5 +1,10 @@
 import sys
 
+from .cache import CachedMetaLookup
+from .cache import DiscMetaCache
 from .musicbrainz import MusicbrainzLookup as RemoteMeta
+from .offline import OfflineMusicbrainzIndex as OfflineMeta
+from .offline import import_musicbrainz_dump
 from .mutagen import MutagenTagReader as LocalMeta
-from .mutagen import write_meta
\ No newline at end of file
+from .mutagen import write_meta
+from .toc_match import TocFingerprintIndex
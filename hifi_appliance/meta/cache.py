@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from .toc_match import TocFingerprintIndex
+from ..config import TOC_MATCH_TOLERANCE
+
+
+logger = logging.getLogger(__name__)
+
+
+class DiscMetaCache(object):
+    """
+    Disc meta by disc ID in SQLite, shared by the look-up threads. Entries
+    expire after `ttl` seconds, or `negative_ttl` for discs that had no meta
+    (stored as None). Beyond `max_entries` the least recently used go.
+
+    Discs whose ID isn't cached can still be matched to cached meta of
+    another pressing by their track durations, see `find_similar`.
+    """
+    def __init__(self, path, ttl, negative_ttl, max_entries, toc_match_tolerance=TOC_MATCH_TOLERANCE):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.toc_match_tolerance = toc_match_tolerance
+
+        self.lock = threading.Lock()
+        # built on first use, from all cached meta
+        self.toc_index = None
+
+        if not self.path.parent.is_dir():
+            self.path.parent.mkdir(parents=True)
+
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS disc_meta ('
+                'disc_id TEXT PRIMARY KEY, disc_meta TEXT, stored_at REAL, used_at REAL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(str(self.path), timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, disc_id, allow_expired=False):
+        """Returns (found, disc_meta)."""
+        now = time.time()
+
+        with self.lock, self._connect() as connection:
+            row = connection.execute(
+                'SELECT disc_meta, stored_at FROM disc_meta WHERE disc_id = ?', (disc_id,)
+            ).fetchone()
+            if row is None:
+                return (False, None)
+
+            (disc_meta, stored_at) = row
+            ttl = self.ttl if disc_meta is not None else self.negative_ttl
+            if now - stored_at > ttl and not allow_expired:
+                return (False, None)
+
+            connection.execute('UPDATE disc_meta SET used_at = ? WHERE disc_id = ?', (now, disc_id))
+
+        return (True, json.loads(disc_meta) if disc_meta is not None else None)
+
+    def put(self, disc_id, disc_meta):
+        now = time.time()
+        value = json.dumps(disc_meta) if disc_meta is not None else None
+
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO disc_meta VALUES (?, ?, ?, ?)', (disc_id, value, now, now)
+            )
+            connection.execute(
+                'DELETE FROM disc_meta WHERE disc_id IN ('
+                'SELECT disc_id FROM disc_meta ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+            if self.toc_index is not None and disc_meta:
+                self.toc_index.add(disc_id, self._durations(disc_meta))
+
+    def find_similar(self, durations):
+        """
+        Returns (disc_id, disc_meta) of cached meta with the same track layout
+        as `durations` (PCM frames per track), or None. Entries evicted since
+        the index was built are skipped.
+        """
+        with self.lock:
+            if self.toc_index is None:
+                self.toc_index = self._build_toc_index()
+        disc_id = self.toc_index.match(durations)
+        if disc_id is None:
+            return None
+
+        (found, disc_meta) = self.get(disc_id)
+        if not found or disc_meta is None:
+            return None
+        return (disc_id, disc_meta)
+
+    def _build_toc_index(self):
+        toc_index = TocFingerprintIndex(self.toc_match_tolerance)
+        with self._connect() as connection:
+            for (disc_id, disc_meta) in connection.execute(
+                'SELECT disc_id, disc_meta FROM disc_meta WHERE disc_meta IS NOT NULL'
+            ):
+                toc_index.add(disc_id, self._durations(json.loads(disc_meta)))
+        return toc_index
+
+    def _durations(self, disc_meta):
+        return [track['duration'] for track in disc_meta.get('tracks', [])]
+
+    def count(self):
+        with self.lock, self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM disc_meta').fetchone()[0]
+
+
+class CachedMetaLookup(object):
+    """
+    Puts a `DiscMetaCache` in front of a meta look-up such as
+    `MusicbrainzLookup`. When the look-up fails outright (e.g. offline),
+    expired meta is still better than none.
+
+    Given the track `durations` of the disc, meta cached for another
+    pressing of it is used rather than looking the disc up.
+    """
+    def __init__(self, lookup, cache):
+        self.lookup = lookup
+        self.cache = cache
+
+    def query(self, disc_id, durations=None):
+        (found, disc_meta) = self.cache.get(disc_id)
+        if found and disc_meta is not None:
+            logger.debug('Disc meta for %s found in cache', disc_id)
+            return disc_meta
+
+        # also for discs MusicBrainz doesn't know, whose other pressings it may
+        similar = self.cache.find_similar(durations) if durations else None
+        if similar:
+            (similar_disc_id, disc_meta) = similar
+            logger.info('Disc %s matches cached meta of %s by its TOC', disc_id, similar_disc_id)
+            disc_meta['disc_id'] = disc_id
+            return disc_meta
+
+        if found:
+            logger.debug('Disc %s is known to have no meta', disc_id)
+            return None
+
+        try:
+            disc_meta = self.lookup.query(disc_id)
+        except Exception:
+            (found, disc_meta) = self.cache.get(disc_id, allow_expired=True)
+            if found and disc_meta is not None:
+                logger.warning('Disc meta look-up failed, using expired cache entry for %s', disc_id)
+                return disc_meta
+            raise
+
+        self.cache.put(disc_id, disc_meta)
+        return disc_meta
@@ -3,6 +3,8 @@ import logging
 import musicbrainzngs
 from retrying import retry
 
+from ..config import MUSICBRAINZ_HOST
+from ..config import MUSICBRAINZ_USE_HTTPS
 from ..constants import SAMPLE_RATE
 
 
@@ -14,6 +16,7 @@ class MusicbrainzLookup(object):
     def query(self, disc_id):
         logger.debug('Retrieving disc meta online')
 
+        musicbrainzngs.set_hostname(MUSICBRAINZ_HOST, use_https=MUSICBRAINZ_USE_HTTPS)
         musicbrainzngs.set_useragent('cdp-sa', '0.0.1')
         musicbrainzngs.auth('', '')
 
@@ -27,9 +30,13 @@ class MusicbrainzLookup(object):
                 disc_id,
                 includes=["artists", "artist-credits", "recordings"]
             )
-        except musicbrainzngs.musicbrainz.ResponseError:
+        except musicbrainzngs.musicbrainz.ResponseError as e:
+            # anything but "not found" isn't an answer, so it isn't cached
+            if getattr(e.cause, 'code', None) == 404:
+                logger.info('Disc %s not found on Musicbrainz', disc_id)
+                return None
             logger.exception('Could not retrieve disc meta from Musicbrainz')
-            return None
+            raise
 
         if not 'disc' in response.keys() or not 'release-list' in response['disc'].keys():
             logger.error('Musicbrainz response contains no relevant information')
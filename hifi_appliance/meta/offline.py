@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+from itertools import islice
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import tarfile
+
+from ..constants import SAMPLE_RATE
+
+
+logger = logging.getLogger(__name__)
+
+
+# MusicBrainz ids from the artist_type and medium_format tables
+_ARTIST_TYPE_PERSON = 1
+_ARTIST_TYPE_GROUP = 2
+_MEDIUM_FORMAT_CD = 1
+
+# Columns kept from each mbdump table (PostgreSQL COPY files without a
+# header), as (column index, staging column) pairs
+_DUMP_TABLES = {
+    'cdtoc': [(0, 'id INTEGER'), (1, 'discid TEXT')],
+    'medium_cdtoc': [(1, 'medium INTEGER'), (2, 'cdtoc INTEGER')],
+    'medium': [(0, 'id INTEGER'), (1, 'release INTEGER'), (2, 'position INTEGER'), (3, 'format INTEGER')],
+    'release': [(0, 'id INTEGER'), (2, 'name TEXT'), (3, 'artist_credit INTEGER')],
+    'track': [
+        (3, 'medium INTEGER'), (4, 'position INTEGER'), (6, 'name TEXT'),
+        (7, 'artist_credit INTEGER'), (8, 'length INTEGER'), (11, 'is_data_track TEXT')
+    ],
+    'artist_credit': [(0, 'id INTEGER'), (1, 'name TEXT'), (2, 'artist_count INTEGER')],
+    'artist_credit_name': [(0, 'artist_credit INTEGER'), (1, 'position INTEGER'), (2, 'artist INTEGER')],
+    'artist': [(0, 'id INTEGER'), (2, 'name TEXT'), (10, 'type INTEGER')],
+}
+
+_STAGING_INDEXES = [
+    'CREATE INDEX staging.medium_cdtoc_cdtoc ON medium_cdtoc (cdtoc)',
+    'CREATE INDEX staging.medium_id ON medium (id)',
+    'CREATE INDEX staging.medium_release ON medium (release)',
+    'CREATE INDEX staging.release_id ON release (id)',
+    'CREATE INDEX staging.track_medium ON track (medium)',
+    'CREATE INDEX staging.artist_credit_id ON artist_credit (id)',
+    'CREATE INDEX staging.artist_credit_name_credit ON artist_credit_name (artist_credit, position)',
+    'CREATE INDEX staging.artist_id ON artist (id)',
+]
+
+# A disc ID found on several releases resolves to the lowest medium id,
+# MusicBrainz lists releases in the same order
+_INDEX_TABLES = [
+    '''CREATE TABLE discs (disc_id TEXT PRIMARY KEY, medium INTEGER) WITHOUT ROWID''',
+    '''INSERT OR IGNORE INTO discs
+        SELECT cdtoc.discid, medium_cdtoc.medium
+        FROM staging.cdtoc cdtoc JOIN staging.medium_cdtoc medium_cdtoc ON medium_cdtoc.cdtoc = cdtoc.id
+        ORDER BY medium_cdtoc.medium''',
+
+    '''CREATE TABLE media (id INTEGER PRIMARY KEY, release INTEGER, position INTEGER)''',
+    '''INSERT INTO media
+        SELECT medium.id, medium.release, medium.position
+        FROM staging.medium medium WHERE medium.id IN (SELECT medium FROM discs)''',
+
+    '''CREATE TABLE releases (id INTEGER PRIMARY KEY, title TEXT, artist TEXT, total_cds INTEGER)''',
+    '''INSERT INTO releases
+        SELECT release.id, release.name,
+            CASE WHEN artist_credit.artist_count = 1 AND artist.type IN (%d, %d) THEN artist_credit.name END,
+            (SELECT COUNT(*) FROM staging.medium medium WHERE medium.release = release.id AND medium.format = %d)
+        FROM staging.release release
+        JOIN staging.artist_credit artist_credit ON artist_credit.id = release.artist_credit
+        LEFT JOIN staging.artist_credit_name artist_credit_name
+            ON artist_credit_name.artist_credit = artist_credit.id AND artist_credit_name.position = 0
+        LEFT JOIN staging.artist artist ON artist.id = artist_credit_name.artist
+        WHERE release.id IN (SELECT release FROM media)''' % (
+        _ARTIST_TYPE_PERSON, _ARTIST_TYPE_GROUP, _MEDIUM_FORMAT_CD
+    ),
+
+    '''CREATE TABLE tracks (
+        medium INTEGER, position INTEGER, title TEXT, artist TEXT, length INTEGER,
+        PRIMARY KEY (medium, position)
+    ) WITHOUT ROWID''',
+    '''INSERT OR IGNORE INTO tracks
+        SELECT track.medium, track.position, track.name, artist.name, track.length
+        FROM staging.track track
+        LEFT JOIN staging.artist_credit_name artist_credit_name
+            ON artist_credit_name.artist_credit = track.artist_credit AND artist_credit_name.position = 0
+        LEFT JOIN staging.artist artist ON artist.id = artist_credit_name.artist
+        WHERE track.medium IN (SELECT medium FROM discs) AND track.is_data_track IS NOT 't' ''',
+]
+
+
+class OfflineMusicbrainzIndex(object):
+    """
+    Answers disc ID look-ups from a local index of a MusicBrainz data dump
+    (see `import_musicbrainz_dump`), in the same `disc_meta` shape as
+    `MusicbrainzLookup`. Track names are the ones printed on the release
+    rather than recording names.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def query(self, disc_id):
+        if not self.path.is_file():
+            return None
+
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT media.id, media.position, releases.title, releases.artist, releases.total_cds '
+                'FROM discs JOIN media ON media.id = discs.medium JOIN releases ON releases.id = media.release '
+                'WHERE discs.disc_id = ?',
+                (disc_id,)
+            ).fetchone()
+            if row is None:
+                logger.debug('Disc %s not in the offline index', disc_id)
+                return None
+
+            (medium, position, title, artist, total_cds) = row
+            tracks = connection.execute(
+                'SELECT artist, title, length FROM tracks WHERE medium = ? ORDER BY position', (medium,)
+            ).fetchall()
+
+        if not tracks:
+            return None
+
+        disc_meta = {
+            'disc_id': disc_id,
+            'title': title,
+            'total_cds': total_cds,
+            'cd': position,
+            'tracks': [
+                {
+                    'artist': track_artist,
+                    'title': track_title,
+                    'duration': ((length or 0) // 1000) * SAMPLE_RATE
+                }
+                for (track_artist, track_title, length) in tracks
+            ]
+        }
+        if artist is not None:
+            disc_meta['artist'] = artist
+        disc_meta['duration'] = sum(track['duration'] for track in disc_meta['tracks'])
+
+        return disc_meta
+
+
+def import_musicbrainz_dump(dump_path, index_path, batch_size=10000):
+    """
+    Builds the offline index from an mbdump directory or the mbdump.tar.bz2
+    archive. Tables are streamed into a staging database in batches, so
+    memory use doesn't depend on the dump size, then joined into the index.
+    The index is replaced atomically when done.
+    """
+    index_path = Path(index_path)
+    if not index_path.parent.is_dir():
+        index_path.parent.mkdir(parents=True)
+    tmp_index_path = index_path.with_name(index_path.name + '.tmp')
+    staging_path = index_path.with_name(index_path.name + '.staging')
+    for path in (tmp_index_path, staging_path):
+        if path.exists():
+            path.unlink()
+
+    connection = sqlite3.connect(str(tmp_index_path))
+    try:
+        connection.execute('ATTACH DATABASE ? AS staging', (str(staging_path),))
+        connection.execute('PRAGMA staging.journal_mode = OFF')
+        connection.execute('PRAGMA staging.synchronous = OFF')
+        for (table, columns) in _DUMP_TABLES.items():
+            connection.execute('CREATE TABLE staging.%s (%s)' % (table, ', '.join(column for (_, column) in columns)))
+
+        for (table, lines) in _iter_dump_tables(Path(dump_path)):
+            logger.info('Importing %s', table)
+            _stage_table(connection, table, lines, batch_size)
+
+        logger.info('Building the index')
+        for statement in _STAGING_INDEXES + _INDEX_TABLES:
+            connection.execute(statement)
+        connection.commit()
+
+        connection.execute('DETACH DATABASE staging')
+        connection.execute('VACUUM')
+        disc_count = connection.execute('SELECT COUNT(*) FROM discs').fetchone()[0]
+    finally:
+        connection.close()
+        if staging_path.exists():
+            staging_path.unlink()
+
+    os.replace(str(tmp_index_path), str(index_path))
+    logger.info('Offline index of %s disc IDs written to %s', disc_count, index_path)
+    return disc_count
+
+
+def _iter_dump_tables(dump_path):
+    """Yields (table, lines) for the tables we need, in the order they're found."""
+    if dump_path.is_dir():
+        for table in _DUMP_TABLES:
+            table_path = dump_path.joinpath(table)
+            if not table_path.is_file():
+                table_path = dump_path.joinpath('mbdump', table)
+            with table_path.open('r', encoding='utf-8') as lines:
+                yield (table, lines)
+        return
+
+    with tarfile.open(str(dump_path), 'r|*') as archive:
+        for member in archive:
+            table = member.name.rsplit('/', 1)[-1]
+            if member.isfile() and member.name.startswith('mbdump/') and table in _DUMP_TABLES:
+                yield (table, (line.decode('utf-8') for line in archive.extractfile(member)))
+
+
+def _stage_table(connection, table, lines, batch_size):
+    columns = [index for (index, _) in _DUMP_TABLES[table]]
+    insert = 'INSERT INTO staging.%s VALUES (%s)' % (table, ', '.join('?' * len(columns)))
+
+    rows = (_parse_line(line, columns) for line in lines)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        connection.executemany(insert, batch)
+    connection.commit()
+
+
+def _parse_line(line, columns):
+    fields = line.rstrip('\n').split('\t')
+    return [_unescape(fields[index]) for index in columns]
+
+
+def _unescape(field):
+    """Reverses PostgreSQL COPY text escaping, \\N is NULL."""
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+
+    chars = []
+    escape = False
+    for char in field:
+        if escape:
+            chars.append({'t': '\t', 'n': '\n', 'r': '\r'}.get(char, char))
+            escape = False
+        elif char == '\\':
+            escape = True
+        else:
+            chars.append(char)
+    return ''.join(chars)
@@ -0,0 +1,66 @@
+import threading
+
+import numpy
+
+from ..constants import SAMPLE_RATE
+
+
+# with fewer tracks, unrelated discs match too easily
+_MIN_TRACKS = 3
+
+
+class TocFingerprintIndex(object):
+    """
+    Finds a disc by its track layout when its disc ID is unknown. Pressings
+    of an album often differ only in lead-out or pre-gaps. That changes the
+    disc ID, but the track count stays the same and each track length moves
+    by a second or two at most.
+
+    Fingerprints are track durations in PCM frames, the unit of `disc_meta`
+    durations, grouped by track count. A disc matches when every track is
+    within `tolerance` seconds; of several matches the closest one wins.
+    """
+    def __init__(self, tolerance):
+        self.tolerance = tolerance * SAMPLE_RATE
+
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._durations = {}
+        self._arrays = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(keys) for keys in self._keys.values())
+
+    def add(self, key, durations):
+        track_count = len(durations)
+        if track_count < _MIN_TRACKS:
+            return
+
+        with self._lock:
+            self._keys.setdefault(track_count, []).append(key)
+            self._durations.setdefault(track_count, []).append(durations)
+            self._arrays.pop(track_count, None)
+
+    def match(self, durations):
+        """Returns the key of the closest disc within tolerance, or None."""
+        track_count = len(durations)
+        if track_count < _MIN_TRACKS:
+            return None
+
+        with self._lock:
+            if track_count not in self._keys:
+                return None
+
+            if track_count not in self._arrays:
+                self._arrays[track_count] = numpy.array(self._durations[track_count], dtype=numpy.int64)
+            fingerprints = self._arrays[track_count]
+            keys = self._keys[track_count]
+
+        differences = numpy.abs(fingerprints - numpy.array(durations, dtype=numpy.int64))
+        within_tolerance = numpy.flatnonzero((differences <= self.tolerance).all(axis=1))
+        if not within_tolerance.size:
+            return None
+
+        closest = within_tolerance[differences[within_tolerance].sum(axis=1).argmin()]
+        return keys[closest]
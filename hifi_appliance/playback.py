@@ -3,6 +3,22 @@ import logging
 import time
 
 from .audio import MiniaudioSink
+from .audio import ReadAheadCache
+from .audio import ResampleCache
+from .config import CD_DEVICE
+from .config import MUSIC_PATH_NAME
+from .config import PLAY_QUEUE_PATH
+from .config import READAHEAD
+from .config import READAHEAD_CACHE_PATH
+from .config import READAHEAD_CACHE_SIZE
+from .config import READAHEAD_RATE
+from .config import RESAMPLE_CACHE_PATH
+from .config import RESAMPLE_CACHE_SIZE
+from .config import RESUME_PLAYBACK
+from .config import RESUME_POSITIONS_PATH
+from .config import RESUME_SAVE_INTERVAL
+from .config import SCAN_STEP_SECONDS
+from .constants import SAMPLE_RATE
 from .daemons import CdpDaemon
 from .message_bus import Receiver
 from .message_bus import Sender
@@ -10,6 +26,9 @@ from .message_bus import command_playback as channel_command
 from .message_bus import state as channel_state
 from .state import create_player
 from .state import PlayerStates
+from .state import PlayQueue
+from .state import ResumePositions
+from .util import is_network_filesystem
 
 
 logger = logging.getLogger(__name__)
@@ -18,11 +37,18 @@ logger = logging.getLogger(__name__)
 class PlaybackCommand(object):
     UNKNOWN_DISC = 'unknown_disc'
     START = 'start'
+    DISC_META_UPDATE = 'disc_meta_update'
+    PLAY_ALBUM = 'play_album'
+    QUEUE_ALBUM = 'queue_album'
+    QUEUE_CLEAR = 'queue_clear'
     PLAY = 'play'
     STOP = 'stop'
     PAUSE = 'pause'
     NEXT = 'next'
     PREV = 'prev'
+    SEEK = 'seek'
+    SCAN_FORWARD = 'scan_forward'
+    SCAN_BACKWARD = 'scan_backward'
     EJECT = 'eject'
     STATE = 'state'
 
@@ -30,6 +56,10 @@ class PlaybackCommand(object):
 class Playback(CdpDaemon):
     def __init__(self, daemon_config, debug=False):
         self.audio = None
+        self.readahead = None
+        self.resample_cache = None
+        # scan commands received while a scan's seek was buffering
+        self.scans_queued = None
 
         self.state_machine = create_player(
             self.create_audio,
@@ -37,7 +67,9 @@ class Playback(CdpDaemon):
             self.stop_audio,
             self.pause_audio,
             self.resume_audio,
-            self.on_player_state_change
+            self.on_player_state_change,
+            PlayQueue(PLAY_QUEUE_PATH),
+            ResumePositions(RESUME_POSITIONS_PATH, RESUME_SAVE_INTERVAL) if RESUME_PLAYBACK else None
         )
 
         super(Playback, self).__init__(daemon_config, debug)
@@ -60,6 +92,18 @@ class Playback(CdpDaemon):
 
         self.command_receiver = self.setup_command_receiver(channel_command)
 
+        if READAHEAD is True or READAHEAD == 'auto' and is_network_filesystem(MUSIC_PATH_NAME):
+            try:
+                self.readahead = ReadAheadCache(READAHEAD_CACHE_PATH, READAHEAD_CACHE_SIZE, READAHEAD_RATE)
+            except OSError:
+                logger.exception('Could not set up the read-ahead cache, reading tracks from %s', MUSIC_PATH_NAME)
+
+        if RESAMPLE_CACHE_PATH:
+            try:
+                self.resample_cache = ResampleCache(RESAMPLE_CACHE_PATH, RESAMPLE_CACHE_SIZE)
+            except OSError:
+                logger.exception('Could not set up the resample cache, resampled tracks are not kept')
+
         self.state_machine.init()
 
     def run(self):
@@ -77,11 +121,19 @@ class Playback(CdpDaemon):
 
         self.audio = MiniaudioSink(
             playback_stopped_callback = self.on_audio_stopped,
-            frames_played_callback = self.on_audio_frames
+            frames_played_callback = self.on_audio_frames,
+            resample_cache = self.resample_cache
         )
 
-    def buffer_track(self, track_file_name):
-        return self.audio.buffer_track(track_file_name)
+    def buffer_track(self, track_file_name, start_frame=0, album_changed=False):
+        if not self.readahead:
+            return self.audio.buffer_track(track_file_name, start_frame, album_changed)
+
+        local_path = self.readahead.local_path(track_file_name)
+        if local_path != track_file_name:
+            return self.audio.buffer_track(local_path, start_frame, album_changed)
+        with self.readahead.playback_read():
+            return self.audio.buffer_track(track_file_name, start_frame, album_changed)
 
     def resume_audio(self):
         self.audio.resume()
@@ -115,6 +167,8 @@ class Playback(CdpDaemon):
 
     def on_player_state_change(self):
         self.send_current_state()
+        if self.readahead:
+            self.readahead.prefetch(self.state_machine.upcoming_tracks())
 
     #
     # Ripper updates
@@ -125,6 +179,9 @@ class Playback(CdpDaemon):
             return
 
         ripping_state = json.loads(args[1])
+        if ripping_state.get('device', CD_DEVICE) != CD_DEVICE or self.state_machine.is_library_album():
+            return
+
         self.state_machine.ripper_update(ripping_state['track_list'])
 
         if self.state_machine.state == PlayerStates.WAITING_FOR_DATA:
@@ -141,6 +198,22 @@ class Playback(CdpDaemon):
         disc_meta = json.loads(args[1])
         self.state_machine.start(track_list, disc_meta)
 
+    def command_disc_meta_update(self, args):
+        self.state_machine.disc_meta_update(json.loads(args[0]))
+
+    def command_play_album(self, args):
+        track_list = json.loads(args[0])
+        disc_meta = json.loads(args[1])
+        self.state_machine.play_album(track_list, disc_meta)
+
+    def command_queue_album(self, args):
+        track_list = json.loads(args[0])
+        disc_meta = json.loads(args[1])
+        self.state_machine.queue_album(track_list, disc_meta)
+
+    def command_queue_clear(self, args):
+        self.state_machine.queue_clear()
+
     def command_eject(self, args):
         self.state_machine.eject()
 
@@ -162,6 +235,38 @@ class Playback(CdpDaemon):
     def command_prev(self, args):
         self.state_machine.prev()
 
+    def command_seek(self, args):
+        """Seeks to a position in seconds within the current track."""
+        self.state_machine.seek(int(float(args[0]) * SAMPLE_RATE))
+
+    def command_scan_forward(self, args):
+        self.scan(SCAN_STEP_SECONDS)
+
+    def command_scan_backward(self, args):
+        self.scan(-SCAN_STEP_SECONDS)
+
+    def scan(self, seconds):
+        """
+        A held key repeats faster than a seek buffers. The commands that
+        queued up meanwhile are handled right after the seek and the scans
+        among them counted and dropped, so scanning goes on as fast as seeks
+        can be done and stops when the key is let go.
+        """
+        if self.scans_queued is not None:
+            self.scans_queued += 1
+            return
+        if self.state_machine.current_frame is None:
+            return
+        self.state_machine.seek(self.state_machine.current_frame + seconds * SAMPLE_RATE)
+
+        self.scans_queued = 0
+        try:
+            self.command_receiver.flush()
+        finally:
+            (scans_queued, self.scans_queued) = (self.scans_queued, None)
+        if scans_queued:
+            logger.debug('Dropped %d scan commands that came in during the seek', scans_queued)
+
     #
     # Debug commands
 
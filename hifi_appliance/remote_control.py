@@ -20,9 +20,14 @@ REMOTE_KEY_TO_COMMAND = {
     'KEY_STOP': CdpCommand.STOP,
     'KEY_NEXT': CdpCommand.NEXT,
     'KEY_PREVIOUS': CdpCommand.PREV,
+    'KEY_FASTFORWARD': CdpCommand.SCAN_FORWARD,
+    'KEY_REWIND': CdpCommand.SCAN_BACKWARD,
     'KEY_EJECTCD': CdpCommand.EJECT,
 }
 
+# keys that keep going while held, one step per repeat
+REPEATED_KEYS = {'KEY_FASTFORWARD', 'KEY_REWIND'}
+
 REMOTE_NAME = 'denon'
 
 
@@ -60,7 +65,7 @@ class RemoteControl(CdpDaemon):
                 if key not in REMOTE_KEY_TO_COMMAND.keys():
                     logging.error('Received unregistered %s key' % key)
                     continue
-                if seq != '00':
+                if seq != '00' and key not in REPEATED_KEYS:
                     logging.debug('Ignoring repeated key press %s %s' % (key, seq))
                     continue
 
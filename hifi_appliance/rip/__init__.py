@@ -0,0 +1,5 @@
+from .accuraterip import accuraterip_disc_id
+from .accuraterip import AccurateRipDB
+from .accuraterip import TrackChecksum
+from .emphasis import DeEmphasisFilter
+from .paranoia import count_read_errors
@@ -0,0 +1,190 @@
+import logging
+from pathlib import Path
+import struct
+import zlib
+
+import numpy
+
+from ..constants import CHANNELS
+from ..constants import PCM_FRAMES_PER_CD_FRAME
+from ..constants import SAMPLE_WIDTH
+
+
+logger = logging.getLogger(__name__)
+
+
+# CD frames at the start of the first track and at the end of the last track
+# that AccurateRip leaves out of the checksum
+SKIPPED_CD_FRAMES = 5
+
+# libdiscid offsets include the 2 second lead-in
+LEAD_IN_CD_FRAMES = 150
+
+_FRAME_SIZE = CHANNELS * SAMPLE_WIDTH
+_SKIPPED_PCM_FRAMES = SKIPPED_CD_FRAMES * PCM_FRAMES_PER_CD_FRAME
+_UINT32_MASK = 0xffffffff
+
+_HEADER = struct.Struct('<BIII')
+_TRACK = struct.Struct('<BII')
+
+
+class TrackChecksum(object):
+    """
+    Streaming CRC32 and AccurateRip v1/v2 checksums of a single track.
+
+    PCM data (signed 16 bit little endian stereo, as read from the drive) is
+    fed in chunks of any size through `update()`. AccurateRip sums are computed
+    over each chunk with NumPy, so the cost per chunk is a handful of vector
+    operations rather than a Python loop over samples.
+    """
+    def __init__(self, first_track=False, last_track=False):
+        # positions are 1-based stereo frames, as in the AccurateRip algorithm
+        self.check_from = _SKIPPED_PCM_FRAMES if first_track else 1
+        self.holdback = _SKIPPED_PCM_FRAMES * _FRAME_SIZE if last_track else 0
+
+        self.frames = 0
+        self._pending = b''
+        self._crc32 = 0
+        self._v1 = 0
+        self._v2 = 0
+
+    def update(self, data):
+        self._crc32 = zlib.crc32(data, self._crc32)
+
+        pending = self._pending + data
+        usable = (len(pending) - self.holdback) // _FRAME_SIZE * _FRAME_SIZE
+        if usable <= 0:
+            self._pending = pending
+            return
+
+        self._pending = pending[usable:]
+        self._sum_frames(numpy.frombuffer(pending, dtype='<u4', count=usable // _FRAME_SIZE))
+
+    def _sum_frames(self, samples):
+        first_position = self.frames + 1
+        self.frames += len(samples)
+
+        skip = max(0, self.check_from - first_position)
+        if skip >= len(samples):
+            return
+
+        positions = numpy.arange(first_position + skip, self.frames + 1, dtype=numpy.uint64)
+        products = samples[skip:].astype(numpy.uint64) * positions
+
+        # uint64 sums wrap modulo 2^64 which keeps them exact modulo 2^32
+        self._v1 = (self._v1 + int(products.sum())) & _UINT32_MASK
+        self._v2 = (
+            self._v2 + int((products >> numpy.uint64(32)).sum()) + int((products & numpy.uint64(_UINT32_MASK)).sum())
+        ) & _UINT32_MASK
+
+    @property
+    def crc32(self):
+        return self._crc32 & _UINT32_MASK
+
+    @property
+    def v1(self):
+        return self._v1
+
+    @property
+    def v2(self):
+        return self._v2
+
+    def as_dict(self):
+        return {
+            'crc32': '%08x' % self.crc32,
+            'accuraterip_v1': '%08x' % self.v1,
+            'accuraterip_v2': '%08x' % self.v2
+        }
+
+
+def accuraterip_disc_id(toc):
+    """
+    Computes the AccurateRip identifiers (track count, disc ID 1, disc ID 2
+    and FreeDB ID) for a disc TOC as returned by `read_disc_toc()`.
+    """
+    disc_id_1 = 0
+    disc_id_2 = 0
+
+    offsets = [offset - LEAD_IN_CD_FRAMES for offset in toc['offsets']]
+    for track_number, offset in enumerate(offsets, 1):
+        disc_id_1 += offset
+        disc_id_2 += max(offset, 1) * track_number
+
+    leadout = toc['leadout'] - LEAD_IN_CD_FRAMES
+    disc_id_1 += leadout
+    disc_id_2 += leadout * (len(offsets) + 1)
+
+    return (
+        len(offsets),
+        disc_id_1 & _UINT32_MASK,
+        disc_id_2 & _UINT32_MASK,
+        int(toc['freedb_id'], 16)
+    )
+
+
+class AccurateRipDB(object):
+    """
+    Local AccurateRip database: a directory of `dBAR-*.bin` files in the format
+    served by accuraterip.com, either flat or in its nested a/b/c/ layout.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _find_file(self, ar_id):
+        (track_count, disc_id_1, disc_id_2, freedb_id) = ar_id
+        file_name = 'dBAR-%03d-%08x-%08x-%08x.bin' % (track_count, disc_id_1, disc_id_2, freedb_id)
+        nested = '%x/%x/%x' % (disc_id_1 & 0xf, disc_id_1 >> 4 & 0xf, disc_id_1 >> 8 & 0xf)
+
+        for candidate in (self.path.joinpath(file_name), self.path.joinpath(nested, file_name)):
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def lookup(self, toc):
+        ar_id = accuraterip_disc_id(toc)
+        db_file = self._find_file(ar_id)
+        if not db_file:
+            logger.info('Disc not present in the local AccurateRip database')
+            return None
+
+        try:
+            return AccurateRipEntry(ar_id, db_file.read_bytes())
+        except struct.error:
+            logger.error('Malformed AccurateRip database file %s', db_file)
+            return None
+
+
+class AccurateRipEntry(object):
+    """All pressings of a single disc as stored in an AccurateRip file."""
+
+    def __init__(self, ar_id, data):
+        self.ar_id = ar_id
+        self.pressings = []
+
+        pos = 0
+        while pos < len(data):
+            (track_count, disc_id_1, disc_id_2, freedb_id) = _HEADER.unpack_from(data, pos)
+            pos += _HEADER.size
+
+            tracks = []
+            for _ in range(track_count):
+                (confidence, crc, _crc450) = _TRACK.unpack_from(data, pos)
+                pos += _TRACK.size
+                tracks.append((confidence, crc))
+
+            if (track_count, disc_id_1, disc_id_2, freedb_id) == ar_id:
+                self.pressings.append(tracks)
+
+    def verify(self, track_number, checksum):
+        """
+        Returns the highest confidence among the pressings matching either
+        checksum of the track, 0 when none matches.
+        """
+        confidence = 0
+        for tracks in self.pressings:
+            if track_number > len(tracks):
+                continue
+            (track_confidence, crc) = tracks[track_number - 1]
+            if crc in (checksum.v1, checksum.v2):
+                confidence = max(confidence, track_confidence)
+        return confidence
@@ -0,0 +1,85 @@
+import math
+
+import numpy
+
+from ..constants import CHANNELS
+from ..constants import SAMPLE_RATE
+from ..constants import SAMPLE_WIDTH
+
+
+# time constants of the Red Book pre-emphasis curve, a shelf between 3.2 kHz
+# and 10.6 kHz that boosts the treble by 10 dB
+EMPHASIS_POLE_SECONDS = 50e-6
+EMPHASIS_ZERO_SECONDS = 15e-6
+
+_FRAME_SIZE = CHANNELS * SAMPLE_WIDTH
+
+# powers of the pole smaller than this don't change a 16 bit sample
+_NEGLIGIBLE = 1e-30
+
+
+def de_emphasis_coefficients(sample_rate=SAMPLE_RATE):
+    """
+    (b0, b1, pole) of the first order filter undoing pre-emphasis:
+    y[n] = b0 * x[n] + b1 * x[n - 1] + pole * y[n - 1]. Pole and zero are
+    mapped from the analog curve by the matched z-transform and the gain
+    is unity at DC; at 44.1 kHz that's within 0.4 dB of the curve up to
+    20 kHz, where the bilinear transform is off by 1 dB.
+    """
+    pole = math.exp(-1 / (EMPHASIS_POLE_SECONDS * sample_rate))
+    zero = math.exp(-1 / (EMPHASIS_ZERO_SECONDS * sample_rate))
+    gain = (1 - pole) / (1 - zero)
+    return (gain, -gain * zero, pole)
+
+
+class DeEmphasisFilter(object):
+    """
+    Streaming de-emphasis of a track read from a disc with the PRE_EMPHASIS
+    flag, so the treble boost isn't ripped into the library.
+
+    PCM data (signed 16 bit little endian stereo) is fed in chunks of any
+    size through `process()`, which returns the filtered frames done so far;
+    `flush()` returns what's left. The recursive part of the filter is
+    unrolled into a handful of NumPy passes over the whole chunk: after the
+    pass with shift s each output holds the last 2s inputs weighted by powers
+    of the pole, and the pole is small enough that those powers vanish within
+    a few hundred samples.
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        (self.b0, self.b1, self.pole) = de_emphasis_coefficients(sample_rate)
+
+        self._pending = b''
+        self._last_input = numpy.zeros(CHANNELS)
+        self._last_output = numpy.zeros(CHANNELS)
+
+    def process(self, data):
+        pending = self._pending + data
+        usable = len(pending) // _FRAME_SIZE * _FRAME_SIZE
+        self._pending = pending[usable:]
+        if not usable:
+            return b''
+
+        samples = numpy.frombuffer(pending, dtype='<i2', count=usable // SAMPLE_WIDTH).reshape(-1, CHANNELS)
+        filtered = self._filter(samples.astype(numpy.float64))
+        return numpy.clip(numpy.rint(filtered), -32768, 32767).astype('<i2').tobytes()
+
+    def flush(self):
+        """A trailing partial frame, passed through as it is."""
+        (pending, self._pending) = (self._pending, b'')
+        return pending
+
+    def _filter(self, x):
+        output = self.b0 * x
+        output[1:] += self.b1 * x[:-1]
+        output[0] += self.b1 * self._last_input + self.pole * self._last_output
+
+        weight = self.pole
+        shift = 1
+        while shift < len(output) and weight > _NEGLIGIBLE:
+            output[shift:] += weight * output[:-shift]
+            weight *= weight
+            shift *= 2
+
+        self._last_input = x[-1].copy()
+        self._last_output = output[-1].copy()
+        return output
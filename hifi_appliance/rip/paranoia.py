@@ -0,0 +1,32 @@
+import re
+
+
+# Callback codes printed by `cd-paranoia -e` (see cdda_paranoia.h) that mean
+# the drive returned data paranoia had to patch up or could not read at all
+PARANOIA_CB_SCRATCH = 4
+PARANOIA_CB_REPAIR = 5
+PARANOIA_CB_SKIP = 6
+PARANOIA_CB_FIXUP_DROPPED = 10
+PARANOIA_CB_FIXUP_DUPED = 11
+PARANOIA_CB_READERR = 12
+
+READ_ERROR_CODES = (
+    PARANOIA_CB_SCRATCH,
+    PARANOIA_CB_REPAIR,
+    PARANOIA_CB_SKIP,
+    PARANOIA_CB_FIXUP_DROPPED,
+    PARANOIA_CB_FIXUP_DUPED,
+    PARANOIA_CB_READERR,
+)
+
+_PROGRESS_RE = re.compile(r'^##: (-?\d+) \[[^\]]*\] @ (\d+)')
+
+
+def count_read_errors(progress_lines):
+    """Counts the read problems reported in `cd-paranoia -e` output."""
+    errors = 0
+    for line in progress_lines:
+        m = _PROGRESS_RE.match(line)
+        if m and int(m.group(1)) in READ_ERROR_CODES:
+            errors += 1
+    return errors
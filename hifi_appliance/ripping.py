@@ -1,87 +1,262 @@
 from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
+from pathlib import Path
 import shutil
 import subprocess
 import tempfile
 import time
 
+from .config import ACCURATERIP_DB_PATH
+from .config import CD_DEVICE
+from .config import CD_DEVICES
+from .config import CD_READ_OFFSET
+from .config import RIP_DE_EMPHASIS
+from .config import RIP_ENCODER_WORKERS
+from .config import RIP_FAST_PARANOIA_ARGS
+from .config import RIP_SECURE_PARANOIA_ARGS
+from .config import RIP_STRATEGY
+from .constants import CD_FRAMES_PER_SECOND
+from .constants import CHANNELS
+from .constants import PCM_FRAMES_PER_CD_FRAME
+from .constants import SAMPLE_RATE
+from .constants import SAMPLE_WIDTH
 from .daemons import CdpDaemon
+from .disc import read_disc_toc
 from .message_bus import Receiver
 from .message_bus import Sender
 from .message_bus import command_ripping as channel_command
 from .message_bus import state as channel_state
 from .meta import write_meta
+from .rip import AccurateRipDB
+from .rip import count_read_errors
+from .rip import DeEmphasisFilter
+from .rip import TrackChecksum
 from .state import create_ripper
 
 
 logger = logging.getLogger(__name__)
 
 
+# one second of CD audio per read from cd-paranoia
+_READ_CHUNK_SIZE = CD_FRAMES_PER_SECOND * PCM_FRAMES_PER_CD_FRAME * CHANNELS * SAMPLE_WIDTH
+
+CHECKSUMS_FILE_NAME = '.checksums'
+
+
+class RipStrategy(object):
+    ADAPTIVE = 'adaptive'
+    SECURE = 'secure'
+
+
 class RippingCommand(object):
     START = 'start'
+    DISC_META_UPDATE = 'disc_meta_update'
     KNOWN_DISC = 'known_disc'
+    EJECT = 'eject'
     STATE = 'state'
 
 
-class Ripping(CdpDaemon):
-    def __init__(self, daemon_config, debug=False):
+def get_rip_devices():
+    """The playback drive followed by any extra bulk-ingest drives."""
+    return [CD_DEVICE] + [device for device in CD_DEVICES if device != CD_DEVICE]
+
+
+class DriveRipper(object):
+    """
+    Rip pipeline of a single CD drive: its own state machine, reader thread
+    and AccurateRip state. FLAC encoding is handed to the encoder pool shared
+    by all drives.
+    """
+    def __init__(self, device, encoder_executor, state_change_callback, add_callback):
+        self.device = device
+        self.encoder_executor = encoder_executor
+        self.state_change_callback = state_change_callback
+        # runs a function on the daemon's io_loop, where commands are handled
+        self.add_callback = add_callback
+
         self.state_machine = create_ripper(
             self.grab_and_convert_track,
             self.create_folder,
             write_meta,
             self.move_track,
             self.write_disc_id,
+            self.rename,
             self.on_state_change
         )
 
         self.ripper_executor = None
+        self.accuraterip_entry = None
+        self.track_checksums = {}
+        # FLAC encodes of tracks read ahead, by track number
+        self.encoding = {}
 
-        super(Ripping, self).__init__(daemon_config, debug)
+    def get_full_state(self):
+        full_state = self.state_machine.get_full_state()
+        full_state['device'] = self.device
+        return full_state
 
-    def setup_postfork(self):
-        self.state_sender = Sender(
-            channel_state,
-            name='ripping',
-            io_loop=self.io_loop
-        )
+    def start(self, disc_meta):
+        self.ripper_executor = ThreadPoolExecutor(max_workers=1)
+        self.accuraterip_entry = None
+        self.track_checksums = {}
+        self.discard_encoding()
+        track_count = len(disc_meta['tracks'])
+        self.state_machine.start(disc_meta)
+        self.ripper_executor.submit(self.rip_disc, track_count)
 
-        self.command_receiver = self.setup_command_receiver(channel_command)
+    def known_disc(self):
+        self.state_machine.known_disc()
+        self.release_ingest_drive()
 
-    def run(self):
-        # for i in range(15):
-        #     self.io_loop.add_timeout(time.time() + i, self.send_current_state)
+    def update_disc_meta(self, disc_meta):
+        if not self.state_machine.disc_meta_update(disc_meta):
+            logger.warning('Ignoring meta update for disc in %s, tracks don\'t match', self.device)
 
-        self.io_loop.start()
+    def eject(self):
+        if self.ripper_executor:
+            self.ripper_executor.shutdown(wait=False)
+            self.ripper_executor = None
+        self.discard_encoding()
+        self.state_machine.eject()
 
-    def send_current_state(self):
-        self.state_sender.send(json.dumps(self.state_machine.get_full_state()))
+    def discard_encoding(self):
+        """FLAC files of tracks read ahead for a disc that's gone are deleted."""
+        for encoding in self.encoding.values():
+            encoding.add_done_callback(_delete_encoded)
+        self.encoding = {}
 
     def rip_disc(self, track_count):
         try:
+            self.load_accuraterip_entry()
             for i in range(track_count):
                 self.state_machine.rip_track()
             self.state_machine.finish()
-            logger.info('Disc successfully ripped')
+            logger.info('Disc in %s successfully ripped', self.device)
         except:
             logger.exception('Oops, something went wrong')
+            return
+
+        self.release_ingest_drive()
+
+    def release_ingest_drive(self):
+        """Ingest drives aren't used for playback: free them for the next disc."""
+        if self.device != CD_DEVICE:
+            subprocess.call(['eject', self.device])
+            # like an EJECT command, on the io_loop rather than the reader
+            # thread that's finishing
+            self.add_callback(self.eject)
 
     #
     # Interface with the world
 
+    def load_accuraterip_entry(self):
+        # Commander passes along the TOC it read on insert, only re-read the
+        # disc for meta that came without one
+        toc = self.state_machine.disc_meta.get('toc') or read_disc_toc(self.device)
+        if toc:
+            self.accuraterip_entry = AccurateRipDB(ACCURATERIP_DB_PATH).lookup(toc)
+
     def grab_and_convert_track(self, track_number):
-        (_, tmp_filename) = tempfile.mkstemp()
+        """
+        Returns the FLAC file of a track. The next track is read while this
+        one is encoded, so the drive keeps reading while the encoder pool
+        works; the file is only waited for when it's about to be moved
+        into the library.
+        """
+        encoding = self.encoding.pop(track_number, None) or self.grab_track(track_number)
+        if track_number < len(self.state_machine.disc_meta['tracks']):
+            self.encoding[track_number + 1] = self.grab_track(track_number + 1)
+        return encoding.result()
+
+    def grab_track(self, track_number):
+        """Reads and checks a track, returns the future of its FLAC file."""
+        track_meta = self.state_machine.disc_meta['tracks'][track_number - 1]
+        de_emphasis = RIP_DE_EMPHASIS and bool(track_meta.get('pre_emphasis'))
+
+        if RIP_STRATEGY == RipStrategy.SECURE:
+            (pcm_filename, checksum, errors) = self.read_track(track_number, RIP_SECURE_PARANOIA_ARGS, de_emphasis)
+        else:
+            # Adaptive: most discs read cleanly, so read fast first and only pay
+            # for full paranoia on tracks that show read errors or don't verify
+            (pcm_filename, checksum, errors) = self.read_track(track_number, RIP_FAST_PARANOIA_ARGS, de_emphasis)
+            confidence = self.verify_checksum(track_number, checksum)
 
-        cd_paranoia = subprocess.Popen(['cd-paranoia', '-S', '4', '-q', str(track_number), '-'], stdout=subprocess.PIPE)
-        ffmpeg = subprocess.Popen(
-            ['ffmpeg', '-loglevel', 'quiet', '-y', '-i', '-','-f', 'flac', tmp_filename],
-            stdin=cd_paranoia.stdout,
-            stdout=subprocess.PIPE
+            if errors or confidence == 0:
+                logger.warning(
+                    'Fast read of track %s not trusted (%s read errors, AccurateRip confidence %s), re-reading securely',
+                    track_number, errors, confidence
+                )
+                Path(pcm_filename).unlink()
+                (pcm_filename, checksum, errors) = self.read_track(track_number, RIP_SECURE_PARANOIA_ARGS, de_emphasis)
+
+        self.record_checksum(track_number, checksum, errors)
+        if de_emphasis:
+            # the checksums are of the audio as read, the FLAC isn't
+            self.track_checksums[track_number]['de_emphasized'] = True
+
+        return self.encoder_executor.submit(encode_track, pcm_filename)
+
+    def read_track(self, track_number, paranoia_args, de_emphasis=False):
+        """
+        Reads a track into a raw PCM file, checksumming it on the way. With
+        `de_emphasis` the file gets the audio with the treble boost of
+        emphasized discs undone, the checksums are still of what was read.
+        """
+        (_, pcm_filename) = tempfile.mkstemp()
+        track_count = len(self.state_machine.disc_meta['tracks'])
+        de_emphasis_filter = DeEmphasisFilter() if de_emphasis else None
+
+        checksum = TrackChecksum(
+            first_track=track_number == 1,
+            last_track=track_number == track_count
         )
-        cd_paranoia.stdout.close()
-        out, err = ffmpeg.communicate()
 
-        return tmp_filename
+        with open(pcm_filename, 'wb') as pcm_file, tempfile.TemporaryFile(mode='w+') as progress_log:
+            cd_paranoia = subprocess.Popen(
+                ['cd-paranoia', '-d', self.device] + paranoia_args +
+                ['-e', '-r', '-O', str(CD_READ_OFFSET), str(track_number), '-'],
+                stdout=subprocess.PIPE,
+                stderr=progress_log
+            )
+
+            while True:
+                chunk = cd_paranoia.stdout.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                checksum.update(chunk)
+                if de_emphasis_filter:
+                    chunk = de_emphasis_filter.process(chunk)
+                pcm_file.write(chunk)
+
+            cd_paranoia.wait()
+            if de_emphasis_filter:
+                pcm_file.write(de_emphasis_filter.flush())
+
+            progress_log.seek(0)
+            errors = count_read_errors(progress_log)
+
+        return (pcm_filename, checksum, errors)
+
+    def verify_checksum(self, track_number, checksum):
+        """Returns AccurateRip confidence, None when the disc isn't in the database."""
+        if not self.accuraterip_entry:
+            return None
+        return self.accuraterip_entry.verify(track_number, checksum)
+
+    def record_checksum(self, track_number, checksum, errors):
+        self.track_checksums[track_number] = checksum.as_dict()
+        self.track_checksums[track_number]['read_errors'] = errors
+
+        confidence = self.verify_checksum(track_number, checksum)
+        if confidence is None:
+            return
+
+        self.track_checksums[track_number]['accuraterip_confidence'] = confidence
+        if confidence:
+            logger.info('Track %s accurately ripped (confidence %s)', track_number, confidence)
+        else:
+            logger.warning('Track %s does not match the AccurateRip database', track_number)
 
     def create_folder(self, folder_path):
         if not folder_path.is_dir():
@@ -95,8 +270,16 @@ class Ripping(CdpDaemon):
         shutil.copy(source_path, target_path)
         source_path.unlink()
 
+    def rename(self, source_path, target_path):
+        if not target_path.parent.is_dir():
+            target_path.parent.mkdir(parents=True)
+        source_path.rename(target_path)
+
     def write_disc_id(self, path, disc_id):
         path.write_text(disc_id)
+        path.with_name(CHECKSUMS_FILE_NAME).write_text(
+            json.dumps(self.track_checksums, indent=2, sort_keys=True)
+        )
 
     def clean_up_on_fail(self):
         pass
@@ -106,26 +289,107 @@ class Ripping(CdpDaemon):
     # State machine events
 
     def on_state_change(self):
-        self.send_current_state()
+        self.state_change_callback(self)
+
+
+def encode_track(pcm_filename):
+    """Encodes a raw PCM file to FLAC, runs in the shared encoder pool."""
+    (_, tmp_filename) = tempfile.mkstemp()
+
+    try:
+        subprocess.run(
+            [
+                'ffmpeg', '-loglevel', 'quiet', '-y',
+                '-f', 's16le', '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE), '-i', pcm_filename,
+                '-f', 'flac', tmp_filename
+            ],
+            stdin=subprocess.DEVNULL,
+            check=True
+        )
+    except subprocess.CalledProcessError:
+        # a truncated FLAC must not be moved into the library
+        Path(tmp_filename).unlink()
+        raise
+    finally:
+        Path(pcm_filename).unlink()
+
+    return tmp_filename
+
+
+def _delete_encoded(encoding):
+    if encoding.exception() is None:
+        Path(encoding.result()).unlink()
+
+
+class Ripping(CdpDaemon):
+    def __init__(self, daemon_config, debug=False):
+        self.encoder_executor = ThreadPoolExecutor(max_workers=RIP_ENCODER_WORKERS)
+
+        self.drives = {
+            device: DriveRipper(device, self.encoder_executor, self.on_state_change, self.add_callback)
+            for device in get_rip_devices()
+        }
+
+        super(Ripping, self).__init__(daemon_config, debug)
+
+    def setup_postfork(self):
+        self.state_sender = Sender(
+            channel_state,
+            name='ripping',
+            io_loop=self.io_loop
+        )
+
+        self.command_receiver = self.setup_command_receiver(channel_command)
+
+    def run(self):
+        # for i in range(15):
+        #     self.io_loop.add_timeout(time.time() + i, self.send_current_state)
+
+        self.io_loop.start()
+
+    def add_callback(self, callback, *args):
+        self.io_loop.add_callback(callback, *args)
+
+    def send_current_state(self, drive):
+        self.state_sender.send(json.dumps(drive.get_full_state()))
+
+    def get_drive(self, args, device_arg_index):
+        """Commands name the drive as their last argument, CD_DEVICE when absent."""
+        device = args[device_arg_index].decode('ascii') if len(args) > device_arg_index else CD_DEVICE
+        if device not in self.drives:
+            logger.error('Received command for unconfigured drive %s', device)
+            return None
+        return self.drives[device]
+
+    #
+    # State machine events
+
+    def on_state_change(self, drive):
+        self.send_current_state(drive)
 
     #
     # Receive commands
 
     def command_start(self, args):
-        self.ripper_executor = ThreadPoolExecutor(max_workers=1)
-        disc_meta = json.loads(args[0])
-        track_count = len(disc_meta['tracks'])
-        self.state_machine.start(disc_meta)
-        self.ripper_executor.submit(self.rip_disc, track_count)
+        drive = self.get_drive(args, 1)
+        if drive:
+            drive.start(json.loads(args[0]))
+
+    def command_disc_meta_update(self, args):
+        drive = self.get_drive(args, 1)
+        if drive:
+            drive.update_disc_meta(json.loads(args[0]))
 
     def command_known_disc(self, args):
-        self.state_machine.known_disc()
+        drive = self.get_drive(args, 0)
+        if drive:
+            drive.known_disc()
 
     def command_eject(self, args):
-        if self.ripper_executor:
-            self.ripper_executor.shutdown(wait=False)
-            self.ripper_executor = None
-        self.state_machine.eject()
+        drive = self.get_drive(args, 0)
+        if drive:
+            drive.eject()
 
     def command_state(self, args):
-        self.send_current_state()
+        for drive in self.drives.values():
+            self.send_current_state(drive)
@@ -1,4 +1,7 @@
 from .player import create_player
+from .player import Sources as PlayerSources
 from .player import States as PlayerStates
+from .positions import ResumePositions
+from .queue import PlayQueue
 from .ripper import create_ripper
-from .ripper import States as RipperStates
\ No newline at end of file
+from .ripper import States as RipperStates
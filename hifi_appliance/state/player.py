@@ -6,6 +6,7 @@ from transitions import Machine
 
 from ..constants import NEXT_TRACK_BUFFER_THRESHOLD_SECONDS
 from ..constants import SAMPLE_RATE
+from .queue import PlayQueue
 
 
 logger = logging.getLogger(__name__)
@@ -31,11 +32,21 @@ class Triggers(object):
 	PAUSE = 'pause'
 	NEXT = 'next'
 	PREV = 'prev'
+	SEEK = 'seek'  # to a frame of the current track
 	FINISH = 'finish'  # called when audio ran out of frames
 	RIPPER_UPDATE = 'ripper_update'
+	DISC_META_UPDATE = 'disc_meta_update'  # better meta arrived after START
+	PLAY_ALBUM = 'play_album'  # album from the library, no disc needed
+	QUEUE_ALBUM = 'queue_album'  # library album to play after the current one
+	QUEUE_CLEAR = 'queue_clear'
 	EJECT = 'eject'
 
 
+class Sources(object):
+	DISC = 'disc'
+	LIBRARY = 'library'
+
+
 class Player(object):
 	def __init__(
 		self,
@@ -44,9 +55,14 @@ class Player(object):
 		stop_audio_func,
 		pause_playback_func,
 		resume_playback_func,
-		after_state_change_callback
+		after_state_change_callback,
+		play_queue=None,
+		resume_positions=None
 	):
 
+		self.play_queue = play_queue if play_queue is not None else PlayQueue()
+		self.resume_positions = resume_positions
+
 		self.create_audio_func = create_audio_func
 		self.buffer_track_func = buffer_track_func
 		self.stop_audio_func = stop_audio_func
@@ -60,20 +76,26 @@ class Player(object):
 		self._clear_internal_state()
 
 	def _clear_internal_state(self):
+		self.source = None
 		self.track_list = []
 		self.disc_meta = {}
 
 		self.current_track = 1
+		self.resume_frame = 0
 		self._clear_track_progress()
 
 	def _clear_track_progress(self):
 		self.current_frame = None
 		self.total_frames = None
 		self.next_track_frames = None
+		# the queued album the next track buffered starts, see `next_track()`
+		self.next_album = None
 
 	def get_full_state(self):
 		return {
 			'state': self.state.value,
+			'source': self.source,
+			'queue': self.play_queue.disc_ids(),
 			'track_list': self.track_list,
 			'disc_meta': self.disc_meta,
 			'current_track': self.current_track,
@@ -94,32 +116,55 @@ class Player(object):
 		return track_number <= len(self.track_list)
 
 	def is_next_flac_available(self):
+		if self._is_last_track():
+			return self.play_queue.peek() is not None
 		return self.is_flac_available(self.current_track + 1)
 
 	def is_prev_flac_available(self):
 		return self.is_flac_available(self.current_track - 1)
 
+	def is_library_album(self, *args):
+		'''Also a condition of triggers with arguments.'''
+		return self.source == Sources.LIBRARY
+
+	def upcoming_tracks(self):
+		'''Track files of the rest of the album and of the next queued one.'''
+		upcoming = list(self.track_list[self.current_track - 1:])
+		next_album = self.play_queue.peek()
+		if next_album:
+			upcoming += next_album[0]
+		return upcoming
+
+	def has_queued_album(self):
+		return self.play_queue.current is not None or self.play_queue.peek() is not None
+
 	#
 	# External interface (callbacks)
 
-	def start_playback(self):
+	def start_playback(self, start_frame=0):
 		'''Creates a new audio device and sets it up. Called once for a
-		continuous playback stream.'''
-		self.current_frame = 0
-		self.create_audio_func()
-
-		self.total_frames = self.buffer_track_func(
-			self.track_list[self.current_track - 1]
-		)
+		continuous playback stream. Frames are counted from the start of
+		the track, also when the stream starts further in.'''
+		self._start_stream(start_frame)
+		self.resume_playback_func()
 
+	def seek_playback(self, frame):
+		'''Starts a new stream at `frame`, within the current track.'''
+		self._seek(frame)
 		self.resume_playback_func()
 
+	def seek_paused(self, frame):
+		'''Buffers a new stream at `frame`, played once resumed.'''
+		self._seek(frame)
+
 	def stop_playback(self):
 		self.stop_audio_func()
+		self.remember_position(save=True)
 		self._clear_track_progress()
 
 	def pause_playback(self):
 		self.pause_playback_func()
+		self.remember_position(save=True)
 
 	def resume_playback(self):
 		self.resume_playback_func()
@@ -130,43 +175,137 @@ class Player(object):
 	#
 	# Internal state changes
 
+	def _seek(self, frame):
+		frame = max(0, min(frame, self.total_frames - 1))
+		self.stop_audio_func()
+		self.next_track_frames = None
+		self.next_album = None
+		self._start_stream(frame)
+
+	def _start_stream(self, start_frame):
+		'''A new audio device is paused until told to play.'''
+		if not start_frame:
+			(start_frame, self.resume_frame) = (self.resume_frame, 0)
+		self.current_frame = start_frame
+		self.create_audio_func()
+
+		track_file_name = self.track_list[self.current_track - 1]
+		if start_frame:
+			self.total_frames = start_frame + self.buffer_track_func(track_file_name, start_frame)
+		else:
+			self.total_frames = self.buffer_track_func(track_file_name)
+
 	def set_disc_meta(self, track_list, disc_meta):
+		self.source = Sources.DISC
 		self.track_list = track_list
 		self.disc_meta = disc_meta
+		self.play_queue.set_current(None)
+		self.load_position()
+
+	def replace_album(self, track_list, disc_meta):
+		'''A disc inserted while a library album is loaded takes its place.'''
+		self.stop_playback()
+		self._clear_internal_state()
+		self.set_disc_meta(track_list, disc_meta)
+
+	def start_album(self, track_list, disc_meta):
+		'''Plays a ripped album from the start. All its tracks are there, so
+		it plays like a disc that's done ripping.'''
+		self.stop_playback()
+		self._clear_internal_state()
+		self._set_library_album((track_list, disc_meta))
+		self.start_playback()
+
+	def _set_library_album(self, album):
+		self.source = Sources.LIBRARY
+		(self.track_list, self.disc_meta) = album
+		self.current_track = 1
+		self.play_queue.set_current(album)
+
+	def enqueue_album(self, track_list, disc_meta):
+		self.play_queue.append(track_list, disc_meta)
+
+	def enqueue_and_load_album(self, track_list, disc_meta):
+		'''With nothing loaded, a queued album is loaded right away.'''
+		self._clear_internal_state()
+		self.play_queue.append(track_list, disc_meta)
+		self.load_queued_album()
+
+	def load_queued_album(self):
+		'''After a restart: the album that was playing, else the next one.'''
+		album = self.play_queue.current
+		if album is None:
+			album = self.play_queue.pop()
+		self._set_library_album(album)
+		self.load_position()
+
+	def clear_queue(self):
+		self.play_queue.clear()
+
+	def forget_album(self):
+		self.play_queue.set_current(None)
+
+	def update_disc_meta(self, disc_meta):
+		self.disc_meta = disc_meta
 
 	def next_track(self):
-		self.current_track += 1
+		'''The next track may be the first one of the next queued album.
+		When that album was buffered already it's the one played, even if
+		the queue was changed or cleared since.'''
+		self.resume_frame = 0
+		if self._is_last_track():
+			self.forget_position()
+			(album, self.next_album) = (self.next_album, None)
+			if album is None or album is self.play_queue.peek():
+				album = self.play_queue.pop()
+			self._set_library_album(album)
+		else:
+			self.current_track += 1
+
+	def _is_last_track(self):
+		return self.current_track >= len(self.disc_meta['tracks'])
+
+	def _next_track_file(self):
+		if self._is_last_track():
+			return self.play_queue.peek()[0][0]
+		return self.track_list[self.current_track]
 
 	def prev_track(self):
+		self.resume_frame = 0
 		self.current_track -= 1
 
 	def has_prev_track(self):
 		return self.current_track > 1
 
 	def has_next_track(self):
-		return self.current_track < len(self.disc_meta['tracks'])
+		return not self._is_last_track() or self.play_queue.peek() is not None
 
 	def update_position(self, frames):
 		self.current_frame += frames
 
 		try:
 			if self.buffering_lock.acquire(blocking=False):
-				next_track_index = self.current_track
-				next_track_number = self.current_track + 1
-
-				if self._should_buffer_next_track() and self.is_flac_available(next_track_number):
-					self.next_track_frames = self.buffer_track_func(
-						self.track_list[next_track_index]
-					)
+				if self._should_buffer_next_track() and self.is_next_flac_available():
+					self.next_track_frames = self._buffer_next_track()
 
 				if self._track_changed():
 					self.current_frame -= self.total_frames
 					self.total_frames = self.next_track_frames
 					self.next_track_frames = None
-					self.current_track += 1
+					self.next_track()
 		finally:
 			self.buffering_lock.release()
 
+		self.remember_position()
+
+	def _buffer_next_track(self):
+		'''The audio is told when the next track starts the next queued
+		album, the transition into it may differ.'''
+		if self._is_last_track():
+			self.next_album = self.play_queue.peek()
+			return self.buffer_track_func(self.next_album[0][0], album_changed=True)
+		return self.buffer_track_func(self._next_track_file())
+
 	def _should_buffer_next_track(self):
 		already_buffered = self.next_track_frames is not None
 		remaining_frames = self.total_frames - self.current_frame
@@ -182,6 +321,41 @@ class Player(object):
 		if track_list:
 			self.track_list = track_list
 
+	#
+	# Resume positions
+
+	def _resumable_disc_id(self):
+		if self.resume_positions is None or not self.disc_meta:
+			return None
+		return self.disc_meta.get('disc_id')
+
+	def remember_position(self, save=False):
+		'''Kept while playing, written at most every few seconds unless
+		`save`d right away.'''
+		disc_id = self._resumable_disc_id()
+		if disc_id and self.current_frame is not None:
+			self.resume_positions.update(disc_id, self.current_track, self.current_frame, save)
+
+	def forget_position(self):
+		'''A finished album starts over next time.'''
+		disc_id = self._resumable_disc_id()
+		if disc_id:
+			self.resume_positions.forget(disc_id)
+
+	def load_position(self):
+		'''Playback starts where the album was left, with a seek into the
+		track rather than decoding up to that frame.'''
+		disc_id = self._resumable_disc_id()
+		position = self.resume_positions.get(disc_id) if disc_id else None
+		if position is None:
+			return
+
+		(track, frame) = position
+		if 1 <= track <= len(self.disc_meta.get('tracks', [])):
+			logger.info('Resuming %s at track %d, frame %d', disc_id, track, frame)
+			self.current_track = track
+			self.resume_frame = frame
+
 
 def create_player(
 	create_audio_func,
@@ -190,6 +364,8 @@ def create_player(
 	pause_playback_func,
 	resume_playback_func,
 	after_state_change_callback,
+	play_queue=None,
+	resume_positions=None
 ):
 
 	player = Player(
@@ -198,7 +374,9 @@ def create_player(
 		stop_audio_func,
 		pause_playback_func,
 		resume_playback_func,
-		after_state_change_callback
+		after_state_change_callback,
+		play_queue,
+		resume_positions
 	)
 	machine = Machine(player, states=States, initial=States.INIT, after_state_change='on_state_change')
 
@@ -216,6 +394,30 @@ def create_player(
 		before='set_disc_meta'
 	)
 
+	#
+	# Library playback, the drive isn't involved. A disc inserted meanwhile
+	# replaces the library album.
+	machine.add_transition(
+		Triggers.PLAY_ALBUM,
+		[States.NO_DISC, States.UNKNOWN_DISC, States.STOPPED, States.PLAYING, States.PAUSED, States.WAITING_FOR_DATA],
+		States.PLAYING,
+		before='start_album'
+	)
+	machine.add_transition(
+		Triggers.START,
+		[States.STOPPED, States.PLAYING, States.PAUSED],
+		States.STOPPED,
+		conditions='is_library_album',
+		before='replace_album'
+	)
+	machine.add_transition(
+		Triggers.UNKNOWN_DISC,
+		[States.STOPPED, States.PLAYING, States.PAUSED],
+		States.UNKNOWN_DISC,
+		conditions='is_library_album',
+		before=['stop_playback', '_clear_internal_state', 'forget_album']
+	)
+
 	#
 	# Disc playback
 	machine.add_transition(
@@ -246,7 +448,7 @@ def create_player(
 		States.PLAYING,
 		States.STOPPED,
 		unless=['has_next_track'],
-		before='_clear_track_progress'
+		before=['forget_position', '_clear_track_progress']
 	)
 	machine.add_transition(
 		Triggers.FINISH,
@@ -256,6 +458,19 @@ def create_player(
 		unless=['is_next_flac_available'],
 		before=['_clear_track_progress', 'next_track']
 	)
+	# next track came too late to be buffered, e.g. just queued
+	machine.add_transition(
+		Triggers.FINISH,
+		States.PLAYING,
+		States.PLAYING,
+		conditions=['has_next_track', 'is_next_flac_available'],
+		before=['_clear_track_progress', 'next_track', 'start_playback']
+	)
+
+	#
+	# Seeking
+	machine.add_transition(Triggers.SEEK, States.PLAYING, States.PLAYING, before='seek_playback')
+	machine.add_transition(Triggers.SEEK, States.PAUSED, States.PAUSED, before='seek_paused')
 
 	#
 	# Track switching
@@ -349,13 +564,58 @@ def create_player(
 		Triggers.RIPPER_UPDATE,
 		[States.PLAYING, States.STOPPED, States.PAUSED, States.WAITING_FOR_DATA],
 		'=',
+		unless='is_library_album',
 		before='update_track_list'
 	)
 
+	#
+	# Play queue
+	machine.add_transition(
+		Triggers.QUEUE_ALBUM,
+		[States.NO_DISC, States.UNKNOWN_DISC],
+		States.STOPPED,
+		before='enqueue_and_load_album'
+	)
+	machine.add_transition(
+		Triggers.QUEUE_ALBUM,
+		[States.PLAYING, States.STOPPED, States.PAUSED, States.WAITING_FOR_DATA],
+		'=',
+		before='enqueue_album'
+	)
+	machine.add_transition(
+		Triggers.QUEUE_CLEAR,
+		[States.NO_DISC, States.UNKNOWN_DISC, States.PLAYING, States.STOPPED, States.PAUSED, States.WAITING_FOR_DATA],
+		'=',
+		before='clear_queue'
+	)
+
+	#
+	# Late disc meta
+	machine.add_transition(
+		Triggers.DISC_META_UPDATE,
+		[States.PLAYING, States.STOPPED, States.PAUSED, States.WAITING_FOR_DATA],
+		'=',
+		unless='is_library_album',
+		before='update_disc_meta'
+	)
+
 	#
 	# Eject
-	machine.add_transition(Triggers.EJECT, '*', States.NO_DISC, before=['stop_playback', '_clear_internal_state'])
+	machine.add_transition(
+		Triggers.EJECT,
+		'*',
+		States.NO_DISC,
+		before=['stop_playback', '_clear_internal_state', 'forget_album']
+	)
 
-	machine.add_transition(Triggers.INIT, States.INIT, States.NO_DISC)
+	# a library album or queue left from before a restart is loaded again
+	machine.add_transition(
+		Triggers.INIT,
+		States.INIT,
+		States.STOPPED,
+		conditions='has_queued_album',
+		before='load_queued_album'
+	)
+	machine.add_transition(Triggers.INIT, States.INIT, States.NO_DISC, unless='has_queued_album')
 
 	return player
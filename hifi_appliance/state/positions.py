@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResumePositions(object):
+    """
+    The last track and frame played of each disc, by disc ID, so a disc
+    re-inserted or still in the drive after a restart continues where it
+    was left. Only the `max_discs` most recently played discs are kept.
+
+    With a `path` the positions are written there as a single JSON object,
+    at most once every `interval` seconds while playing. `update()` with
+    `save` writes right away, for stops and pauses. Without a path they're
+    only kept in memory.
+    """
+    def __init__(self, path=None, interval=0, max_discs=1000):
+        self.path = Path(path) if path else None
+        self.interval = interval
+        self.max_discs = max_discs
+
+        self._lock = threading.Lock()
+        self._positions = OrderedDict()
+        self._dirty = False
+        self._saved_at = None
+
+        if self.path and self.path.is_file():
+            self._load()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def get(self, disc_id):
+        """(track, frame) or None."""
+        with self._lock:
+            return self._positions.get(disc_id)
+
+    def update(self, disc_id, track, frame, save=False):
+        with self._lock:
+            if self._positions.get(disc_id) != (track, frame):
+                self._positions[disc_id] = (track, frame)
+                self._positions.move_to_end(disc_id)
+                while len(self._positions) > self.max_discs:
+                    self._positions.popitem(last=False)
+                self._dirty = True
+
+            if save or self._saved_at is None or time.monotonic() - self._saved_at >= self.interval:
+                self._save()
+
+    def forget(self, disc_id):
+        with self._lock:
+            if self._positions.pop(disc_id, None) is not None:
+                self._dirty = True
+                self._save()
+
+    def flush(self):
+        with self._lock:
+            self._save()
+
+    def _load(self):
+        try:
+            positions = json.loads(self.path.read_text(encoding='utf-8'))
+            self._positions = OrderedDict(
+                (disc_id, (int(track), int(frame))) for (disc_id, (track, frame)) in positions.items()
+            )
+        except (OSError, ValueError, TypeError, AttributeError):
+            logger.exception('Could not read resume positions %s, starting over', self.path)
+
+    def _save(self):
+        if not self.path or not self._dirty:
+            return
+
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(self._positions, separators=(',', ':')), encoding='utf-8')
+            os.replace(str(tmp_path), str(self.path))
+        except OSError:
+            logger.exception('Could not write resume positions %s', self.path)
+            return
+
+        self._dirty = False
+        self._saved_at = time.monotonic()
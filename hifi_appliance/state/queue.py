@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class PlayQueue(object):
+    """
+    Albums to play after the current one, as (track_list, disc_meta).
+    The current library album is kept as well, so playback can pick up
+    where it was after a restart. Discs aren't, they're read again when
+    the daemon starts.
+
+    With a `path` the queue is written there on every change, one line
+    per album with track file names relative to the album folder. Without
+    one it's only kept in memory.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self.current = None
+        self._albums = []
+
+        if self.path and self.path.is_file():
+            self._load()
+
+    def __len__(self):
+        return len(self._albums)
+
+    def disc_ids(self):
+        with self._lock:
+            return [disc_meta.get('disc_id') for (_, disc_meta) in self._albums]
+
+    def append(self, track_list, disc_meta):
+        with self._lock:
+            self._albums.append((track_list, disc_meta))
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._albums = []
+            self._save()
+
+    def peek(self):
+        """The next album or None, stays queued."""
+        with self._lock:
+            return self._albums[0] if self._albums else None
+
+    def pop(self):
+        """Takes the next album off the queue, it becomes the current one."""
+        with self._lock:
+            self.current = self._albums.pop(0)
+            self._save()
+            return self.current
+
+    def set_current(self, album):
+        with self._lock:
+            self.current = album
+            self._save()
+
+    def _load(self):
+        try:
+            lines = self.path.read_text(encoding='utf-8').splitlines()
+            albums = [_decode_album(line) for line in lines]
+        except (OSError, ValueError, KeyError):
+            logger.exception('Could not read play queue %s, starting empty', self.path)
+            return
+
+        if albums:
+            self.current = albums[0]
+            self._albums = [album for album in albums[1:] if album]
+
+    def _save(self):
+        if not self.path:
+            return
+
+        # the current album comes first, an empty line when there's none
+        lines = [_encode_album(self.current) if self.current else ''] + [
+            _encode_album(album) for album in self._albums
+        ]
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(''.join(line + '\n' for line in lines), encoding='utf-8')
+            os.replace(str(tmp_path), str(self.path))
+        except OSError:
+            logger.exception('Could not write play queue %s', self.path)
+
+
+def _encode_album(album):
+    (track_list, disc_meta) = album
+    folders = {os.path.dirname(path) for path in track_list}
+    folder = folders.pop() if len(folders) == 1 else ''
+    return json.dumps({
+        'folder': folder,
+        'files': [os.path.basename(path) if folder else path for path in track_list],
+        'disc_meta': disc_meta,
+    }, separators=(',', ':'))
+
+
+def _decode_album(line):
+    if not line.strip():
+        return None
+    album = json.loads(line)
+    folder = album['folder']
+    return ([os.path.join(folder, name) if folder else name for name in album['files']], album['disc_meta'])
@@ -1,6 +1,7 @@
 from enum import Enum
 import logging
 from pathlib import Path
+import threading
 
 from transitions import Machine
 
@@ -25,6 +26,7 @@ class Triggers(object):
     KNOWN_DISC = 'known_disc'
     RIP_TRACK = 'rip_track'
     FINISH = 'finish'
+    DISC_META_UPDATE = 'disc_meta_update'  # better meta arrived after START
     EJECT = 'eject'
 
 
@@ -36,6 +38,7 @@ class Ripper(object):
         write_meta_func,
         move_track_func,
         write_disc_id_func,
+        rename_func,
         after_state_change_callback
     ):
         self.grab_and_convert_track_func = grab_and_convert_track_func
@@ -43,9 +46,14 @@ class Ripper(object):
         self.write_meta_func = write_meta_func
         self.move_track_func = move_track_func
         self.write_disc_id_func = write_disc_id_func
+        self.rename_func = rename_func
 
         self.after_state_change_callback = after_state_change_callback
 
+        # tracks are ripped in a worker thread while meta updates come from
+        # the daemon's io_loop: guards disc_meta, folder_path and track_list
+        self.meta_lock = threading.RLock()
+
         self._clear_internal_state()
 
     def _clear_internal_state(self):
@@ -101,17 +109,44 @@ class Ripper(object):
 
         tmp_file_path = Path(self.grab_and_convert_track_func(track_number))
 
-        self.tag_track(track_number, str(tmp_file_path))
+        with self.meta_lock:
+            self.tag_track(track_number, str(tmp_file_path))
 
-        target_path = self.folder_path.joinpath(
-            self._get_track_filename(track_number)
-        )
-        self.move_track_func(tmp_file_path, target_path)
+            target_path = self.folder_path.joinpath(
+                self._get_track_filename(track_number)
+            )
+            self.move_track_func(tmp_file_path, target_path)
 
-        self.track_list.append(str(target_path))
-        self.current_track = track_number
+            self.track_list.append(str(target_path))
+            self.current_track = track_number
         self.after_state_change_callback()
 
+    def is_same_disc_layout(self, disc_meta):
+        return len(disc_meta['tracks']) == len(self.disc_meta['tracks'])
+
+    def update_disc_meta(self, disc_meta):
+        '''Retags and renames what was already ripped to match new meta.'''
+        with self.meta_lock:
+            self.disc_meta = disc_meta
+
+            folder_path = self._get_folder_path(disc_meta)
+            if folder_path != self.folder_path:
+                logger.info('Moving album to %s', folder_path)
+                self.rename_func(self.folder_path, folder_path)
+                self.folder_path = folder_path
+
+            track_list = []
+            for track_number, track_path in enumerate(self.track_list, start=1):
+                track_path = self.folder_path.joinpath(Path(track_path).name)
+                self.tag_track(track_number, str(track_path))
+
+                target_path = self.folder_path.joinpath(self._get_track_filename(track_number))
+                if target_path != track_path:
+                    self.rename_func(track_path, target_path)
+                track_list.append(str(target_path))
+
+            self.track_list = track_list
+
     def tag_track(self, track_number, track_filename):
         track_meta = self.disc_meta['tracks'][track_number - 1]
 
@@ -136,9 +171,10 @@ class Ripper(object):
         return self._remove_unsafe_chars(track_filename)
 
     def store_disc_id(self):
-        disc_id = self.disc_meta['disc_id']
-        path = self.folder_path.joinpath('.disc_id')
-        self.write_disc_id_func(path, disc_id)
+        with self.meta_lock:
+            disc_id = self.disc_meta['disc_id']
+            path = self.folder_path.joinpath('.disc_id')
+            self.write_disc_id_func(path, disc_id)
 
     def get_full_state(self):
         return {
@@ -159,6 +195,7 @@ def create_ripper(
     write_meta_func,
     move_track_func,
     write_disc_id_func,
+    rename_func,
     after_state_change_callback
 ):
     ripper = Ripper(
@@ -167,6 +204,7 @@ def create_ripper(
         write_meta_func,
         move_track_func,
         write_disc_id_func,
+        rename_func,
         after_state_change_callback
     )
 
@@ -199,6 +237,14 @@ def create_ripper(
         before='store_disc_id'
     )
 
+    machine.add_transition(
+        Triggers.DISC_META_UPDATE,
+        [States.RIPPING, States.DONE],
+        '=',
+        conditions='is_same_disc_layout',
+        before='update_disc_meta'
+    )
+
     machine.add_transition(Triggers.EJECT, '*', States.NO_DISC, before='_clear_internal_state')
 
     return ripper
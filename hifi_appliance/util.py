@@ -0,0 +1,31 @@
+"""
+Helpers shared by the daemons.
+"""
+import os
+
+
+# mounted from other hosts: changes made there raise no inotify events, and
+# every read waits on the network
+_NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'fuse.rclone', '9p', 'afs', 'ceph'}
+
+
+def is_network_filesystem(path):
+    """True when `path` is mounted from another host, per /proc/mounts."""
+    path = os.path.realpath(path)
+    mount_point = ''
+    filesystem = None
+
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                candidate = fields[1].replace('\\040', ' ')
+                if (path == candidate or path.startswith(candidate.rstrip('/') + '/')) and \
+                        len(candidate) >= len(mount_point):
+                    (mount_point, filesystem) = (candidate, fields[2])
+    except OSError:
+        return False
+
+    return filesystem in _NETWORK_FILESYSTEMS
@@ -0,0 +1,23 @@
+"""
+Builds the offline MusicBrainz disc index from a data dump:
+
+    python import_musicbrainz_dump.py mbdump.tar.bz2
+
+The dump is at http://ftp.musicbrainz.org/pub/musicbrainz/data/fullexport/
+(mbdump.tar.bz2), an extracted mbdump directory works too.
+"""
+import argparse
+import logging
+
+from hifi_appliance.config import OFFLINE_META_INDEX_PATH
+from hifi_appliance.meta import import_musicbrainz_dump
+
+
+parser = argparse.ArgumentParser(description='Build the offline MusicBrainz disc index')
+parser.add_argument('dump', help='mbdump.tar.bz2 or an extracted mbdump directory')
+parser.add_argument('--index', default=OFFLINE_META_INDEX_PATH, help='index file to write')
+parser.add_argument('--batch-size', type=int, default=10000, help='rows inserted per batch')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+import_musicbrainz_dump(args.dump, args.index, args.batch_size)
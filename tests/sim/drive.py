@@ -0,0 +1,280 @@
+"""
+Simulated CD drive shared by the stand-ins for `cd-paranoia`, `cdrdao`,
+`ffmpeg` and the `discid` module found in tests/sim/bin and tests/sim/pylib.
+
+The disc is described by a file from tests/data: either a MusicBrainz
+response (exact TOC from the `offset-list`) or a cdrdao TOC (track lengths
+and CD-TEXT). Settings come from the environment so that the stand-ins, which
+run as separate processes, all agree on the disc in the drive:
+
+ - CDP_SIM_DISC -- path of the disc description, empty for an empty drive
+ - CDP_SIM_SCALE -- factor applied to every track length (default 1.0)
+ - CDP_SIM_READ_SPEED -- read speed as a multiple of real time (default 8)
+ - CDP_SIM_ERROR_RATE -- chance of a read error per second of audio read
+   without full paranoia (default 0)
+ - CDP_SIM_SEED -- seed for the simulated read errors (default 0)
+"""
+import base64
+import hashlib
+import json
+import os
+from pathlib import Path
+import random
+import struct
+
+import numpy
+
+
+PCM_FRAMES_PER_CD_FRAME = 588
+CD_FRAMES_PER_SECOND = 75
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH
+
+LEAD_IN_CD_FRAMES = 150
+MIN_TRACK_CD_FRAMES = 4 * CD_FRAMES_PER_SECOND
+
+
+class SimulationError(Exception):
+    pass
+
+
+class SimulatedDisc(object):
+    def __init__(self, offsets, leadout, disc_id=None, title=None, artist=None, tracks=None):
+        """
+        offsets: absolute track start sectors (including the lead-in)
+        leadout: absolute lead-out sector
+        tracks: optional list of {'title', 'artist'} CD-TEXT entries, with
+        'pre_emphasis' for tracks flagged as emphasized
+        """
+        self.offsets = offsets
+        self.leadout = leadout
+        self.disc_id = disc_id or mb_disc_id(1, offsets, leadout)
+        self.freedb_id = freedb_disc_id(offsets, leadout)
+        self.title = title
+        self.artist = artist
+        self.tracks = tracks
+
+    @classmethod
+    def from_environment(cls):
+        disc_path = os.environ.get('CDP_SIM_DISC')
+        if not disc_path:
+            raise SimulationError('no disc in drive')
+        return cls.from_file(disc_path, float(os.environ.get('CDP_SIM_SCALE', '1')))
+
+    @classmethod
+    def from_file(cls, path, scale=1.0):
+        text = Path(path).read_text()
+        if text.lstrip().startswith('{'):
+            disc = cls.from_musicbrainz(json.loads(text))
+        else:
+            disc = cls.from_toc(text)
+        return disc.scaled(scale) if scale != 1.0 else disc
+
+    @classmethod
+    def from_musicbrainz(cls, response):
+        disc = response['disc']
+        return cls(
+            [int(offset) for offset in disc['offset-list']],
+            int(disc['sectors']),
+            disc_id=disc['id']
+        )
+
+    @classmethod
+    def from_toc(cls, toc_text):
+        # imported here: the discid stand-in loads this module while
+        # hifi_appliance.disc is still importing it
+        from hifi_appliance.disc.toc import Toc
+
+        disc_meta = Toc(toc_text).disc_meta
+        offsets = []
+        position = LEAD_IN_CD_FRAMES
+        for track in disc_meta['tracks']:
+            offsets.append(position)
+            length = track['file_length'] + track.get('pregap_silence', 0)
+            position += length // PCM_FRAMES_PER_CD_FRAME
+
+        tracks = [
+            {'title': track.get('title'), 'artist': track.get('artist'), 'pre_emphasis': track.get('pre_emphasis', False)}
+            for track in disc_meta['tracks']
+        ]
+        return cls(offsets, position, title=disc_meta.get('title'), artist=disc_meta.get('artist'), tracks=tracks)
+
+    def scaled(self, scale):
+        lengths = [max(MIN_TRACK_CD_FRAMES, int(length * scale)) for length in self.track_lengths()]
+        offsets = []
+        position = self.offsets[0]
+        for length in lengths:
+            offsets.append(position)
+            position += length
+        return SimulatedDisc(offsets, position, title=self.title, artist=self.artist, tracks=self.tracks)
+
+    @property
+    def track_count(self):
+        return len(self.offsets)
+
+    def track_lengths(self):
+        """Track lengths in CD frames (sectors)."""
+        return [end - start for start, end in zip(self.offsets, self.offsets[1:] + [self.leadout])]
+
+    def track_bytes(self, track_number):
+        return self.track_lengths()[track_number - 1] * PCM_FRAMES_PER_CD_FRAME * CHANNELS * SAMPLE_WIDTH
+
+    def iter_pcm(self, track_number, chunk_size=BYTES_PER_SECOND):
+        """Deterministic PCM for a track: a tone whose pitch depends on the track."""
+        remaining = self.track_bytes(track_number)
+        second = _tone(220 + 20 * track_number)
+        while remaining > 0:
+            chunk = second[:min(chunk_size, remaining)]
+            remaining -= len(chunk)
+            yield chunk
+
+    def toc_text(self):
+        """The disc's TOC as written by `cdrdao read-toc`."""
+        lines = ['CD_DA', '']
+        if self.title:
+            lines += self._cd_text(self.title, self.artist, language_map=True)
+
+        position = 0
+        for index, length in enumerate(self.track_lengths()):
+            pre_emphasis = bool(self.tracks and self.tracks[index].get('pre_emphasis'))
+            lines += [
+                '// Track %d' % (index + 1),
+                'TRACK AUDIO',
+                'NO COPY',
+                'PRE_EMPHASIS' if pre_emphasis else 'NO PRE_EMPHASIS',
+                'TWO_CHANNEL_AUDIO',
+            ]
+            if self.tracks:
+                lines += self._cd_text(self.tracks[index]['title'], self.tracks[index]['artist'])
+            lines += ['FILE "data.wav" %s %s' % (_msf(position) if position else '0', _msf(length)), '', '']
+            position += length
+
+        return '\n'.join(lines)
+
+    def _cd_text(self, title, artist, language_map=False):
+        lines = ['CD_TEXT {']
+        if language_map:
+            lines += ['  LANGUAGE_MAP {', '    0: 9', '  }']
+        lines += ['  LANGUAGE 0 {']
+        if title:
+            lines.append('    TITLE "%s"' % title)
+        if artist:
+            lines.append('    PERFORMER "%s"' % artist)
+        lines += ['  }', '}']
+        return lines
+
+
+def _tone(frequency):
+    """One second of a stereo 16 bit sine wave, as bytes."""
+    t = numpy.arange(SAMPLE_RATE) / SAMPLE_RATE
+    mono = (numpy.sin(2 * numpy.pi * frequency * t) * 8000).astype('<i2')
+    return numpy.repeat(mono, CHANNELS).tobytes()
+
+
+def _msf(cd_frames):
+    return '%02d:%02d:%02d' % (
+        cd_frames // (60 * CD_FRAMES_PER_SECOND),
+        cd_frames // CD_FRAMES_PER_SECOND % 60,
+        cd_frames % CD_FRAMES_PER_SECOND
+    )
+
+
+def mb_disc_id(first_track, offsets, leadout):
+    """MusicBrainz disc ID, as computed by libdiscid."""
+    sha = hashlib.sha1()
+    sha.update(b'%02X' % first_track)
+    sha.update(b'%02X' % (first_track + len(offsets) - 1))
+    sha.update(b'%08X' % leadout)
+    for index in range(99):
+        sha.update(b'%08X' % (offsets[index] if index < len(offsets) else 0))
+
+    return base64.b64encode(sha.digest()).decode('ascii')\
+        .replace('+', '.').replace('/', '_').replace('=', '-')
+
+
+def freedb_disc_id(offsets, leadout):
+    checksum = 0
+    for offset in offsets:
+        checksum += sum(int(digit) for digit in str(offset // CD_FRAMES_PER_SECOND))
+    length = leadout // CD_FRAMES_PER_SECOND - offsets[0] // CD_FRAMES_PER_SECOND
+    return '%08x' % ((checksum % 0xff) << 24 | length << 8 | len(offsets))
+
+
+class ReadErrorSimulator(object):
+    def __init__(self):
+        self.error_rate = float(os.environ.get('CDP_SIM_ERROR_RATE', '0'))
+        self.random = random.Random(int(os.environ.get('CDP_SIM_SEED', '0')))
+
+    def has_error(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+
+def read_speed():
+    return float(os.environ.get('CDP_SIM_READ_SPEED', '8'))
+
+
+#
+# A FLAC stand-in: real FLAC metadata blocks (so mutagen can read and write
+# tags) followed by raw PCM instead of encoded frames.
+
+_STREAMINFO = 0
+_VORBIS_COMMENT = 4
+_PADDING = 1
+
+
+def write_flac(path, pcm_data, sample_rate=SAMPLE_RATE, bits_per_sample=SAMPLE_WIDTH * 8):
+    """
+    The payload is raw little endian PCM: 16 bit samples, or full scale
+    32 bit ones for more than 16 bits per sample, as ffmpeg decodes them.
+    """
+    total_samples = len(pcm_data) // (CHANNELS * _payload_width(bits_per_sample))
+    streaminfo = struct.pack('>HH3s3s', 4096, 4096, b'\0\0\0', b'\0\0\0')
+    streaminfo += struct.pack(
+        '>Q',
+        sample_rate << 44 | (CHANNELS - 1) << 41 | (bits_per_sample - 1) << 36 | total_samples
+    )
+    streaminfo += b'\0' * 16
+
+    vendor = b'cdp-sa simulator'
+    vorbis_comment = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', 0)
+
+    with open(path, 'wb') as f:
+        f.write(b'fLaC')
+        f.write(_block_header(_STREAMINFO, len(streaminfo)) + streaminfo)
+        f.write(_block_header(_VORBIS_COMMENT, len(vorbis_comment)) + vorbis_comment)
+        f.write(_block_header(_PADDING, 1024, last=True) + b'\0' * 1024)
+        f.write(pcm_data)
+
+
+def _block_header(block_type, length, last=False):
+    return bytes([block_type | (0x80 if last else 0)]) + length.to_bytes(3, 'big')
+
+
+def _payload_width(bits_per_sample):
+    return SAMPLE_WIDTH if bits_per_sample <= 16 else 4
+
+
+def read_flac_format(data):
+    """(sample rate, bits per sample, payload sample width) of a FLAC written by `write_flac()`."""
+    if not data.startswith(b'fLaC'):
+        raise SimulationError('not a simulated FLAC file')
+
+    (info,) = struct.unpack('>Q', data[8 + 10:8 + 18])
+    bits_per_sample = (info >> 36 & 0x1f) + 1
+    return (info >> 44, bits_per_sample, _payload_width(bits_per_sample))
+
+
+def read_flac_pcm(data):
+    """Returns the PCM payload of a FLAC written by `write_flac()`."""
+    if not data.startswith(b'fLaC'):
+        raise SimulationError('not a simulated FLAC file')
+
+    position = 4
+    while True:
+        header = data[position]
+        length = int.from_bytes(data[position + 1:position + 4], 'big')
+        position += 4 + length
+        if header & 0x80:
+            return data[position:]
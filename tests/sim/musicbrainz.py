@@ -0,0 +1,172 @@
+"""
+Local stand-in for the MusicBrainz web service. Serves `discid` lookups from
+responses in the format of tests/data/musicbrainz (as parsed by
+musicbrainzngs), converted back to WS/2 XML.
+"""
+import copy
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import threading
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+
+
+FIXTURES_PATH = Path(os.path.dirname(__file__)).parent.joinpath('data', 'musicbrainz')
+
+
+class MusicbrainzStandIn(object):
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.requests = []
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='musicbrainz stand-in')
+        self._thread.daemon = True
+
+    @classmethod
+    def from_fixtures(cls):
+        responses = {}
+        for fixture in sorted(FIXTURES_PATH.iterdir()):
+            response = json.loads(fixture.read_text())
+            responses[response['disc']['id']] = response
+        return cls(responses)
+
+    @property
+    def host(self):
+        return '%s:%d' % self._server.server_address
+
+    def register(self, disc_id, response):
+        """Serves `response` (of another disc) under `disc_id`."""
+        response = copy.deepcopy(response)
+        original_id = response['disc']['id']
+        response['disc']['id'] = disc_id
+        for release in response['disc']['release-list']:
+            for medium in release['medium-list']:
+                for disc in medium['disc-list']:
+                    if disc['id'] == original_id:
+                        disc['id'] = disc_id
+        self.responses[disc_id] = response
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, request):
+        path = request.path.split('?')[0].rstrip('/')
+        self.requests.append(path)
+
+        disc_id = path.rsplit('/', 1)[-1]
+        if path.startswith('/ws/2/discid/') and disc_id in self.responses:
+            status = 200
+            body = response_to_xml(self.responses[disc_id])
+        else:
+            status = 404
+            body = '<?xml version="1.0" encoding="UTF-8"?><error><text>Not Found</text></error>'
+
+        body = body.encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/xml; charset=UTF-8')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def response_to_xml(response):
+    """WS/2 XML for the subset of a disc lookup that cdp-sa uses."""
+    disc = response['disc']
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+        + _disc(disc, disc.get('release-list', [])) +
+        '</metadata>'
+    )
+
+
+def _element(name, value):
+    return '<%s>%s</%s>' % (name, escape(str(value)), name)
+
+
+def _disc(disc, releases):
+    xml = '<disc id=%s>' % quoteattr(disc['id'])
+    if 'sectors' in disc:
+        xml += _element('sectors', disc['sectors'])
+    if 'offset-list' in disc:
+        xml += '<offset-list count="%d">' % len(disc['offset-list'])
+        for position, offset in enumerate(disc['offset-list'], 1):
+            xml += '<offset position="%d">%s</offset>' % (position, offset)
+        xml += '</offset-list>'
+    if releases:
+        xml += '<release-list count="%d">%s</release-list>' % (
+            len(releases), ''.join(_release(release) for release in releases)
+        )
+    return xml + '</disc>'
+
+
+def _release(release):
+    xml = '<release id=%s>' % quoteattr(release['id'])
+    xml += _element('title', release['title'])
+    xml += _artist_credit(release['artist-credit'])
+    xml += '<medium-list count="%d">' % len(release['medium-list'])
+    for medium in release['medium-list']:
+        xml += '<medium>'
+        xml += _element('position', medium['position'])
+        if 'format' in medium:
+            xml += _element('format', medium['format'])
+        xml += '<disc-list count="%d">%s</disc-list>' % (
+            len(medium['disc-list']), ''.join(_disc(disc, []) for disc in medium['disc-list'])
+        )
+        xml += '<track-list count="%d">%s</track-list>' % (
+            len(medium['track-list']), ''.join(_track(track) for track in medium['track-list'])
+        )
+        xml += '</medium>'
+    return xml + '</medium-list></release>'
+
+
+def _track(track):
+    xml = '<track id=%s>' % quoteattr(track['id'])
+    for name in ('position', 'number', 'title', 'length'):
+        if name in track:
+            xml += _element(name, track[name])
+
+    recording = track['recording']
+    xml += '<recording id=%s>' % quoteattr(recording['id'])
+    xml += _element('title', recording['title'])
+    if 'length' in recording:
+        xml += _element('length', recording['length'])
+    xml += _artist_credit(recording['artist-credit'])
+    return xml + '</recording></track>'
+
+
+def _artist_credit(artist_credit):
+    xml = '<artist-credit>'
+    for index, credit in enumerate(artist_credit):
+        if isinstance(credit, str):
+            continue
+
+        following = artist_credit[index + 1] if index + 1 < len(artist_credit) else None
+        join_phrase = ' joinphrase=%s' % quoteattr(following) if isinstance(following, str) else ''
+
+        artist = credit['artist']
+        xml += '<name-credit%s><artist id=%s%s>%s</artist></name-credit>' % (
+            join_phrase,
+            quoteattr(artist['id']),
+            ' type=%s' % quoteattr(artist['type']) if 'type' in artist else '',
+            _element('name', artist['name'])
+        )
+    return xml + '</artist-credit>'
@@ -0,0 +1,3 @@
+"""Stand-in for python-discid reading the TOC of the simulated drive."""
+from . import disc
+from .disc import read
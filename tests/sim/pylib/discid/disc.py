@@ -0,0 +1,34 @@
+from tests.sim.drive import SimulatedDisc
+from tests.sim.drive import SimulationError
+
+
+class DiscError(IOError):
+    pass
+
+
+class Track(object):
+    def __init__(self, number, offset, sectors):
+        self.number = number
+        self.offset = offset
+        self.sectors = sectors
+
+
+class Disc(object):
+    def __init__(self, simulated_disc):
+        self.id = simulated_disc.disc_id
+        self.freedb_id = simulated_disc.freedb_id
+        self.first_track_num = 1
+        self.last_track_num = simulated_disc.track_count
+        self.sectors = simulated_disc.leadout
+        self.tracks = [
+            Track(number, offset, length)
+            for number, (offset, length)
+            in enumerate(zip(simulated_disc.offsets, simulated_disc.track_lengths()), 1)
+        ]
+
+
+def read(device=None, features=[]):
+    try:
+        return Disc(SimulatedDisc.from_environment())
+    except SimulationError as e:
+        raise DiscError(str(e))
@@ -0,0 +1,114 @@
+import logging
+import os
+import random
+import struct
+import tempfile
+import unittest
+import zlib
+
+from hifi_appliance.rip import accuraterip_disc_id
+from hifi_appliance.rip import AccurateRipDB
+from hifi_appliance.rip import TrackChecksum
+
+
+def reference_checksums(pcm_data, first_track, last_track):
+    """Straightforward per-sample implementation of AccurateRip v1/v2."""
+    samples = struct.unpack('<%dI' % (len(pcm_data) // 4), pcm_data)
+    check_from = 5 * 588 if first_track else 1
+    check_to = len(samples) - 5 * 588 if last_track else len(samples)
+
+    v1 = 0
+    v2 = 0
+    for position, value in enumerate(samples, 1):
+        if check_from <= position <= check_to:
+            product = value * position
+            v1 = (v1 + product) & 0xffffffff
+            v2 = (v2 + (product >> 32) + (product & 0xffffffff)) & 0xffffffff
+
+    return (v1, v2)
+
+
+class TrackChecksumTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        rng = random.Random(42)
+        self.pcm_data = bytes(rng.getrandbits(8) for _ in range(4 * 10000))
+
+    def _checksum(self, chunk_size, first_track=False, last_track=False):
+        checksum = TrackChecksum(first_track, last_track)
+        for start in range(0, len(self.pcm_data), chunk_size):
+            checksum.update(self.pcm_data[start:start + chunk_size])
+        return checksum
+
+    def test_middle_track(self):
+        checksum = self._checksum(4096)
+
+        self.assertEqual((checksum.v1, checksum.v2), reference_checksums(self.pcm_data, False, False))
+        self.assertEqual(checksum.crc32, zlib.crc32(self.pcm_data))
+        self.assertEqual(checksum.frames, 10000)
+
+    def test_first_and_last_track(self):
+        checksum = self._checksum(4096, first_track=True, last_track=True)
+
+        self.assertEqual((checksum.v1, checksum.v2), reference_checksums(self.pcm_data, True, True))
+        self.assertEqual(checksum.crc32, zlib.crc32(self.pcm_data))
+
+    def test_unaligned_chunks(self):
+        expected = reference_checksums(self.pcm_data, True, False)
+
+        for chunk_size in (1, 3, 1001, 2939 * 4 + 2):
+            checksum = self._checksum(chunk_size, first_track=True)
+            self.assertEqual((checksum.v1, checksum.v2), expected)
+
+    def test_as_dict(self):
+        checksum = self._checksum(4096)
+        self.assertEqual(checksum.as_dict()['crc32'], '%08x' % zlib.crc32(self.pcm_data))
+
+
+class AccurateRipDBTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.toc = {
+            'first_track': 1,
+            'offsets': [150, 18794, 35137],
+            'leadout': 53493,
+            'freedb_id': '1a02b503'
+        }
+        self.db_path = tempfile.mkdtemp()
+
+    def _write_entry(self, pressings):
+        (track_count, disc_id_1, disc_id_2, freedb_id) = accuraterip_disc_id(self.toc)
+        data = b''
+        for crcs in pressings:
+            data += struct.pack('<BIII', track_count, disc_id_1, disc_id_2, freedb_id)
+            for confidence, crc in crcs:
+                data += struct.pack('<BII', confidence, crc, 0)
+
+        file_name = 'dBAR-%03d-%08x-%08x-%08x.bin' % (track_count, disc_id_1, disc_id_2, freedb_id)
+        with open(os.path.join(self.db_path, file_name), 'wb') as f:
+            f.write(data)
+
+    def test_disc_id(self):
+        self.assertEqual(
+            accuraterip_disc_id(self.toc),
+            (3, 18644 + 34987 + 53343, 1 * 1 + 18644 * 2 + 34987 * 3 + 53343 * 4, 0x1a02b503)
+        )
+
+    def test_missing_entry(self):
+        self.assertIsNone(AccurateRipDB(self.db_path).lookup(self.toc))
+
+    def test_verify(self):
+        checksum = TrackChecksum()
+        checksum.update(b'\x01\x00\x00\x00' * 100)
+
+        self._write_entry([
+            [(3, 1), (5, checksum.v1), (2, 3)],
+            [(7, 1), (9, checksum.v2), (2, 3)],
+        ])
+        entry = AccurateRipDB(self.db_path).lookup(self.toc)
+
+        self.assertEqual(len(entry.pressings), 2)
+        self.assertEqual(entry.verify(2, checksum), 9)
+        self.assertEqual(entry.verify(1, checksum), 0)
@@ -2,9 +2,14 @@ import logging
 import unittest
 from unittest.mock import call, MagicMock
 
+from transitions import MachineError
+
 from hifi_appliance.constants import SAMPLE_RATE
 from hifi_appliance.state import create_player
+from hifi_appliance.state import PlayerSources
 from hifi_appliance.state import PlayerStates
+from hifi_appliance.state import PlayQueue
+from hifi_appliance.state import ResumePositions
 
 
 class PlaybackNewDiscTestCase(unittest.TestCase):
@@ -55,6 +60,17 @@ class PlaybackNewDiscTestCase(unittest.TestCase):
 
         self.assertEqual(self.player.state, PlayerStates.UNKNOWN_DISC)
 
+    def test_disc_meta_update(self):
+        self.player.init()
+        self.player.start(self.track_list, self.disc_meta)
+
+        disc_meta = {'key': 'better value'}
+        self.assertTrue(self.player.disc_meta_update(disc_meta))
+
+        self.assertIs(self.player.disc_meta, disc_meta)
+        self.assertIs(self.player.track_list, self.track_list)
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+
 
 class TrackChangingTestCase(unittest.TestCase):
     def setUp(self):
@@ -371,3 +387,487 @@ class AudioInteractionTestCase(unittest.TestCase):
         self.player.finish()
         self.assertEqual(self.player.state, PlayerStates.WAITING_FOR_DATA)
         self.assertEqual(self.player.current_track, 2)
+
+    def test_seek_buffers_from_frame(self):
+        self.buffer_audio_func = MagicMock(side_effect=[120 * SAMPLE_RATE, 60 * SAMPLE_RATE, 90 * SAMPLE_RATE])
+        self.player = self._create_mocked_player()
+        self._get_player_to_stopped()
+
+        self.player.play()
+        self.player.playing(SAMPLE_RATE)
+        self.player.seek(60 * SAMPLE_RATE)
+
+        # the rest of the track is streamed, frames still count from its start
+        self.buffer_audio_func.assert_called_with('/fake_path/01 track.flac', 60 * SAMPLE_RATE)
+        self.stop_audio_func.assert_called_once_with()
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.current_track, 1)
+        self.assertEqual(self.player.current_frame, 60 * SAMPLE_RATE)
+        self.assertEqual(self.player.total_frames, 120 * SAMPLE_RATE)
+        self.assertEqual(self.player.next_track_frames, None)
+
+        # the next track follows as usual
+        self.player.playing(55 * SAMPLE_RATE)
+        self.assertEqual(self.player.next_track_frames, 90 * SAMPLE_RATE)
+        self.player.playing(6 * SAMPLE_RATE)
+        self.assertEqual(self.player.current_track, 2)
+        self.assertEqual(self.player.current_frame, SAMPLE_RATE)
+
+    def test_seek_drops_buffered_next_track(self):
+        self.player.play()
+        self.player.playing(self.track_frames_total - 10 * SAMPLE_RATE)
+        self.assertEqual(self.player.next_track_frames, self.track_frames_total)
+
+        self.player.seek(0)
+        self.assertEqual(self.player.current_frame, 0)
+        self.assertEqual(self.player.next_track_frames, None)
+        self.buffer_audio_func.assert_called_with('/fake_path/01 track.flac')
+
+    def test_seek_out_of_bounds(self):
+        self.player.play()
+        self.player.seek(-SAMPLE_RATE)
+        self.assertEqual(self.player.current_frame, 0)
+
+        self.player.seek(self.track_frames_total + SAMPLE_RATE)
+        self.assertEqual(self.player.current_frame, self.track_frames_total - 1)
+        self.assertEqual(self.player.current_track, 1)
+
+    def test_seek_when_paused(self):
+        self.player.play()
+        self.player.pause()
+        self.pause_audio_func.reset_mock()
+
+        self.resume_audio_func.reset_mock()
+
+        self.player.seek(SAMPLE_RATE)
+        self.assertEqual(self.player.state, PlayerStates.PAUSED)
+        self.assertEqual(self.player.current_frame, SAMPLE_RATE)
+        self.buffer_audio_func.assert_called_with('/fake_path/01 track.flac', SAMPLE_RATE)
+        # the new stream stays paused, not a moment of it is played
+        self.resume_audio_func.assert_not_called()
+        self.pause_audio_func.assert_not_called()
+
+    def test_seek_when_stopped(self):
+        self.assertRaises(MachineError, self.player.seek, SAMPLE_RATE)
+        self.buffer_audio_func.assert_not_called()
+
+
+class LibraryAlbumTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.track_list = [
+            '/music/Artist/Album/01 track.flac',
+            '/music/Artist/Album/02 track.flac',
+            '/music/Artist/Album/03 track.flac',
+        ]
+        self.disc_meta = {
+            'disc_id': 'library_disc_id',
+            'tracks': [
+                {},
+                {},
+                {}
+            ]
+        }
+        self.track_frames_total = 2 * 60 * SAMPLE_RATE
+
+        self.start_audio_func = MagicMock()
+        self.buffer_audio_func = MagicMock(return_value=self.track_frames_total)
+        self.stop_audio_func = MagicMock()
+        self.pause_audio_func = MagicMock()
+        self.resume_audio_func = MagicMock()
+        self.after_state_change_callback = MagicMock()
+
+        self.player = create_player(
+            self.start_audio_func,
+            self.buffer_audio_func,
+            self.stop_audio_func,
+            self.pause_audio_func,
+            self.resume_audio_func,
+            self.after_state_change_callback
+        )
+        self.player.init()
+
+    def test_play_album_without_disc(self):
+        self.assertTrue(self.player.play_album(self.track_list, self.disc_meta))
+
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.get_full_state()['source'], PlayerSources.LIBRARY)
+        self.assertEqual(self.player.current_track, 1)
+        self.start_audio_func.assert_called_once_with()
+        self.buffer_audio_func.assert_called_once_with('/music/Artist/Album/01 track.flac')
+        self.resume_audio_func.assert_called_once_with()
+
+    def test_next_track_buffered_on_time(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+
+        self.buffer_audio_func.assert_has_calls([
+            call('/music/Artist/Album/01 track.flac'),
+            call('/music/Artist/Album/02 track.flac')
+        ])
+
+    def test_next_and_prev(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+
+        self.assertTrue(self.player.next())
+        self.assertTrue(self.player.next())
+        self.assertFalse(self.player.next())
+        self.assertEqual(self.player.current_track, 3)
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+
+        self.assertTrue(self.player.prev())
+        self.assertEqual(self.player.current_track, 2)
+        self.buffer_audio_func.assert_called_with('/music/Artist/Album/02 track.flac')
+
+    def test_album_finishes(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+        self.player.next()
+        self.player.next()
+
+        self.player.finish()
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+
+        # and plays again from where it was
+        self.assertTrue(self.player.play())
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+
+    def test_ripper_and_disc_updates_ignored(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+
+        self.assertFalse(self.player.ripper_update(['/music/Other/01 track.flac']))
+        self.assertFalse(self.player.disc_meta_update({'disc_id': 'other_disc_id', 'tracks': []}))
+
+        self.assertIs(self.player.track_list, self.track_list)
+        self.assertIs(self.player.disc_meta, self.disc_meta)
+
+    def test_album_replaces_disc(self):
+        self.player.start(['/fake_path/01 track.flac'], {'disc_id': 'disc_id', 'tracks': [{}]})
+        self.player.play()
+
+        self.assertTrue(self.player.play_album(self.track_list, self.disc_meta))
+
+        self.stop_audio_func.assert_called_once_with()
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertIs(self.player.track_list, self.track_list)
+        self.buffer_audio_func.assert_called_with('/music/Artist/Album/01 track.flac')
+
+    def test_inserted_disc_replaces_album(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+        self.stop_audio_func.reset_mock()
+
+        disc_track_list = []
+        disc_meta = {'disc_id': 'disc_id', 'tracks': [{}]}
+        self.assertTrue(self.player.start(disc_track_list, disc_meta))
+
+        self.stop_audio_func.assert_called_once_with()
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.assertEqual(self.player.get_full_state()['source'], PlayerSources.DISC)
+        self.assertIs(self.player.track_list, disc_track_list)
+        self.assertIs(self.player.disc_meta, disc_meta)
+
+        # the disc is ripping now
+        self.assertTrue(self.player.ripper_update(['/fake_path/01 track.flac']))
+
+    def test_unknown_disc_replaces_album(self):
+        self.player.play_album(self.track_list, self.disc_meta)
+
+        self.assertTrue(self.player.unknown_disc())
+
+        self.assertEqual(self.player.state, PlayerStates.UNKNOWN_DISC)
+        self.assertEqual(self.player.track_list, [])
+
+    def test_inserted_disc_doesnt_replace_disc(self):
+        self.player.start(['/fake_path/01 track.flac'], {'disc_id': 'disc_id', 'tracks': [{}]})
+
+        self.assertFalse(self.player.start([], {'disc_id': 'other_disc_id', 'tracks': [{}]}))
+        self.assertEqual(self.player.disc_meta['disc_id'], 'disc_id')
+
+
+class PlayQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.album_1 = (
+            ['/music/A/01 track.flac', '/music/A/02 track.flac'],
+            {'disc_id': 'disc_a', 'tracks': [{}, {}]}
+        )
+        self.album_2 = (
+            ['/music/B/01 track.flac', '/music/B/02 track.flac', '/music/B/03 track.flac'],
+            {'disc_id': 'disc_b', 'tracks': [{}, {}, {}]}
+        )
+        self.track_frames_total = 2 * 60 * SAMPLE_RATE
+
+        self.play_queue = PlayQueue()
+        self.player = self._create_mocked_player()
+
+    def _create_mocked_player(self):
+        self.start_audio_func = MagicMock()
+        self.buffer_audio_func = MagicMock(return_value=self.track_frames_total)
+        self.stop_audio_func = MagicMock()
+        self.pause_audio_func = MagicMock()
+        self.resume_audio_func = MagicMock()
+        self.after_state_change_callback = MagicMock()
+
+        return create_player(
+            self.start_audio_func,
+            self.buffer_audio_func,
+            self.stop_audio_func,
+            self.pause_audio_func,
+            self.resume_audio_func,
+            self.after_state_change_callback,
+            self.play_queue
+        )
+
+    def _play_last_track_of_first_album(self):
+        self.player.init()
+        self.player.play_album(*self.album_1)
+        self.player.queue_album(*self.album_2)
+        self.player.next()
+        self.assertEqual(self.player.current_track, 2)
+        self.start_audio_func.reset_mock()
+        self.buffer_audio_func.reset_mock()
+
+    def test_queue_album_when_nothing_loaded(self):
+        self.player.init()
+        self.assertTrue(self.player.queue_album(*self.album_1))
+
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.assertEqual(self.player.get_full_state()['source'], PlayerSources.LIBRARY)
+        self.assertEqual(self.player.track_list, self.album_1[0])
+        self.assertEqual(len(self.play_queue), 0)
+
+    def test_queue_album_while_playing(self):
+        self.player.init()
+        self.player.play_album(*self.album_1)
+        self.assertTrue(self.player.queue_album(*self.album_2))
+
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.track_list, self.album_1[0])
+        self.assertEqual(self.player.get_full_state()['queue'], ['disc_b'])
+
+    def test_next_album_buffered_before_the_end(self):
+        self._play_last_track_of_first_album()
+
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+
+        # the audio is told another album starts, for its transition
+        self.buffer_audio_func.assert_called_with('/music/B/01 track.flac', album_changed=True)
+        self.assertEqual(self.player.next_track_frames, self.track_frames_total)
+        # it stays queued until it's playing
+        self.assertEqual(self.play_queue.disc_ids(), ['disc_b'])
+
+    def test_gapless_transition_to_next_album(self):
+        self._play_last_track_of_first_album()
+
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+        self.player.playing(20 * SAMPLE_RATE + SAMPLE_RATE)
+
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.track_list, self.album_2[0])
+        self.assertEqual(self.player.disc_meta, self.album_2[1])
+        self.assertEqual(self.player.current_track, 1)
+        self.assertEqual(self.player.current_frame, SAMPLE_RATE)
+        self.assertEqual(self.play_queue.current, self.album_2)
+        self.assertEqual(len(self.play_queue), 0)
+        self.start_audio_func.assert_not_called()
+
+    def test_next_into_queued_album(self):
+        self._play_last_track_of_first_album()
+
+        self.assertTrue(self.player.next())
+
+        self.assertEqual(self.player.track_list, self.album_2[0])
+        self.assertEqual(self.player.current_track, 1)
+        self.buffer_audio_func.assert_called_with('/music/B/01 track.flac')
+
+        self.assertFalse(self.player.prev())
+
+    def test_album_queued_too_late_to_buffer(self):
+        self.player.init()
+        self.player.play_album(*self.album_1)
+        self.player.next()
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+        self.player.queue_album(*self.album_2)
+
+        # audio ran out, the queued album starts on a new stream
+        self.assertTrue(self.player.finish())
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.track_list, self.album_2[0])
+        self.assertEqual(self.start_audio_func.call_count, 3)
+
+    def test_finish_with_empty_queue(self):
+        self._play_last_track_of_first_album()
+        self.player.queue_clear()
+
+        self.assertTrue(self.player.finish())
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.assertEqual(self.player.track_list, self.album_1[0])
+
+    def test_queue_cleared_after_next_album_buffered(self):
+        self._play_last_track_of_first_album()
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+        self.player.queue_clear()
+
+        # the album already in the audio stream plays
+        self.player.playing(20 * SAMPLE_RATE + SAMPLE_RATE)
+        self.assertEqual(self.player.state, PlayerStates.PLAYING)
+        self.assertEqual(self.player.track_list, self.album_2[0])
+        self.assertEqual(self.play_queue.current, self.album_2)
+        self.assertEqual(len(self.play_queue), 0)
+
+    def test_album_queued_after_next_album_buffered_stays_queued(self):
+        self._play_last_track_of_first_album()
+        self.player.playing(self.track_frames_total - 20 * SAMPLE_RATE)
+        self.player.queue_clear()
+        self.player.queue_album(*self.album_1)
+
+        self.player.playing(20 * SAMPLE_RATE + SAMPLE_RATE)
+        self.assertEqual(self.player.track_list, self.album_2[0])
+        self.assertEqual(self.play_queue.disc_ids(), ['disc_a'])
+
+    def test_disc_continues_into_queue(self):
+        self.player.init()
+        self.player.start(['/fake_path/01 track.flac'], {'disc_id': 'disc_id', 'tracks': [{}]})
+        self.player.queue_album(*self.album_1)
+        self.player.play()
+
+        self.assertTrue(self.player.next())
+        self.assertEqual(self.player.get_full_state()['source'], PlayerSources.LIBRARY)
+        self.assertEqual(self.player.track_list, self.album_1[0])
+
+    def test_restored_after_restart(self):
+        self._play_last_track_of_first_album()
+
+        self.player = self._create_mocked_player()
+        self.player.init()
+
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.assertEqual(self.player.track_list, self.album_1[0])
+        self.assertEqual(self.player.current_track, 1)
+        self.assertEqual(self.play_queue.disc_ids(), ['disc_b'])
+
+    def test_eject_forgets_current_album(self):
+        self.player.init()
+        self.player.play_album(*self.album_1)
+        self.player.eject()
+
+        self.assertIsNone(self.play_queue.current)
+
+    def test_upcoming_tracks(self):
+        self._play_last_track_of_first_album()
+
+        self.assertEqual(self.player.upcoming_tracks(), ['/music/A/02 track.flac'] + self.album_2[0])
+
+
+class ResumePositionTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.track_list = [
+            '/fake_path/01 track.flac',
+            '/fake_path/02 track.flac',
+            '/fake_path/03 track.flac',
+        ]
+        self.disc_meta = {'disc_id': 'disc_id', 'tracks': [{}, {}, {}]}
+        self.track_frames_total = 2 * 60 * SAMPLE_RATE
+
+        self.play_queue = PlayQueue()
+        self.resume_positions = ResumePositions()
+        self.player = self._create_mocked_player()
+
+    def _create_mocked_player(self):
+        self.start_audio_func = MagicMock()
+        self.buffer_audio_func = MagicMock(return_value=self.track_frames_total)
+        self.stop_audio_func = MagicMock()
+        self.pause_audio_func = MagicMock()
+        self.resume_audio_func = MagicMock()
+        self.after_state_change_callback = MagicMock()
+
+        player = create_player(
+            self.start_audio_func,
+            self.buffer_audio_func,
+            self.stop_audio_func,
+            self.pause_audio_func,
+            self.resume_audio_func,
+            self.after_state_change_callback,
+            self.play_queue,
+            self.resume_positions
+        )
+        player.init()
+        return player
+
+    def _play_into_second_track(self):
+        self.player.start(self.track_list, self.disc_meta)
+        self.player.next()
+        self.player.play()
+        self.player.playing(30 * SAMPLE_RATE)
+
+    def test_position_kept_while_playing(self):
+        self._play_into_second_track()
+        self.assertEqual(self.resume_positions.get('disc_id'), (2, 30 * SAMPLE_RATE))
+
+    def test_reinserted_disc_resumes(self):
+        self._play_into_second_track()
+        self.player.eject()
+
+        self.player.start(self.track_list, self.disc_meta)
+        self.assertEqual(self.player.current_track, 2)
+        self.player.play()
+
+        # a seek into the track, the stream starts at the frame left at
+        self.buffer_audio_func.assert_called_with('/fake_path/02 track.flac', 30 * SAMPLE_RATE)
+        self.assertEqual(self.player.current_frame, 30 * SAMPLE_RATE)
+        self.assertEqual(self.player.total_frames, 30 * SAMPLE_RATE + self.track_frames_total)
+
+    def test_restart_resumes(self):
+        self._play_into_second_track()
+        self.player.pause()
+
+        self.player = self._create_mocked_player()
+        self.player.start(self.track_list, self.disc_meta)
+        self.player.play()
+        self.buffer_audio_func.assert_called_once_with('/fake_path/02 track.flac', 30 * SAMPLE_RATE)
+
+    def test_track_change_drops_resume_frame(self):
+        self._play_into_second_track()
+        self.player.eject()
+
+        self.player.start(self.track_list, self.disc_meta)
+        self.player.next()
+        self.player.play()
+        self.buffer_audio_func.assert_called_with('/fake_path/03 track.flac')
+        self.assertEqual(self.player.current_frame, 0)
+
+    def test_finished_disc_starts_over(self):
+        self._play_into_second_track()
+        self.player.next()
+        self.player.finish()
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.player.eject()
+
+        self.assertIsNone(self.resume_positions.get('disc_id'))
+        self.player.start(self.track_list, self.disc_meta)
+        self.assertEqual(self.player.current_track, 1)
+
+    def test_position_outside_disc_ignored(self):
+        self.resume_positions.update('disc_id', 5, SAMPLE_RATE)
+
+        self.player.start(self.track_list, self.disc_meta)
+        self.player.play()
+        self.assertEqual(self.player.current_track, 1)
+        self.buffer_audio_func.assert_called_with('/fake_path/01 track.flac')
+
+    def test_queued_album_resumes_after_restart(self):
+        self.player.queue_album(self.track_list, self.disc_meta)
+        self.player.next()
+        self.player.next()
+        self.player.play()
+        self.player.playing(10 * SAMPLE_RATE)
+        self.player.stop()
+
+        self.player = self._create_mocked_player()
+        self.assertEqual(self.player.state, PlayerStates.STOPPED)
+        self.assertEqual(self.player.current_track, 3)
+        self.player.play()
+        self.buffer_audio_func.assert_called_once_with('/fake_path/03 track.flac', 10 * SAMPLE_RATE)
@@ -1,3 +1,393 @@
+from concurrent.futures import Future
+import json
+import logging
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+# hifi_appliance.commander imports hifi_appliance.disc, which needs libdiscid
+# unless the stand-in comes first
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim', 'pylib'))
+
+from hifi_appliance.commander import Commander
+from hifi_appliance.config import CD_DEVICE
+from hifi_appliance.daemons import CdpDaemon
+from hifi_appliance.playback import PlaybackCommand
+from hifi_appliance.ripping import RippingCommand
+
+
+INGEST_DEVICE = '/dev/sr1'
+
+
+class ManualExecutor(object):
+    """Runs what's submitted when a test says so, in the order it picks."""
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, func, *args):
+        future = Future()
+        self.calls.append((func, args, future))
+        return future
+
+    def run(self, func):
+        for (i, (submitted_func, args, future)) in enumerate(self.calls):
+            if submitted_func == func:
+                del self.calls[i]
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+                return
+        raise AssertionError('%s was not submitted' % func)
+
+
+class FakeIOLoop(object):
+    """Future callbacks run as the future completes, timeouts when fired."""
+    def __init__(self):
+        self.timeouts = []
+
+    def add_callback(self, callback, *args):
+        callback(*args)
+
+    def add_future(self, future, callback):
+        future.add_done_callback(callback)
+
+    def add_timeout(self, deadline, callback):
+        timeout = (deadline, callback)
+        self.timeouts.append(timeout)
+        return timeout
+
+    def remove_timeout(self, timeout):
+        self.timeouts.remove(timeout)
+
+    def fire_timeouts(self):
+        (timeouts, self.timeouts) = (self.timeouts, [])
+        for (_, callback) in timeouts:
+            callback()
+
+
+def sender():
+    """A Sender stand-in that, like the real one, only takes str."""
+    return MagicMock(send=MagicMock(side_effect=lambda *parts: [part.encode('ascii') for part in parts]))
+
+
+def disc_session(device):
+    session = MagicMock(device=device, disc_id='disc_%s' % device[-3:], toc='1 2 150 10000 20000')
+    session.read_toc.return_value = session.disc_id
+    session.track_durations.return_value = [60, 60]
+    session.toc_meta.return_value = {'disc_id': session.disc_id, 'tracks': [{}, {}]}
+    session.disc_meta.return_value = {'disc_id': session.disc_id, 'title': 'CD-TEXT', 'tracks': [{}, {}]}
+    session.add_pre_emphasis.return_value = False
+    return session
+
+
+def flag_second_track(disc_meta):
+    """add_pre_emphasis() once CD-TEXT flagged the second track."""
+    added = not disc_meta['tracks'][1].get('pre_emphasis')
+    disc_meta['tracks'][1]['pre_emphasis'] = True
+    return added
+
+
+class CommanderTestCase(unittest.TestCase):
+    """The Commander without forking or a message bus: look-ups run when a test says so."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        patch.object(CdpDaemon, '__init__', return_value=None).start()
+        patch('hifi_appliance.commander.DiscMetaCache').start()
+        patch('hifi_appliance.commander.OfflineMeta').start()
+        patch('hifi_appliance.commander.RemoteMeta').start()
+        patch('hifi_appliance.commander.DiscSession', side_effect=disc_session).start()
+        self.eject = patch('hifi_appliance.commander.subprocess.call').start()
+        patch('hifi_appliance.commander.os.system').start()
+
+        self.commander = Commander(None)
+        self.commander._io_loop = self.io_loop = FakeIOLoop()
+        self.commander.lookup_executor = self.executor = ManualExecutor()
+        self.commander.state_sender = sender()
+        self.commander.playback_command = sender()
+        self.commander.ripper_command = sender()
+
+        self.commander.db = MagicMock()
+        self.commander.db.has_disc.return_value = False
+        self.commander.db.is_indexing.return_value = False
+        self.commander.db.find_similar_disc.return_value = None
+
+        self.commander.offline_meta.query.return_value = None
+        self.commander.remote_meta = MagicMock()
+        self.commander.remote_meta.query.return_value = {'disc_id': 'disc_sr0', 'title': 'MusicBrainz', 'tracks': [{}, {}]}
+
+    def tearDown(self):
+        patch.stopall()
+
+    def insert(self, device=None):
+        self.commander.command_disc([device.encode('ascii')] if device else [])
+        session = self.commander.disc_sessions[device or CD_DEVICE]
+        self.executor.run(self.commander.identify_disc)
+        return session
+
+    def ripper_calls(self):
+        return [call.args for call in self.commander.ripper_command.send.call_args_list]
+
+    def playback_calls(self):
+        return [call.args for call in self.commander.playback_command.send.call_args_list]
+
+
+class IngestDriveTestCase(CommanderTestCase):
+    def test_new_disc_ripped_without_playing(self):
+        session = self.insert(INGEST_DEVICE)
+        self.executor.run(session.disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [
+            (RippingCommand.START, json.dumps(session.disc_meta.return_value), INGEST_DEVICE)
+        ])
+        self.assertEqual(self.playback_calls(), [])
+
+    def test_known_disc(self):
+        self.commander.db.has_disc.return_value = True
+        self.commander.db.get_disc.return_value = (['01.flac', '02.flac'], {'title': 'Ripped'})
+        self.insert(INGEST_DEVICE)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.KNOWN_DISC, INGEST_DEVICE)])
+        self.assertEqual(self.playback_calls(), [])
+
+    def test_playback_drive_still_played(self):
+        session = self.insert()
+        self.executor.run(session.disc_meta)
+
+        self.assertEqual(self.playback_calls()[0][0], PlaybackCommand.START)
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, json.dumps(session.disc_meta.return_value))])
+
+    def test_eject(self):
+        self.insert(INGEST_DEVICE)
+        self.commander.command_eject([INGEST_DEVICE.encode('ascii')])
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.EJECT, INGEST_DEVICE)])
+        self.eject.assert_called_once_with(['eject', INGEST_DEVICE])
+        self.assertNotIn(INGEST_DEVICE, self.commander.disc_sessions)
+
+
+class LookupTestCase(CommanderTestCase):
+    """Drives are read off the io_loop, results for a disc that's gone are dropped."""
+    def test_drive_read_off_io_loop(self):
+        self.commander.command_disc([])
+        session = self.commander.disc_sessions[CD_DEVICE]
+
+        session.read_toc.assert_not_called()
+        self.executor.run(self.commander.identify_disc)
+        session.read_toc.assert_called_once_with()
+
+    def test_result_for_ejected_disc_dropped(self):
+        session = self.insert()
+        self.commander.command_eject([])
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.executor.run(session.disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.EJECT,)])
+        self.assertEqual(self.playback_calls()[-1], (PlaybackCommand.EJECT,))
+        self.assertEqual(self.io_loop.timeouts, [])
+
+    def test_result_for_replaced_disc_dropped(self):
+        self.commander.command_disc([])
+        self.commander.command_disc([])
+        self.commander.db.has_disc.return_value = True
+        self.commander.db.get_disc.return_value = (['01.flac', '02.flac'], {'title': 'Ripped'})
+
+        # the first disc's look-up finishes after the second disc went in
+        self.executor.run(self.commander.identify_disc)
+        self.assertEqual(self.playback_calls(), [])
+        self.assertEqual(self.ripper_calls(), [])
+
+        self.executor.run(self.commander.identify_disc)
+        self.assertEqual(self.playback_calls(), [
+            (PlaybackCommand.START, json.dumps(['01.flac', '02.flac']), json.dumps({'title': 'Ripped'}))
+        ])
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.KNOWN_DISC,)])
+
+    def test_failed_lookup(self):
+        self.commander.command_disc([])
+        self.commander.disc_sessions[CD_DEVICE].read_toc.side_effect = OSError()
+        self.executor.run(self.commander.identify_disc)
+
+        self.assertEqual(self.playback_calls(), [(PlaybackCommand.UNKNOWN_DISC,)])
+
+
+class DiscLookupRaceTestCase(CommanderTestCase):
+    """
+    Ripping starts once CD-TEXT is read, with MusicBrainz names if they came
+    first; MusicBrainz replaces CD-TEXT names until DISC_LOOKUP_DEADLINE.
+    """
+    def setUp(self):
+        super(DiscLookupRaceTestCase, self).setUp()
+        self.session = self.insert()
+        self.cd_text_meta = json.dumps(self.session.disc_meta.return_value)
+        self.online_meta = json.dumps(dict(self.commander.remote_meta.query.return_value, toc=self.session.toc))
+
+    def test_playback_starts_from_toc(self):
+        self.assertEqual(self.playback_calls(), [
+            (PlaybackCommand.START, json.dumps([]), json.dumps(self.session.toc_meta.return_value))
+        ])
+        self.assertEqual(len(self.io_loop.timeouts), 1)
+
+    def test_musicbrainz_first(self):
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.assertEqual(self.ripper_calls(), [])
+        self.executor.run(self.session.disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, self.online_meta)])
+        self.assertEqual(self.playback_calls()[1:], [(PlaybackCommand.DISC_META_UPDATE, self.online_meta)])
+        self.assertEqual(self.io_loop.timeouts, [])
+
+    def test_cd_text_then_musicbrainz_before_deadline(self):
+        self.executor.run(self.session.disc_meta)
+        self.executor.run(self.commander.get_remote_disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [
+            (RippingCommand.START, self.cd_text_meta),
+            (RippingCommand.DISC_META_UPDATE, self.online_meta)
+        ])
+        self.assertEqual(self.playback_calls()[1:], [
+            (PlaybackCommand.DISC_META_UPDATE, self.cd_text_meta),
+            (PlaybackCommand.DISC_META_UPDATE, self.online_meta)
+        ])
+        self.assertEqual(self.io_loop.timeouts, [])
+
+    def test_cd_text_then_musicbrainz_after_deadline(self):
+        self.executor.run(self.session.disc_meta)
+        self.io_loop.fire_timeouts()
+        self.executor.run(self.commander.get_remote_disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, self.cd_text_meta)])
+        self.assertEqual(self.playback_calls()[1:], [(PlaybackCommand.DISC_META_UPDATE, self.cd_text_meta)])
+
+    def test_musicbrainz_after_deadline_before_cd_text(self):
+        self.io_loop.fire_timeouts()
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.assertEqual(self.ripper_calls(), [])
+
+        self.executor.run(self.session.disc_meta)
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, self.cd_text_meta)])
+
+    def test_unknown_to_musicbrainz(self):
+        self.commander.remote_meta.query.return_value = None
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.executor.run(self.session.disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, self.cd_text_meta)])
+
+    def test_other_track_count_keeps_cd_text(self):
+        self.commander.remote_meta.query.return_value = {'title': 'MusicBrainz', 'tracks': [{}]}
+        self.executor.run(self.session.disc_meta)
+        self.executor.run(self.commander.get_remote_disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, self.cd_text_meta)])
+
+
+class PreEmphasisTestCase(CommanderTestCase):
+    """Pre-emphasis flags come from CD-TEXT, whenever that's read."""
+    def test_online_meta_first(self):
+        session = self.insert(INGEST_DEVICE)
+        self.executor.run(self.commander.get_remote_disc_meta)
+
+        # no track is ripped before its flag is known
+        self.assertEqual(self.ripper_calls(), [])
+
+        session.add_pre_emphasis.side_effect = flag_second_track
+        self.executor.run(session.disc_meta)
+
+        self.assertEqual(len(self.ripper_calls()), 1)
+        (command, disc_meta, _) = self.ripper_calls()[0]
+        self.assertEqual(command, RippingCommand.START)
+        self.assertEqual(json.loads(disc_meta)['title'], 'MusicBrainz')
+        self.assertTrue(json.loads(disc_meta)['tracks'][1]['pre_emphasis'])
+
+    def test_ejected_while_reading_cd_text(self):
+        session = self.insert(INGEST_DEVICE)
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.commander.command_eject([INGEST_DEVICE.encode('ascii')])
+        self.executor.run(session.disc_meta)
+
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.EJECT, INGEST_DEVICE)])
+        self.assertEqual(self.commander.held_disc_meta, {})
+        self.assertEqual(self.commander.reading_cd_text, set())
+
+    def test_cd_text_first(self):
+        session = self.insert(INGEST_DEVICE)
+        self.executor.run(session.disc_meta)
+        session.add_pre_emphasis.side_effect = flag_second_track
+        self.executor.run(self.commander.get_remote_disc_meta)
+
+        (command, disc_meta, _) = self.ripper_calls()[1]
+        self.assertEqual(command, RippingCommand.DISC_META_UPDATE)
+        self.assertEqual(json.loads(disc_meta)['title'], 'MusicBrainz')
+        self.assertTrue(json.loads(disc_meta)['tracks'][1]['pre_emphasis'])
+
+
+class IndexingTestCase(CommanderTestCase):
+    """A disc inserted while the library is indexed is taken as new, and looked up again once it is."""
+    def setUp(self):
+        super(IndexingTestCase, self).setUp()
+        self.commander.db.is_indexing.return_value = True
+        self.commander.db.get_disc.return_value = (['01.flac', '02.flac'], {'title': 'Ripped'})
+
+    def index(self, has_disc):
+        self.commander.db.is_indexing.return_value = False
+        self.commander.db.has_disc.return_value = has_disc
+        self.commander.on_indexed()
+
+    def test_ripped_as_new_until_found(self):
+        session = self.insert()
+        self.executor.run(session.disc_meta)
+
+        self.assertFalse(self.commander.db.wait_until_indexed.called)
+        self.assertEqual(self.ripper_calls(), [(RippingCommand.START, json.dumps(session.disc_meta.return_value))])
+
+        self.index(has_disc=True)
+        self.executor.run(self.commander.find_known_disc)
+
+        self.assertEqual(self.ripper_calls()[1:], [(RippingCommand.EJECT,), (RippingCommand.KNOWN_DISC,)])
+        self.assertEqual(self.playback_calls()[-2:], [
+            (PlaybackCommand.EJECT,),
+            (PlaybackCommand.START, json.dumps(['01.flac', '02.flac']), json.dumps({'title': 'Ripped'}))
+        ])
+
+        # online meta for the disc that was taken as new is dropped
+        self.executor.run(self.commander.get_remote_disc_meta)
+        self.assertEqual(len(self.ripper_calls()), 3)
+
+    def test_still_new_once_indexed(self):
+        session = self.insert(INGEST_DEVICE)
+        self.executor.run(session.disc_meta)
+
+        self.index(has_disc=False)
+        self.executor.run(self.commander.find_known_disc)
+
+        self.assertEqual([call[0] for call in self.ripper_calls()], [RippingCommand.START])
+
+    def test_indexed_during_lookup(self):
+        # the scan finished after the DB was asked, before the result was
+        # back on the io_loop: on_indexed has come and gone
+        self.commander.db.is_indexing.side_effect = [True, False]
+        self.commander.command_disc([INGEST_DEVICE.encode('ascii')])
+        self.executor.run(self.commander.identify_disc)
+
+        self.assertEqual(self.commander.discs_identified_while_indexing, {})
+        self.commander.db.has_disc.return_value = True
+        self.executor.run(self.commander.find_known_disc)
+
+        self.assertEqual([call[0] for call in self.ripper_calls()][-2:], [RippingCommand.EJECT, RippingCommand.KNOWN_DISC])
+
+    def test_ejected_before_indexed(self):
+        self.insert(INGEST_DEVICE)
+        self.commander.command_eject([INGEST_DEVICE.encode('ascii')])
+
+        self.assertEqual(self.commander.discs_identified_while_indexing, {})
+        self.index(has_disc=True)
+        self.assertNotIn(self.commander.find_known_disc, [func for (func, _, _) in self.executor.calls])
+
+
 # this code has been moved out of playback state machine and needs to make its
 # way back
 
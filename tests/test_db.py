@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from hifi_appliance.constants import CHANNELS
+from hifi_appliance.constants import SAMPLE_RATE
+from hifi_appliance.db import TrackDB
+from hifi_appliance.meta import LocalMeta
+from hifi_appliance.meta import write_meta
+from tests.sim.drive import write_flac
+
+
+def write_album(folder, disc_id, seconds, tagged=True):
+    folder.mkdir(parents=True)
+    folder.joinpath('.disc_id').write_text(disc_id)
+    for (i, length) in enumerate(seconds):
+        track_path = str(folder.joinpath('%02d Track.flac' % (i + 1)))
+        write_flac(track_path, b'\0' * (length * SAMPLE_RATE * 4))
+        if tagged:
+            write_meta(track_path, 'Artist', 'Track %d' % (i + 1), folder.name, i + 1, len(seconds))
+
+
+class TrackDBTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.music_path = Path(self.tmp_dir.name).joinpath('music')
+        self.db_path = os.path.join(self.tmp_dir.name, 'tracks.db')
+
+        write_album(self.music_path.joinpath('Artist', 'Album'), 'disc_id', [3, 2, 4])
+
+        patch('hifi_appliance.db.db.DB_FILE_PATH', self.db_path).start()
+        patch('hifi_appliance.db.db.MUSIC_PATH_NAME', str(self.music_path)).start()
+        patch('hifi_appliance.db.db.DB_REBUILD_INTERVAL', 3600).start()
+        patch('hifi_appliance.db.db.DB_SCAN_INTERVAL', 3600).start()
+        patch('hifi_appliance.db.db.DB_WATCH', False).start()
+        patch('hifi_appliance.db.db.DB_WATCH_DELAY', 0.1).start()
+
+        self.dbs = []
+
+    def tearDown(self):
+        for db in self.dbs:
+            db.close()
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def open_db(self):
+        db = TrackDB()
+        self.dbs.append(db)
+        db.start()
+        self.assertTrue(db.wait_until_indexed(timeout=5))
+        return db
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.fail('Timed out')
+            time.sleep(0.05)
+
+    def test_indexed_in_background(self):
+        db = TrackDB()
+        self.dbs.append(db)
+        self.assertTrue(db.is_indexing())
+        self.assertEqual(db.count(), 0)
+
+        on_indexed = MagicMock()
+        db.start(on_indexed)
+        self.assertTrue(db.wait_until_indexed(timeout=5))
+        self.assertFalse(db.is_indexing())
+        on_indexed.assert_called_once_with()
+        self.assertTrue(db.has_disc('disc_id'))
+
+    def test_indexes_loaded_in_background(self):
+        self.open_db().close()
+
+        db = TrackDB()
+        self.dbs.append(db)
+        self.assertEqual(len(db.library), 0)
+        self.assertIsNone(db.find_similar_disc([3 * SAMPLE_RATE, 2 * SAMPLE_RATE, 4 * SAMPLE_RATE]))
+
+        db.start()
+        self.assertTrue(db.wait_until_indexed(timeout=5))
+        self.assertEqual(len(db.library), 1)
+        self.assertEqual(db.find_similar_disc([3 * SAMPLE_RATE, 2 * SAMPLE_RATE, 4 * SAMPLE_RATE]), 'disc_id')
+
+    def test_new_db_built(self):
+        db = self.open_db()
+
+        self.assertEqual(db.count(), 1)
+        self.assertTrue(db.has_disc('disc_id'))
+        self.assertFalse(db.has_disc('other_disc_id'))
+        self.assertEqual(
+            [Path(path).name for path in db.get_track_list('disc_id')],
+            ['01 Track.flac', '02 Track.flac', '03 Track.flac']
+        )
+
+    def test_wal_mode(self):
+        self.open_db()
+        with sqlite3.connect(self.db_path) as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_similar_disc(self):
+        db = self.open_db()
+        self.assertEqual(db.find_similar_disc([3 * SAMPLE_RATE, 2 * SAMPLE_RATE, 5 * SAMPLE_RATE]), 'disc_id')
+        self.assertIsNone(db.find_similar_disc([3 * SAMPLE_RATE, 2 * SAMPLE_RATE, 7 * SAMPLE_RATE]))
+
+    def test_unchanged_folders_not_read(self):
+        db = self.open_db()
+        write_album(self.music_path.joinpath('Artist', 'Other Album'), 'other_disc_id', [1, 1, 1])
+
+        with patch('hifi_appliance.db.db._read_track', return_value=(None, None, None, None)) as read_track:
+            db.rebuild()
+
+        self.assertEqual(read_track.call_count, 3)
+        self.assertEqual(db.count(), 2)
+
+    def test_changed_folder_updated(self):
+        db = self.open_db()
+        album_path = self.music_path.joinpath('Artist', 'Album')
+        album_path.joinpath('03 Track.flac').unlink()
+
+        db.rebuild()
+
+        self.assertEqual(len(db.get_track_list('disc_id')), 2)
+
+    def test_removed_folder_forgotten(self):
+        db = self.open_db()
+        album_path = self.music_path.joinpath('Artist', 'Album')
+        for file_path in album_path.iterdir():
+            file_path.unlink()
+        album_path.rmdir()
+
+        db.rebuild()
+
+        self.assertFalse(db.has_disc('disc_id'))
+        self.assertEqual(db.count(), 0)
+
+    def test_unreadable_folder_kept(self):
+        db = self.open_db()
+        artist_path = str(self.music_path.joinpath('Artist'))
+        stat = os.stat
+
+        def failing_stat(path, *args, **kwargs):
+            if path == artist_path:
+                raise PermissionError(path)
+            return stat(path, *args, **kwargs)
+
+        with patch('hifi_appliance.db.db.os.stat', side_effect=failing_stat):
+            db.rebuild()
+
+        self.assertTrue(db.has_disc('disc_id'))
+        self.assertEqual(db.count(), 1)
+
+    def test_existing_db_kept(self):
+        self.open_db()
+        with patch('hifi_appliance.db.db.MUSIC_PATH_NAME', os.path.join(self.tmp_dir.name, 'elsewhere')):
+            self.assertTrue(self.open_db().has_disc('disc_id'))
+
+    def test_json_db_replaced(self):
+        Path(self.db_path).write_text(json.dumps({'disc_id': {'track_files': []}}))
+        db = self.open_db()
+        self.assertEqual(len(db.get_track_list('disc_id')), 3)
+
+    def test_unchanged_directories_not_listed(self):
+        db = self.open_db()
+        # directory mtimes are only trusted once they're a few seconds old
+        past = time.time() - 60
+        for path in [self.music_path, self.music_path.joinpath('Artist'), self.music_path.joinpath('Artist', 'Album')]:
+            os.utime(str(path), (past, past))
+        db.scan()
+
+        with patch('hifi_appliance.db.db.os.scandir', wraps=os.scandir) as scandir:
+            self.assertEqual(db.scan(), 0)
+        self.assertEqual([call[0][0] for call in scandir.call_args_list], [str(self.music_path)])
+
+        write_album(self.music_path.joinpath('Artist', 'Other Album'), 'other_disc_id', [1, 1, 1])
+        self.assertEqual(db.scan(), 1)
+        self.assertTrue(db.has_disc('other_disc_id'))
+
+    def test_scan_subtree(self):
+        db = self.open_db()
+        write_album(self.music_path.joinpath('Artist', 'Other Album'), 'other_disc_id', [1, 1, 1])
+        write_album(self.music_path.joinpath('Other Artist', 'Album'), 'third_disc_id', [1, 1, 1])
+
+        self.assertEqual(db.scan(str(self.music_path.joinpath('Artist'))), 1)
+        self.assertTrue(db.has_disc('other_disc_id'))
+        self.assertFalse(db.has_disc('third_disc_id'))
+        self.assertTrue(db.has_disc('disc_id'))
+
+    def test_changes_picked_up_by_watcher(self):
+        with patch('hifi_appliance.db.db.DB_WATCH', True):
+            db = self.open_db()
+            self.wait_for(lambda: db.watcher is not None)
+
+        write_album(self.music_path.joinpath('New Artist', 'New Album'), 'new_disc_id', [1, 1, 1])
+        self.wait_for(lambda: db.has_disc('new_disc_id'))
+
+        album_path = self.music_path.joinpath('Artist', 'Album')
+        album_path.joinpath('.disc_id').unlink()
+        self.wait_for(lambda: not db.has_disc('disc_id'))
+
+    def test_empty_library(self):
+        with patch('hifi_appliance.db.db.MUSIC_PATH_NAME', os.path.join(self.tmp_dir.name, 'elsewhere')):
+            db = self.open_db()
+        self.assertEqual(db.count(), 0)
+        self.assertIsNone(db.find_similar_disc([SAMPLE_RATE] * 3))
+
+    def test_scanned_in_parallel_batches(self):
+        for i in range(10):
+            write_album(self.music_path.joinpath('Artist %d' % i, 'Album'), 'disc_id_%d' % i, [1, 1, 1])
+
+        with patch('hifi_appliance.db.db.DB_SCAN_WORKERS', 3), patch('hifi_appliance.db.db.DB_SCAN_BATCH_SIZE', 2):
+            db = self.open_db()
+
+        self.assertEqual(db.count(), 11)
+        self.assertEqual(len(db.get_track_list('disc_id_9')), 3)
+
+    def test_disc_meta_from_db(self):
+        db = self.open_db()
+
+        with patch('mutagen.File') as mutagen_file:
+            (track_list, disc_meta) = db.get_disc('disc_id')
+        mutagen_file.assert_not_called()
+
+        self.assertEqual(track_list, db.get_track_list('disc_id'))
+        # the tag reader has the album as a list of values
+        self.assertEqual(disc_meta, LocalMeta().query('disc_id', track_list) | {'title': 'Album'})
+
+    def test_disc_meta_without_tags(self):
+        write_album(self.music_path.joinpath('Artist', 'Untagged'), 'untagged_disc_id', [1, 1, 1], tagged=False)
+        db = self.open_db()
+
+        (track_list, disc_meta) = db.get_disc('untagged_disc_id')
+        self.assertEqual(len(track_list), 3)
+        self.assertIsNone(disc_meta)
+
+    def test_retagged_album_updated(self):
+        db = self.open_db()
+        track_path = db.get_track_list('disc_id')[0]
+        write_meta(track_path, 'Other Artist', 'Other Title', 'Album', 1, 3)
+
+        db.scan(os.path.dirname(track_path))
+
+        self.assertEqual(db.get_disc('disc_id')[1]['tracks'][0]['artist'], 'Other Artist')
+
+    def test_albums(self):
+        # durations in the units of disc_meta
+        write_album(self.music_path.joinpath('Artist', 'Untagged'), 'untagged_disc_id', [1, 1, 1], tagged=False)
+        write_album(self.music_path.joinpath('Artist', 'Another Album'), 'other_disc_id', [1])
+        db = self.open_db()
+
+        self.assertEqual(db.library.albums()['items'], [
+            {
+                'disc_id': 'untagged_disc_id',
+                'artist': None,
+                'title': 'Untagged',
+                'track_count': 3,
+                'duration': 3 * SAMPLE_RATE // CHANNELS,
+            },
+            {
+                'disc_id': 'disc_id',
+                'artist': 'Artist',
+                'title': 'Album',
+                'track_count': 3,
+                'duration': 9 * SAMPLE_RATE // CHANNELS,
+            },
+            {
+                'disc_id': 'other_disc_id',
+                'artist': 'Artist',
+                'title': 'Another Album',
+                'track_count': 1,
+                'duration': SAMPLE_RATE // CHANNELS,
+            },
+        ])
+
+    def test_albums_updated(self):
+        db = self.open_db()
+        write_album(self.music_path.joinpath('Artist', 'Another Album'), 'other_disc_id', [1])
+
+        db.scan()
+
+        self.assertEqual([album['disc_id'] for album in db.library.albums()['items']], ['disc_id', 'other_disc_id'])
+
+    def test_search_albums(self):
+        write_album(self.music_path.joinpath('Artist', 'Another Album'), 'other_disc_id', [1, 1])
+        db = self.open_db()
+
+        self.assertEqual([album['disc_id'] for album in db.library.search('another')['items']], ['other_disc_id'])
+        self.assertEqual([album['disc_id'] for album in db.library.search('TRACK 3')['items']], ['disc_id'])
+        self.assertEqual(db.library.search('artist')['total'], 2)
@@ -1,65 +1,153 @@
 from collections import namedtuple
 import logging
 import os
+import shutil
+import sys
 import unittest
 from unittest.mock import patch
 
+# the stand-in for python-discid, drives are never read: discid.read is
+# patched by the tests that need a disc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim', 'pylib'))
+
 import discid
 
-from hifi_appliance.disc import read_disc_id
-from hifi_appliance.disc import read_disc_meta
+from hifi_appliance.disc import DiscSession
+from hifi_appliance.disc import read_disc_toc
 from hifi_appliance.disc.toc import Toc, TOCError
 
 
-class DiscIdTestCase(unittest.TestCase):
+class DiscSessionTestCase(unittest.TestCase):
     def setUp(self):
         logging.disable(logging.CRITICAL)
 
-    def test_read_disc_id_ok(self):
-        return_object = namedtuple('MockDisc', ['id'])
-        return_object.id = 'disc_id'
-        with patch('discid.read', return_value=return_object) as mock_method:
-            self.assertEqual(read_disc_id(), 'disc_id')
+        track = namedtuple('MockTrack', ['offset'])
+        self.disc = namedtuple('MockDisc', ['id', 'first_track_num', 'tracks', 'sectors', 'freedb_id'])(
+            'disc_id', 1, [track(150), track(15000), track(30000)], 45000, '1b02570d'
+        )
 
-    def test_fail_returns_none(self):
-        with patch('discid.read') as mock_method:
-            mock_method.side_effect = discid.disc.DiscError()
-            self.assertEqual(read_disc_id(), None)
+    def copy_toc(self, name):
+        toc_path = os.path.join(os.path.dirname(__file__), 'data', 'toc', name)
+        return lambda toc_filepath, device: shutil.copy(toc_path, toc_filepath)
 
+    def test_reads_toc_once(self):
+        with patch('discid.read', return_value=self.disc) as mock_read:
+            disc_session = DiscSession()
+            self.assertEqual(disc_session.read_toc(), 'disc_id')
+            disc_session.track_durations()
 
-class DiscMetaTestCase(unittest.TestCase):
-    def setUp(self):
-        logging.disable(logging.CRITICAL)
+        mock_read.assert_called_once()
+        self.assertEqual(disc_session.disc_id, 'disc_id')
+        self.assertEqual(disc_session.toc['offsets'], [150, 15000, 30000])
+        self.assertEqual(disc_session.track_durations(), [14850 * 588, 15000 * 588, 15000 * 588])
 
-    @patch('hifi_appliance.disc.disc._read_toc_into_file')
-    def test_no_cdtext(self, mocked_read_toc):
-        toc_path = os.path.join(os.path.dirname(__file__), 'data', 'toc', 'notext')
-        disc_meta = read_disc_meta('disc_id', str(toc_path))
+    def test_same_toc_without_session(self):
+        with patch('discid.read', return_value=self.disc):
+            disc_session = DiscSession()
+            disc_session.read_toc()
+            self.assertEqual(read_disc_toc(), disc_session.toc)
 
-        self.assertEqual(len(disc_meta['tracks']), 29)
-        self.assertRegex(disc_meta['title'], r'^Unknown Album.*$')
-        self.assertEqual(disc_meta['duration'], 197067024)
+        with patch('discid.read', side_effect=discid.disc.DiscError()):
+            self.assertIsNone(read_disc_toc())
+
+    def test_unreadable_disc(self):
+        disc_session = DiscSession()
+        with patch('discid.read', side_effect=discid.disc.DiscError()):
+            self.assertIsNone(disc_session.read_toc())
+
+        self.assertIsNone(disc_session.disc_id)
+        self.assertIsNone(disc_session.disc_meta())
+
+    @patch('hifi_appliance.disc.session.read_toc_into_file')
+    def test_cd_text_read_once(self, mocked_read_toc):
+        mocked_read_toc.side_effect = self.copy_toc('cdtext')
+
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+
+        mocked_read_toc.assert_not_called()
+
+        disc_meta = disc_session.disc_meta()
+        disc_session.disc_meta()
+
+        mocked_read_toc.assert_called_once()
+        self.assertEqual(disc_meta['title'], 'The Division Bell')
+        self.assertEqual(disc_meta['tracks'][0]['artist'], 'Pink Floyd')
+        self.assertEqual(disc_meta['tracks'][0]['duration'], 14850 * 588)
+        self.assertEqual(disc_meta['duration'], 44850 * 588)
+        self.assertEqual(disc_meta['toc'], disc_session.toc)
+
+    @patch('hifi_appliance.disc.session.read_toc_into_file')
+    def test_no_cd_text(self, mocked_read_toc):
+        mocked_read_toc.side_effect = self.copy_toc('notext')
+
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+        disc_meta = disc_session.disc_meta()
 
+        self.assertRegex(disc_meta['title'], r'^Unknown Album.*$')
         for track in disc_meta['tracks']:
             self.assertEqual(track['title'], 'Unknown Title')
             self.assertEqual(track['artist'], 'Unknown Artist')
 
-    @patch('hifi_appliance.disc.disc._read_toc_into_file')
-    def test_cdtext(self, mocked_read_toc):
-        toc_path = os.path.join(os.path.dirname(__file__), 'data', 'toc', 'cdtext')
-        disc_meta = read_disc_meta('disc_id', str(toc_path))
+    @patch('hifi_appliance.disc.session.read_toc_into_file')
+    def test_unparsable_toc(self, mocked_read_toc):
+        mocked_read_toc.side_effect = self.copy_toc('cdtext')
 
-        self.assertEqual(len(disc_meta['tracks']), 11)
-        self.assertEqual(disc_meta['title'], 'The Division Bell')
-        self.assertEqual(disc_meta['duration'], 175854336)
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+        with patch.object(Toc, '__init__', side_effect=TOCError()):
+            self.assertEqual(disc_session.cd_text(), {})
 
-        for track in disc_meta['tracks']:
-            self.assertNotEqual(track['title'], 'Unknown Track')
-            self.assertEqual(track['artist'], 'Pink Floyd')
-
-    @patch('hifi_appliance.disc.disc._read_toc_into_file')
-    def test_toc_error(self, mocked_read_toc):
-        toc_path = os.path.join(os.path.dirname(__file__), 'data', 'toc', 'cdtext')
-        with patch.object(Toc, '__init__', side_effect=TOCError()) as mock_method:
-            disc_meta = read_disc_meta('disc_id', str(toc_path))
-            self.assertEqual(None, disc_meta)
+        self.assertRegex(disc_session.disc_meta()['title'], r'^Unknown Album.*$')
+
+    def test_toc_meta_without_cd_text(self):
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+
+        with patch('hifi_appliance.disc.session.read_toc_into_file') as mocked_read_toc:
+            toc_meta = disc_session.toc_meta()
+            mocked_read_toc.assert_not_called()
+
+        self.assertEqual(len(toc_meta['tracks']), 3)
+        self.assertEqual(toc_meta['title'], disc_session.unknown_album_title())
+        self.assertEqual(toc_meta['tracks'][0]['title'], 'Unknown Title')
+
+    @patch('hifi_appliance.disc.session.read_toc_into_file')
+    def test_pre_emphasis(self, mocked_read_toc):
+        mocked_read_toc.side_effect = self.copy_toc('emphasis')
+
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+
+        # nothing to flag from until CD-TEXT has been read, and no waiting for it
+        remote_meta = {'tracks': [{'title': 'One'}, {'title': 'Two'}, {'title': 'Three'}]}
+        self.assertFalse(disc_session.add_pre_emphasis(remote_meta))
+        mocked_read_toc.assert_not_called()
+
+        disc_meta = disc_session.disc_meta()
+        self.assertEqual([track.get('pre_emphasis', False) for track in disc_meta['tracks']], [False, True, True])
+
+        # flags are added to meta from MusicBrainz without reading the TOC again
+        self.assertTrue(disc_session.add_pre_emphasis(remote_meta))
+        self.assertEqual([track.get('pre_emphasis', False) for track in remote_meta['tracks']], [False, True, True])
+        self.assertFalse(disc_session.add_pre_emphasis(remote_meta))
+        mocked_read_toc.assert_called_once()
+
+    @patch('hifi_appliance.disc.session.read_toc_into_file')
+    def test_pre_emphasis_track_count_mismatch(self, mocked_read_toc):
+        mocked_read_toc.side_effect = self.copy_toc('emphasis')
+
+        disc_session = DiscSession()
+        with patch('discid.read', return_value=self.disc):
+            disc_session.read_toc()
+        disc_session.disc_meta()
+
+        remote_meta = {'tracks': [{'title': 'One'}, {'title': 'Two'}]}
+        self.assertFalse(disc_session.add_pre_emphasis(remote_meta))
+        self.assertNotIn('pre_emphasis', remote_meta['tracks'][1])
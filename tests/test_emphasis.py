@@ -0,0 +1,91 @@
+import logging
+import math
+import random
+import struct
+import unittest
+
+from hifi_appliance.constants import SAMPLE_RATE
+from hifi_appliance.rip import DeEmphasisFilter
+from hifi_appliance.rip.emphasis import de_emphasis_coefficients
+
+
+def reference_de_emphasis(pcm_data):
+    """Straightforward per-sample implementation of the filter."""
+    (b0, b1, pole) = de_emphasis_coefficients()
+    samples = struct.unpack('<%dh' % (len(pcm_data) // 2), pcm_data)
+
+    filtered = []
+    last_input = [0.0, 0.0]
+    last_output = [0.0, 0.0]
+    for position, value in enumerate(samples):
+        channel = position % 2
+        output = b0 * value + b1 * last_input[channel] + pole * last_output[channel]
+        last_input[channel] = value
+        last_output[channel] = output
+        filtered.append(min(32767, max(-32768, round(output))))
+
+    return struct.pack('<%dh' % len(filtered), *filtered)
+
+
+def tone(frequency, frames, amplitude=10000):
+    samples = []
+    for frame in range(frames):
+        value = int(amplitude * math.sin(2 * math.pi * frequency * frame / SAMPLE_RATE))
+        samples += [value, value]
+    return struct.pack('<%dh' % len(samples), *samples)
+
+
+def peak(pcm_data, skip_frames=1000):
+    samples = struct.unpack('<%dh' % (len(pcm_data) // 2), pcm_data)
+    return max(abs(value) for value in samples[skip_frames * 2:])
+
+
+class DeEmphasisFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        rng = random.Random(42)
+        self.pcm_data = bytes(rng.getrandbits(8) for _ in range(4 * 10000))
+
+    def _filter(self, pcm_data, chunk_size):
+        de_emphasis = DeEmphasisFilter()
+        filtered = b''.join(
+            de_emphasis.process(pcm_data[start:start + chunk_size])
+            for start in range(0, len(pcm_data), chunk_size)
+        )
+        return filtered + de_emphasis.flush()
+
+    def test_matches_reference(self):
+        expected = reference_de_emphasis(self.pcm_data)
+
+        self.assertEqual(self._filter(self.pcm_data, len(self.pcm_data)), expected)
+
+    def test_chunk_size_doesnt_matter(self):
+        expected = reference_de_emphasis(self.pcm_data)
+
+        # chunks that split frames and samples
+        for chunk_size in (1, 3, 4, 7, 1000, 4097):
+            self.assertEqual(self._filter(self.pcm_data, chunk_size), expected)
+
+    def test_partial_frame_passed_through(self):
+        de_emphasis = DeEmphasisFilter()
+
+        self.assertEqual(de_emphasis.process(b'\x01\x02\x03'), b'')
+        self.assertEqual(de_emphasis.flush(), b'\x01\x02\x03')
+        self.assertEqual(de_emphasis.flush(), b'')
+
+    def test_bass_kept_treble_cut(self):
+        frames = SAMPLE_RATE // 10
+
+        self.assertAlmostEqual(peak(self._filter(tone(100, frames), 4096)), 10000, delta=20)
+
+        # the emphasis curve is 10 dB down at the top, 9 dB at 16 kHz
+        treble = peak(self._filter(tone(16000, frames), 4096))
+        self.assertAlmostEqual(20 * math.log10(treble / 10000), -9.0, delta=0.5)
+
+    def test_full_scale_stays_in_range(self):
+        square = struct.pack('<4h', 32767, 32767, -32768, -32768) * 5000
+
+        filtered = struct.unpack('<20000h', self._filter(square, 4096))
+        self.assertLessEqual(max(filtered), 32767)
+        self.assertGreaterEqual(min(filtered), -32768)
@@ -0,0 +1,106 @@
+import unittest
+
+from hifi_appliance.db import LibraryIndex
+from hifi_appliance.db import ORDER_TITLE
+
+
+def album(disc_id, artist, title, tracks):
+    return {
+        'disc_id': disc_id,
+        'artist': artist,
+        'title': title,
+        'track_count': len(tracks),
+        'duration': None,
+        'tracks': [(artist or 'Someone', track_title) for track_title in tracks],
+    }
+
+
+ALBUMS = [
+    album('disc_4', 'The Beatles', 'Revolver', ['Taxman', 'Eleanor Rigby']),
+    album('disc_1', 'Björk', 'Homogenic', ['Hunter', 'Jóga']),
+    album('disc_3', 'The Beatles', 'Abbey Road', ['Come Together', 'Something']),
+    album('disc_2', None, 'Now 42', ['Come On Eileen', 'Something Else']),
+    album('disc_5', 'Björk', 'Debut', ['Human Behaviour', 'Venus as a Boy']),
+]
+
+
+def disc_ids(page):
+    return [album['disc_id'] for album in page['items']]
+
+
+class LibraryIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.library = LibraryIndex(ALBUMS)
+
+    def test_albums_by_artist(self):
+        page = self.library.albums()
+        self.assertEqual(disc_ids(page), ['disc_2', 'disc_5', 'disc_1', 'disc_3', 'disc_4'])
+        self.assertEqual(page['total'], 5)
+        self.assertEqual(
+            page['items'][0],
+            {'disc_id': 'disc_2', 'artist': None, 'title': 'Now 42', 'track_count': 2, 'duration': None}
+        )
+
+    def test_albums_by_title(self):
+        self.assertEqual(
+            disc_ids(self.library.albums(order=ORDER_TITLE)),
+            ['disc_3', 'disc_5', 'disc_1', 'disc_2', 'disc_4']
+        )
+
+    def test_albums_of_artist(self):
+        self.assertEqual(disc_ids(self.library.albums(artist='The Beatles')), ['disc_3', 'disc_4'])
+        self.assertEqual(self.library.albums(artist='Nobody')['total'], 0)
+
+    def test_unknown_order(self):
+        self.assertRaises(ValueError, self.library.albums, order='year')
+
+    def test_pages(self):
+        page = self.library.albums(offset=2, limit=2)
+        self.assertEqual(disc_ids(page), ['disc_1', 'disc_3'])
+        self.assertEqual((page['total'], page['offset']), (5, 2))
+
+        self.assertEqual(disc_ids(self.library.albums(offset=4, limit=2)), ['disc_4'])
+        self.assertEqual(disc_ids(self.library.albums(offset=6, limit=2)), [])
+
+    def test_artists(self):
+        self.assertEqual(self.library.artists()['items'], [
+            {'artist': None, 'album_count': 1},
+            {'artist': 'Björk', 'album_count': 2},
+            {'artist': 'The Beatles', 'album_count': 2},
+        ])
+        self.assertEqual(self.library.artists(offset=1, limit=1)['items'], [{'artist': 'Björk', 'album_count': 2}])
+
+    def test_get_album(self):
+        self.assertEqual(self.library.get_album('disc_3')['title'], 'Abbey Road')
+        self.assertIsNone(self.library.get_album('disc_6'))
+
+    def test_search_tracks(self):
+        self.assertEqual(disc_ids(self.library.search('something')), ['disc_2', 'disc_3'])
+
+    def test_search_all_words(self):
+        self.assertEqual(disc_ids(self.library.search('something else')), ['disc_2'])
+        self.assertEqual(disc_ids(self.library.search('beatles come')), ['disc_3'])
+        self.assertEqual(disc_ids(self.library.search('beatles venus')), [])
+
+    def test_search_prefix(self):
+        self.assertEqual(disc_ids(self.library.search('hu')), ['disc_5', 'disc_1'])
+        self.assertEqual(disc_ids(self.library.search('Beat R')), ['disc_3', 'disc_4'])
+
+    def test_search_ignores_case_and_accents(self):
+        self.assertEqual(disc_ids(self.library.search('BJORK')), ['disc_5', 'disc_1'])
+        self.assertEqual(disc_ids(self.library.search('joga')), ['disc_1'])
+        self.assertEqual(disc_ids(self.library.search('Jóga')), ['disc_1'])
+
+    def test_search_pages(self):
+        page = self.library.search('the', offset=1, limit=1)
+        self.assertEqual(disc_ids(page), ['disc_4'])
+        self.assertEqual(page['total'], 2)
+
+    def test_search_nothing(self):
+        self.assertEqual(self.library.search('zebra'), {'total': 0, 'offset': 0, 'items': []})
+        self.assertEqual(self.library.search(' - ')['total'], 0)
+
+    def test_empty_library(self):
+        library = LibraryIndex([])
+        self.assertEqual(library.albums()['total'], 0)
+        self.assertEqual(library.search('anything')['total'], 0)
@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+import unittest
+
+import zmq
+from zmq.eventloop.ioloop import IOLoop
+
+from hifi_appliance.daemons import CdpDaemon
+from hifi_appliance.db import TrackDBClient
+from hifi_appliance.db import TrackDBQueryError
+from hifi_appliance.message_bus import Queue
+from hifi_appliance.message_bus import RPC
+from hifi_appliance.message_bus import RPCClient
+from hifi_appliance.message_bus import RPCTimeoutError
+from hifi_appliance.message_bus import Receiver
+from hifi_appliance.message_bus import query_db as channel_query_db
+from hifi_appliance.message_bus.context import get_zmq_context
+
+
+channel_test = RPC(name='test', address='tcp://127.0.0.1:7959')
+channel_test_queue = Queue(name='test_queue', address='tcp://127.0.0.1:7969')
+
+
+class QueryService(CdpDaemon):
+    """Answers queries from an io_loop in its own thread, without forking."""
+    def __init__(self, channel):
+        self.channel = channel
+        self._io_loop = None
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self._io_loop = IOLoop()
+        self.receiver = self.setup_query_receiver(self.channel)
+        self._ready.set()
+        self._io_loop.start()
+        self.receiver._do_close()
+        self._io_loop.close()
+
+    def stop(self):
+        self._io_loop.add_callback(self._io_loop.stop)
+        self.thread.join()
+
+    def query_echo(self, args):
+        return args
+
+    def query_has_disc(self, args):
+        return args[0] == 'disc_id'
+
+    def query_fail(self, args):
+        raise ValueError('no such thing')
+
+
+class RPCTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.service = QueryService(channel_test)
+        self.client = RPCClient(channel_test, timeout=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.service.stop()
+
+    def test_query(self):
+        self.assertEqual(self.client.request('echo', 'a', 'Björk'), ['ok', json.dumps(['a', 'Björk'])])
+
+    def test_repeated_queries(self):
+        for i in range(10):
+            (status, result) = self.client.request('echo', str(i))
+            self.assertEqual(json.loads(result), [str(i)])
+
+    def test_query_error(self):
+        self.assertEqual(self.client.request('fail'), ['error', 'no such thing'])
+        # the service keeps answering
+        self.assertEqual(self.client.request('echo'), ['ok', '[]'])
+
+    def test_unknown_query(self):
+        self.assertEqual(self.client.request('nonexistent'), ['error', 'unknown query'])
+
+
+class RPCTimeoutTestCase(unittest.TestCase):
+    def test_no_service(self):
+        client = RPCClient(channel_test, timeout=0.1)
+        self.assertRaises(RPCTimeoutError, client.request, 'echo')
+        # the client can be used again once the service is up
+        service = QueryService(channel_test)
+        try:
+            self.assertEqual(client.request('echo'), ['ok', '[]'])
+        finally:
+            client.close()
+            service.stop()
+
+
+class ReceiverFlushTestCase(unittest.TestCase):
+    """Messages queued up while the io_loop was busy are handled by flush()."""
+    def setUp(self):
+        self.io_loop = IOLoop()
+        self.received = []
+        self.receiver = Receiver(
+            channel_test_queue,
+            io_loop=self.io_loop,
+            callbacks={'scan': lambda receiver, msg_parts: self.received.append(msg_parts)}
+        )
+        self.socket = get_zmq_context().socket(zmq.PUSH)
+        self.socket.connect('tcp://127.0.0.1:7969')
+
+    def tearDown(self):
+        self.socket.close(linger=0)
+        self.receiver._do_close()
+        self.io_loop.close()
+
+    def test_flush(self):
+        for i in range(3):
+            self.socket.send_multipart([b'scan', str(i).encode('ascii')])
+
+        count = 0
+        deadline = time.time() + 5
+        while count < 3 and time.time() < deadline:
+            count += self.receiver.flush()
+            time.sleep(0.01)
+
+        # the io_loop never ran
+        self.assertEqual(count, 3)
+        self.assertEqual(self.received, [[b'scan', b'0'], [b'scan', b'1'], [b'scan', b'2']])
+        self.assertEqual(self.receiver.flush(), 0)
+
+
+class TrackDBClientTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.service = QueryService(channel_query_db)
+        self.client = TrackDBClient(timeout=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.service.stop()
+
+    def test_query(self):
+        self.assertTrue(self.client.has_disc('disc_id'))
+        self.assertFalse(self.client.has_disc('other_disc_id'))
+
+    def test_query_error(self):
+        self.assertRaises(TrackDBQueryError, self.client.list_albums)
@@ -5,6 +5,7 @@ import os
 from pathlib import Path
 import unittest
 from unittest.mock import patch
+from urllib.error import HTTPError
 
 import musicbrainzngs
 import mutagen
@@ -20,10 +21,20 @@ class MusicbrainzTestCase(unittest.TestCase):
         patch('musicbrainzngs.auth').start()
         logging.disable(logging.CRITICAL)
 
-    def test_response_error(self):
-        with patch('musicbrainzngs.get_releases_by_discid', side_effect=musicbrainzngs.musicbrainz.ResponseError()):
+    def response_error(self, code):
+        cause = HTTPError('https://musicbrainz.org/ws/2/discid/disc_id', code, 'Error', {}, None)
+        return musicbrainzngs.musicbrainz.ResponseError(cause=cause)
+
+    def test_not_found(self):
+        with patch('musicbrainzngs.get_releases_by_discid', side_effect=self.response_error(404)):
             self.assertEqual(self.client.query('disc_id'), None)
 
+    def test_response_error(self):
+        with patch('musicbrainzngs.get_releases_by_discid', side_effect=self.response_error(400)), \
+                patch('retrying.time.sleep'):
+            with self.assertRaises(musicbrainzngs.musicbrainz.ResponseError):
+                self.client.query('disc_id')
+
     def test_cd_01(self):
         response = json.loads(
             Path(os.path.dirname(__file__)).joinpath('data', 'musicbrainz', 'cd_01').read_text()
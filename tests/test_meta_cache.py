@@ -0,0 +1,175 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import musicbrainzngs
+
+from hifi_appliance.meta import CachedMetaLookup
+from hifi_appliance.meta import DiscMetaCache
+from hifi_appliance.meta import RemoteMeta
+from tests.sim.musicbrainz import MusicbrainzStandIn
+
+
+KNOWN_DISC_ID = 'VYyHlY0Pj.OzVIZ2O08uuzsFOdw-'
+DURATIONS = [200 * 44100, 180 * 44100, 240 * 44100]
+
+
+def clock(now):
+    """Sets the cache's clock only, musicbrainzngs rate limiting needs the real one."""
+    mock_time = MagicMock()
+    mock_time.time.return_value = now
+    return patch('hifi_appliance.meta.cache.time', mock_time)
+
+
+class DiscMetaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiscMetaCache(
+            os.path.join(self.tmp_dir.name, 'cache', 'meta.db'),
+            ttl=100, negative_ttl=10, max_entries=3
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_miss(self):
+        self.assertEqual(self.cache.get('disc_id'), (False, None))
+
+    def test_hit(self):
+        self.cache.put('disc_id', {'title': 'Album'})
+        self.assertEqual(self.cache.get('disc_id'), (True, {'title': 'Album'}))
+
+    def test_negative_entry(self):
+        self.cache.put('disc_id', None)
+        self.assertEqual(self.cache.get('disc_id'), (True, None))
+
+    def test_expiry(self):
+        with clock(1000):
+            self.cache.put('known', {'title': 'Album'})
+            self.cache.put('unknown', None)
+
+        with clock(1050):
+            self.assertEqual(self.cache.get('known'), (True, {'title': 'Album'}))
+            self.assertEqual(self.cache.get('unknown'), (False, None))
+
+        with clock(1200):
+            self.assertEqual(self.cache.get('known'), (False, None))
+            self.assertEqual(self.cache.get('known', allow_expired=True), (True, {'title': 'Album'}))
+
+    def test_least_recently_used_evicted(self):
+        for i, disc_id in enumerate(['a', 'b', 'c']):
+            with clock(1000 + i):
+                self.cache.put(disc_id, {'title': disc_id})
+
+        with clock(1010):
+            self.cache.get('a')
+        with clock(1011):
+            self.cache.put('d', {'title': 'd'})
+
+        self.assertEqual(self.cache.count(), 3)
+        with clock(1012):
+            self.assertEqual(self.cache.get('b'), (False, None))
+            self.assertEqual(self.cache.get('a'), (True, {'title': 'a'}))
+
+
+    def test_similar_disc(self):
+        disc_meta = {'title': 'Album', 'tracks': [{'duration': duration} for duration in DURATIONS]}
+        self.cache.put('disc_id', disc_meta)
+        self.cache.put('unknown', None)
+
+        other_pressing = DURATIONS[:-1] + [DURATIONS[-1] + 30]
+        self.assertEqual(self.cache.find_similar(other_pressing), ('disc_id', disc_meta))
+        self.assertIsNone(self.cache.find_similar(DURATIONS[:-1]))
+
+    def test_similar_disc_added_later(self):
+        self.assertIsNone(self.cache.find_similar(DURATIONS))
+        self.cache.put('disc_id', {'title': 'Album', 'tracks': [{'duration': duration} for duration in DURATIONS]})
+        self.assertEqual(self.cache.find_similar(DURATIONS)[0], 'disc_id')
+
+
+class CachedMusicbrainzLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        # other test cases patch out musicbrainzngs setup without restoring it
+        patch.stopall()
+
+        self.stand_in = MusicbrainzStandIn.from_fixtures().start()
+        patch('hifi_appliance.meta.musicbrainz.MUSICBRAINZ_HOST', self.stand_in.host).start()
+        patch('hifi_appliance.meta.musicbrainz.MUSICBRAINZ_USE_HTTPS', False).start()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiscMetaCache(
+            os.path.join(self.tmp_dir.name, 'meta.db'),
+            ttl=100, negative_ttl=10, max_entries=10
+        )
+        self.lookup = CachedMetaLookup(RemoteMeta(), self.cache)
+
+    def tearDown(self):
+        patch.stopall()
+        self.stand_in.stop()
+        self.tmp_dir.cleanup()
+
+    def test_known_disc_looked_up_once(self):
+        disc_meta = self.lookup.query(KNOWN_DISC_ID)
+        self.assertEqual(disc_meta['title'], 'The Many Faces of Daft Punk')
+
+        self.assertEqual(self.lookup.query(KNOWN_DISC_ID), disc_meta)
+        self.assertEqual(self.stand_in.requests, ['/ws/2/discid/%s' % KNOWN_DISC_ID])
+
+    def test_unknown_disc_looked_up_once(self):
+        self.assertIsNone(self.lookup.query('unknown-disc-id'))
+        self.assertIsNone(self.lookup.query('unknown-disc-id'))
+        self.assertEqual(self.stand_in.requests, ['/ws/2/discid/unknown-disc-id'])
+
+    def test_unknown_disc_looked_up_again_after_negative_ttl(self):
+        with clock(1000):
+            self.lookup.query('unknown-disc-id')
+        with clock(1020):
+            self.lookup.query('unknown-disc-id')
+
+        self.assertEqual(len(self.stand_in.requests), 2)
+
+    def test_expired_meta_used_offline(self):
+        with clock(1000):
+            disc_meta = self.lookup.query(KNOWN_DISC_ID)
+
+        offline_lookup = MagicMock()
+        offline_lookup.query.side_effect = musicbrainzngs.NetworkError()
+        with clock(2000):
+            self.assertEqual(CachedMetaLookup(offline_lookup, self.cache).query(KNOWN_DISC_ID), disc_meta)
+
+    def test_bad_response_not_cached(self):
+        failing_lookup = MagicMock()
+        failing_lookup.query.side_effect = musicbrainzngs.ResponseError()
+        with self.assertRaises(musicbrainzngs.ResponseError):
+            CachedMetaLookup(failing_lookup, self.cache).query(KNOWN_DISC_ID)
+
+        self.assertEqual(self.cache.get(KNOWN_DISC_ID), (False, None))
+        self.assertEqual(self.lookup.query(KNOWN_DISC_ID)['title'], 'The Many Faces of Daft Punk')
+
+    def test_failure_without_cache_entry_raises(self):
+        offline_lookup = MagicMock()
+        offline_lookup.query.side_effect = musicbrainzngs.NetworkError()
+        with self.assertRaises(musicbrainzngs.NetworkError):
+            CachedMetaLookup(offline_lookup, self.cache).query(KNOWN_DISC_ID)
+
+    def test_other_pressing_not_looked_up(self):
+        disc_meta = self.lookup.query(KNOWN_DISC_ID)
+        durations = [track['duration'] for track in disc_meta['tracks']]
+
+        other_pressing = self.lookup.query('other-pressing', durations[:-1] + [durations[-1] + 1000])
+        self.assertEqual(other_pressing['disc_id'], 'other-pressing')
+        self.assertEqual(other_pressing['title'], disc_meta['title'])
+        self.assertEqual(self.stand_in.requests, ['/ws/2/discid/%s' % KNOWN_DISC_ID])
+
+    def test_other_pressing_of_disc_unknown_online(self):
+        self.lookup.query(KNOWN_DISC_ID)
+        self.lookup.query('unknown-disc-id')
+        durations = [track['duration'] for track in self.lookup.query(KNOWN_DISC_ID)['tracks']]
+
+        self.assertEqual(self.lookup.query('unknown-disc-id', durations)['disc_id'], 'unknown-disc-id')
+        self.assertIsNone(self.lookup.query('unknown-disc-id', durations[:-1]))
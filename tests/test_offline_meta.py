@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from hifi_appliance.meta import import_musicbrainz_dump
+from hifi_appliance.meta import OfflineMeta
+from hifi_appliance.meta import RemoteMeta
+from tests.sim.musicbrainz import FIXTURES_PATH
+
+
+ARTIST_TYPES = {'Person': 1, 'Group': 2, 'Other': 3, 'Character': 4, 'Orchestra': 5, 'Choir': 6}
+MEDIUM_FORMATS = {'CD': 1, 'DVD': 2, 'Digital Media': 12}
+
+
+def _escape(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class DumpWriter(object):
+    """Writes MusicBrainz web service responses out as a minimal mbdump."""
+    def __init__(self):
+        self.tables = {table: [] for table in [
+            'cdtoc', 'medium_cdtoc', 'medium', 'release', 'track',
+            'artist_credit', 'artist_credit_name', 'artist'
+        ]}
+        self.artists = {}
+        self.ids = {}
+
+    def next_id(self, table):
+        self.ids[table] = self.ids.get(table, 0) + 1
+        return self.ids[table]
+
+    def add_row(self, table, *fields):
+        self.tables[table].append('\t'.join(_escape(field) for field in fields))
+
+    def add_artist_credit(self, artist_credit, phrase):
+        credit_id = self.next_id('artist_credit')
+        credited = [credit for credit in artist_credit if isinstance(credit, dict)]
+        self.add_row('artist_credit', credit_id, phrase, len(credited), 1, '2020-01-01')
+
+        for position, credit in enumerate(credited):
+            artist = credit['artist']
+            if artist['id'] not in self.artists:
+                self.artists[artist['id']] = self.next_id('artist')
+                self.add_row(
+                    'artist', self.artists[artist['id']], artist['id'], artist['name'], artist['sort-name'],
+                    None, None, None, None, None, None, ARTIST_TYPES.get(artist.get('type')), None
+                )
+            self.add_row('artist_credit_name', credit_id, position, self.artists[artist['id']], artist['name'], '')
+
+        return credit_id
+
+    def add_response(self, response):
+        for release in response['disc']['release-list']:
+            release_id = self.next_id('release')
+            credit_id = self.add_artist_credit(release['artist-credit'], release['artist-credit-phrase'])
+            self.add_row('release', release_id, release['id'], release['title'], credit_id, None)
+
+            for medium in release['medium-list']:
+                medium_id = self.next_id('medium')
+                self.add_row(
+                    'medium', medium_id, release_id, medium['position'],
+                    MEDIUM_FORMATS.get(medium.get('format')), '', 0, None, len(medium['track-list'])
+                )
+
+                for disc in medium['disc-list']:
+                    cdtoc_id = self.next_id('cdtoc')
+                    self.add_row('cdtoc', cdtoc_id, disc['id'], None, disc['offset-count'], disc['sectors'], None)
+                    self.add_row('medium_cdtoc', self.next_id('medium_cdtoc'), medium_id, cdtoc_id, 0)
+
+                for track in medium['track-list']:
+                    recording = track['recording']
+                    credit_id = self.add_artist_credit(
+                        recording['artist-credit'], recording.get('artist-credit-phrase')
+                    )
+                    self.add_row(
+                        'track', self.next_id('track'), track['id'], 1, medium_id, track['position'],
+                        track['number'], recording['title'], credit_id, track.get('length'), 0, None, 'f'
+                    )
+
+    def write(self, dump_path):
+        os.mkdir(dump_path)
+        for table, rows in self.tables.items():
+            with open(os.path.join(dump_path, table), 'w', encoding='utf-8') as table_file:
+                table_file.write(''.join(row + '\n' for row in rows))
+
+
+def load_fixtures():
+    return [json.loads(fixture.read_text()) for fixture in sorted(FIXTURES_PATH.iterdir())]
+
+
+def disc_ids(response):
+    return {
+        disc['id']
+        for release in response['disc']['release-list']
+        for medium in release['medium-list']
+        for disc in medium['disc-list']
+    }
+
+
+class OfflineMetaTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmp_dir.name, 'index', 'musicbrainz.db')
+        self.responses = load_fixtures()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_dump(self, response, name='mbdump'):
+        dump_path = os.path.join(self.tmp_dir.name, name)
+        dump_writer = DumpWriter()
+        dump_writer.add_response(response)
+        dump_writer.write(dump_path)
+        return dump_path
+
+    def test_import_directory(self):
+        response = self.responses[8]
+        disc_count = import_musicbrainz_dump(self.write_dump(response), self.index_path, batch_size=7)
+
+        self.assertEqual(disc_count, len(disc_ids(response)))
+        self.assertEqual(os.listdir(os.path.dirname(self.index_path)), ['musicbrainz.db'])
+
+    def test_import_archive(self):
+        response = self.responses[3]
+        archive_path = os.path.join(self.tmp_dir.name, 'mbdump.tar.bz2')
+        with tarfile.open(archive_path, 'w:bz2') as archive:
+            archive.add(self.write_dump(response), arcname='mbdump')
+
+        self.assertEqual(import_musicbrainz_dump(archive_path, self.index_path), len(disc_ids(response)))
+
+    def test_replace_index(self):
+        import_musicbrainz_dump(self.write_dump(self.responses[0], 'first'), self.index_path)
+        import_musicbrainz_dump(self.write_dump(self.responses[1], 'second'), self.index_path)
+
+        offline_meta = OfflineMeta(self.index_path)
+        self.assertIsNone(offline_meta.query(self.responses[0]['disc']['id']))
+        self.assertIsNotNone(offline_meta.query(self.responses[1]['disc']['id']))
+
+    def test_unknown_disc(self):
+        import_musicbrainz_dump(self.write_dump(self.responses[0]), self.index_path)
+        self.assertIsNone(OfflineMeta(self.index_path).query('unknown-disc-id'))
+
+    def test_missing_index(self):
+        self.assertIsNone(OfflineMeta(self.index_path).query(self.responses[0]['disc']['id']))
+
+    def test_multi_cd(self):
+        response = self.responses[5]
+        import_musicbrainz_dump(self.write_dump(response), self.index_path)
+
+        disc_meta = OfflineMeta(self.index_path).query('VYyHlY0Pj.OzVIZ2O08uuzsFOdw-')
+        self.assertEqual(disc_meta['title'], 'The Many Faces of Daft Punk')
+        self.assertEqual(disc_meta['cd'], 2)
+        self.assertEqual(disc_meta['total_cds'], 3)
+        self.assertNotIn('artist', disc_meta)
+
+    @patch('musicbrainzngs.set_hostname')
+    @patch('musicbrainzngs.set_useragent')
+    @patch('musicbrainzngs.auth')
+    def test_same_as_online(self, *mocks):
+        for (i, response) in enumerate(self.responses):
+            disc_id = response['disc']['id']
+            import_musicbrainz_dump(self.write_dump(response, 'mbdump_%d' % i), self.index_path)
+
+            with patch('musicbrainzngs.get_releases_by_discid', return_value=response):
+                self.assertEqual(OfflineMeta(self.index_path).query(disc_id), RemoteMeta().query(disc_id), disc_id)
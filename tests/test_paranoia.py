@@ -0,0 +1,25 @@
+import unittest
+
+from hifi_appliance.rip import count_read_errors
+
+
+class ParanoiaProgressTestCase(unittest.TestCase):
+    def test_clean_read(self):
+        progress = [
+            '##: 0 [read] @ 1176',
+            '##: 1 [verify] @ 1176',
+            '##: -2 [wrote] @ 1175',
+            '##: 9 [overlap] @ 588',
+        ]
+        self.assertEqual(count_read_errors(progress), 0)
+
+    def test_read_errors(self):
+        progress = [
+            '##: 0 [read] @ 1176',
+            '##: 12 [read_error] @ 2352',
+            '##: 6 [skip] @ 3528',
+            '##: 4 [scratch] @ 4704',
+            'outputting to stdout',
+            '##: -2 [wrote] @ 4703',
+        ]
+        self.assertEqual(count_read_errors(progress), 3)
@@ -0,0 +1,78 @@
+import logging
+from pathlib import Path
+import tempfile
+import unittest
+
+from hifi_appliance.state import PlayQueue
+
+
+ALBUM_1 = (
+    ['/music/Artist/Album/01 One.flac', '/music/Artist/Album/02 Two.flac'],
+    {'disc_id': 'disc_1', 'tracks': [{'title': 'One'}, {'title': 'Two'}]}
+)
+ALBUM_2 = (
+    ['/music/Other/Album/01 Three.flac'],
+    {'disc_id': 'disc_2', 'tracks': [{'title': 'Three'}]}
+)
+
+
+class PlayQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name).joinpath('state', 'play_queue')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_in_memory(self):
+        queue = PlayQueue()
+        queue.append(*ALBUM_1)
+        queue.append(*ALBUM_2)
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.disc_ids(), ['disc_1', 'disc_2'])
+        self.assertEqual(queue.peek(), ALBUM_1)
+        self.assertEqual(queue.pop(), ALBUM_1)
+        self.assertEqual(queue.current, ALBUM_1)
+        self.assertEqual(queue.disc_ids(), ['disc_2'])
+
+        queue.clear()
+        self.assertIsNone(queue.peek())
+        self.assertEqual(queue.current, ALBUM_1)
+
+    def test_kept_across_restarts(self):
+        queue = PlayQueue(self.path)
+        queue.append(*ALBUM_1)
+        queue.append(*ALBUM_2)
+        queue.append(*ALBUM_1)
+        queue.pop()
+
+        queue = PlayQueue(self.path)
+        self.assertEqual(queue.current, ALBUM_1)
+        self.assertEqual(queue.disc_ids(), ['disc_2', 'disc_1'])
+        self.assertEqual(queue.peek(), ALBUM_2)
+
+    def test_no_current_album(self):
+        queue = PlayQueue(self.path)
+        queue.append(*ALBUM_2)
+
+        queue = PlayQueue(self.path)
+        self.assertIsNone(queue.current)
+        self.assertEqual(queue.peek(), ALBUM_2)
+
+    def test_folders_stored_once(self):
+        queue = PlayQueue(self.path)
+        queue.append(*ALBUM_1)
+
+        stored = self.path.read_text()
+        self.assertEqual(stored.count('/music/Artist/Album'), 1)
+        self.assertNotIn(' ', stored.replace('01 One', '').replace('02 Two', ''))
+
+    def test_unreadable_file(self):
+        self.path.parent.mkdir()
+        self.path.write_text('\n{"folder": \n')
+
+        queue = PlayQueue(self.path)
+        self.assertIsNone(queue.current)
+        self.assertEqual(len(queue), 0)
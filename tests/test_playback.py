@@ -0,0 +1,79 @@
+import logging
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from hifi_appliance.config import SCAN_STEP_SECONDS
+from hifi_appliance.constants import SAMPLE_RATE
+from hifi_appliance.daemons import CdpDaemon
+from hifi_appliance.playback import Playback
+
+
+REPEAT_SECONDS = 0.11  # between LIRC repeats of a held key
+
+
+class ScanTestCase(unittest.TestCase):
+    """Commands are handled one after another, those sent during a seek are queued until it's done."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        patch.object(CdpDaemon, '__init__', return_value=None).start()
+        patch('hifi_appliance.playback.create_player').start()
+        patch('hifi_appliance.playback.PlayQueue').start()
+        patch('hifi_appliance.playback.ResumePositions').start()
+
+        self.clock = 100.0
+        # when the key repeats not yet received were sent
+        self.repeats = []
+
+        self.playback = Playback(None)
+        self.playback.state_machine = MagicMock(current_frame=0, seek=MagicMock(side_effect=self.seek))
+        self.playback.command_receiver = MagicMock(flush=self.flush)
+        self.seek_seconds = 0.4
+        self.seeks = []
+
+    def tearDown(self):
+        patch.stopall()
+
+    def seek(self, frame):
+        self.seeks.append(self.clock)
+        self.clock += self.seek_seconds
+        self.playback.state_machine.current_frame = frame
+
+    def flush(self):
+        """The repeats sent while the clock went on are in the receiver's queue."""
+        count = 0
+        while self.repeats and self.repeats[0] <= self.clock:
+            self.receive()
+            count += 1
+        return count
+
+    def receive(self):
+        self.clock = max(self.clock, self.repeats.pop(0))
+        self.playback.command_scan_forward([])
+
+    def hold_key(self, seconds, start=None):
+        start = self.clock if start is None else start
+        self.repeats = [start + repeat * REPEAT_SECONDS for repeat in range(int(seconds / REPEAT_SECONDS) + 1)]
+        while self.repeats:
+            self.receive()
+        return start + seconds
+
+    def test_held_key(self):
+        released = self.hold_key(2)
+
+        # one seek after another, not one per repeat
+        self.assertEqual(len(self.seeks), 5)
+        self.assertEqual(self.playback.state_machine.current_frame, 5 * SCAN_STEP_SECONDS * SAMPLE_RATE)
+        # and it stops when the key is let go
+        self.assertLess(self.clock - released, self.seek_seconds)
+
+    def test_fast_seeks_not_dropped(self):
+        self.seek_seconds = 0.01
+        self.hold_key(1)
+        self.assertEqual(len(self.seeks), 10)
+
+    def test_pressed_again(self):
+        self.playback.command_scan_forward([])
+        self.hold_key(0, start=self.clock + 1)
+        self.assertEqual(len(self.seeks), 2)
@@ -0,0 +1,137 @@
+import logging
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from hifi_appliance.audio import ReadAheadCache
+
+
+class ReadAheadCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.music_path = Path(self.tmp_dir.name).joinpath('music')
+        self.music_path.mkdir()
+        self.cache_path = Path(self.tmp_dir.name).joinpath('cache')
+
+        self.tracks = []
+        for i in range(4):
+            track_path = self.music_path.joinpath('%02d Track.flac' % (i + 1))
+            track_path.write_bytes(bytes([i]) * 1000 * (i + 1))
+            self.tracks.append(str(track_path))
+
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        self.tmp_dir.cleanup()
+
+    def create_cache(self, max_bytes=100000, rate=None):
+        cache = ReadAheadCache(self.cache_path, max_bytes, rate)
+        self.caches.append(cache)
+        return cache
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.fail('Timed out')
+            time.sleep(0.01)
+
+    def test_upcoming_tracks_copied(self):
+        cache = self.create_cache()
+        cache.prefetch(self.tracks[1:])
+        self.wait_for(lambda: cache.is_cached(self.tracks[3]))
+
+        self.assertFalse(cache.is_cached(self.tracks[0]))
+        self.assertEqual(cache.local_path(self.tracks[0]), self.tracks[0])
+
+        for track in self.tracks[1:]:
+            local_path = cache.local_path(track)
+            self.assertNotEqual(local_path, track)
+            self.assertTrue(local_path.startswith(str(self.cache_path)))
+            self.assertEqual(Path(local_path).read_bytes(), Path(track).read_bytes())
+
+    def test_cache_emptied_on_start(self):
+        self.cache_path.mkdir()
+        self.cache_path.joinpath('0123456789abcdef0123456789abcdef01234567.flac').write_bytes(b'stale')
+        self.cache_path.joinpath('0123456789abcdef0123456789abcdef01234567.tmp').write_bytes(b'partial')
+        # a cache path shared with something else only loses our copies
+        self.cache_path.joinpath('notes.txt').write_bytes(b'not a copy')
+        self.cache_path.joinpath('album').mkdir()
+
+        self.create_cache()
+        self.assertEqual(sorted(os.listdir(str(self.cache_path))), ['album', 'notes.txt'])
+
+    def test_least_recently_used_evicted(self):
+        # room for tracks 1, 2 and 3 (6000 bytes), not 4 as well
+        cache = self.create_cache(max_bytes=7000)
+        cache.prefetch(self.tracks[:3])
+        self.wait_for(lambda: cache.is_cached(self.tracks[2]))
+        cache.local_path(self.tracks[0])
+
+        cache.prefetch(self.tracks[3:])
+        self.wait_for(lambda: cache.is_cached(self.tracks[3]))
+
+        self.assertTrue(cache.is_cached(self.tracks[0]))
+        self.assertFalse(cache.is_cached(self.tracks[1]))
+        self.assertFalse(cache.is_cached(self.tracks[2]))
+        self.assertEqual(len(os.listdir(str(self.cache_path))), 2)
+
+    def test_upcoming_tracks_not_evicted(self):
+        cache = self.create_cache(max_bytes=7000)
+        cache.prefetch(self.tracks)
+        self.wait_for(lambda: cache.is_cached(self.tracks[2]))
+        time.sleep(0.1)
+
+        self.assertTrue(all(cache.is_cached(track) for track in self.tracks[:3]))
+        self.assertFalse(cache.is_cached(self.tracks[3]))
+
+    def test_changed_copy_not_used(self):
+        cache = self.create_cache()
+        cache.prefetch(self.tracks[:1])
+        self.wait_for(lambda: cache.is_cached(self.tracks[0]))
+
+        Path(cache.local_path(self.tracks[0])).write_bytes(b'garbage')
+
+        self.assertEqual(cache.local_path(self.tracks[0]), self.tracks[0])
+        self.assertFalse(cache.is_cached(self.tracks[0]))
+
+    def test_corrupt_copy_dropped(self):
+        cache = self.create_cache()
+        with patch('hifi_appliance.audio.readahead._digest', return_value=b'wrong'):
+            cache.prefetch(self.tracks[:2])
+            self.wait_for(lambda: not cache._pending)
+            time.sleep(0.1)
+
+        self.assertFalse(cache.is_cached(self.tracks[0]))
+        self.assertFalse(cache.is_cached(self.tracks[1]))
+        self.assertEqual(os.listdir(str(self.cache_path)), [])
+
+    def test_missing_track_skipped(self):
+        cache = self.create_cache()
+        cache.prefetch([str(self.music_path.joinpath('missing.flac'))] + self.tracks[:1])
+        self.wait_for(lambda: cache.is_cached(self.tracks[0]))
+
+    def test_copies_throttled(self):
+        cache = self.create_cache(rate=20000)
+        started = time.monotonic()
+        cache.prefetch(self.tracks[3:])
+        self.wait_for(lambda: cache.is_cached(self.tracks[3]))
+
+        # 4000 bytes at 20000 bytes/s
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_copies_wait_for_playback_reads(self):
+        cache = self.create_cache()
+        with cache.playback_read():
+            cache.prefetch(self.tracks[:1])
+            time.sleep(0.2)
+            self.assertFalse(cache.is_cached(self.tracks[0]))
+
+        self.wait_for(lambda: cache.is_cached(self.tracks[0]))
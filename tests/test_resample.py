@@ -0,0 +1,247 @@
+import logging
+import os
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import miniaudio
+import numpy
+
+from hifi_appliance.audio import MiniaudioSink
+from hifi_appliance.audio import PolyphaseResampler
+from hifi_appliance.audio import ResampleCache
+from hifi_appliance.audio.miniaudio import TrackFormat
+from hifi_appliance.audio.miniaudio import device_capabilities
+from hifi_appliance.audio.miniaudio import negotiate_output
+from hifi_appliance.audio.miniaudio import probe_track
+from tests.sim.drive import write_flac
+
+
+SIM_BIN_PATH = Path(__file__).resolve().parent.joinpath('sim', 'bin')
+
+
+def sine(frequency, sample_rate, frames, amplitude=10000):
+    t = numpy.arange(frames) / sample_rate
+    return numpy.stack([numpy.sin(2 * numpy.pi * frequency * t), numpy.cos(2 * numpy.pi * frequency * t)], axis=1) * amplitude
+
+
+class PolyphaseResamplerTestCase(unittest.TestCase):
+    def test_ratio(self):
+        resampler = PolyphaseResampler(96000, 44100)
+        self.assertEqual((resampler.up, resampler.down), (147, 320))
+        self.assertEqual(resampler.output_frames(96000), 44100)
+        self.assertEqual(resampler.output_frames(96001), 44101)
+
+    def test_sine(self):
+        for (source_rate, target_rate) in [(96000, 44100), (48000, 44100), (88200, 44100), (44100, 48000)]:
+            resampler = PolyphaseResampler(source_rate, target_rate)
+            resampled = resampler.process(sine(1000, source_rate, source_rate).astype(numpy.int32))
+
+            self.assertEqual(len(resampled), target_rate)
+            error = numpy.abs(resampled - sine(1000, target_rate, target_rate))[100:-100]
+            self.assertLess(error.max(), 3, (source_rate, target_rate))
+
+    def test_removes_what_the_target_rate_cannot_hold(self):
+        resampler = PolyphaseResampler(96000, 44100)
+        resampled = resampler.process(sine(30000, 96000, 96000))
+        self.assertLess(numpy.abs(resampled[100:-100]).max(), 10000 * 10 ** (-60 / 20))
+
+    def test_dc_and_edges(self):
+        resampled = PolyphaseResampler(48000, 44100).process(numpy.full((1000, 2), -1234))
+        numpy.testing.assert_allclose(resampled, -1234)
+
+    def test_blocks(self):
+        samples = numpy.random.default_rng(0).integers(-2 ** 31, 2 ** 31, size=(50000, 2))
+        resampler = PolyphaseResampler(96000, 44100)
+        numpy.testing.assert_allclose(
+            numpy.concatenate(list(resampler.blocks(samples, block_frames=1000))),
+            resampler.process(samples),
+            atol=1e-3
+        )
+
+    def test_empty(self):
+        self.assertEqual(PolyphaseResampler(96000, 44100).process(numpy.zeros((0, 2))).shape, (0, 2))
+
+
+class ResampleCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmp_dir.name).joinpath('resampled')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_put_and_get(self):
+        cache = ResampleCache(self.cache_path, 1000)
+        key = cache.key('track.flac', 0x1234, 44100, 2, 'medium')
+        self.assertIsNone(cache.get(key))
+
+        cache.put(key, b'pcm' * 10)
+        cache.close()
+        self.assertEqual(cache.get(key), b'pcm' * 10)
+        self.assertEqual(ResampleCache(self.cache_path, 1000).get(key), b'pcm' * 10)
+
+    def test_key(self):
+        track_path = Path(self.tmp_dir.name).joinpath('track.flac')
+        track_path.write_bytes(b'flac')
+        cache = ResampleCache(self.cache_path, 1000)
+
+        key = cache.key(str(track_path), 0x1234, 44100, 2, 'medium')
+        self.assertEqual(key, cache.key('copy.flac', 0x1234, 44100, 2, 'medium'))
+        self.assertNotEqual(key, cache.key(str(track_path), 0x1234, 48000, 2, 'medium'))
+        self.assertNotEqual(key, cache.key(str(track_path), 0x1234, 44100, 4, 'medium'))
+        self.assertNotEqual(key, cache.key(str(track_path), 0x1234, 44100, 2, 'high'))
+
+        key = cache.key(str(track_path), None, 44100, 2, 'medium')
+        track_path.write_bytes(b'other flac')
+        self.assertNotEqual(key, cache.key(str(track_path), None, 44100, 2, 'medium'))
+
+    def test_least_recently_used_evicted(self):
+        cache = ResampleCache(self.cache_path, 250)
+        for (i, key) in enumerate(['first', 'second', 'third']):
+            cache.put(key, bytes([i]) * 100)
+            cache.close()
+            cache = ResampleCache(self.cache_path, 250)
+            os.utime(str(self.cache_path.joinpath(key + '.pcm')), ns=(i, i))
+
+        self.assertIsNone(cache.get('first'))
+        self.assertEqual(cache.get('second'), b'\1' * 100)
+        self.assertEqual(cache.get('third'), b'\2' * 100)
+
+        cache.put('too big', b'\0' * 300)
+        cache.close()
+        self.assertIsNone(cache.get('too big'))
+
+
+class NegotiationTestCase(unittest.TestCase):
+    def test_passthrough(self):
+        self.assertEqual(negotiate_output(TrackFormat(96000, 24, None)), (96000, 4))
+        self.assertEqual(negotiate_output(TrackFormat(44100, 16, None), {44100, 48000}), (44100, 2))
+        self.assertEqual(negotiate_output(TrackFormat(192000, 24, None), {44100, 192000}), (192000, 4))
+
+    def test_unsupported_rate(self):
+        self.assertEqual(negotiate_output(TrackFormat(96000, 24, None), {44100, 48000}), (48000, 4))
+        self.assertEqual(negotiate_output(TrackFormat(88200, 24, None), {44100, 48000}), (44100, 4))
+        self.assertEqual(negotiate_output(TrackFormat(88200, 24, None), {48000, 96000}), (48000, 4))
+        self.assertEqual(negotiate_output(TrackFormat(44100, 16, None), {48000, 96000}), (48000, 2))
+
+    def test_sixteen_bit_device(self):
+        formats = {miniaudio.SampleFormat.SIGNED16}
+        self.assertEqual(negotiate_output(TrackFormat(96000, 24, None), None, formats), (96000, 2))
+
+    def test_passthrough_disabled(self):
+        with patch('hifi_appliance.audio.miniaudio.AUDIO_PASSTHROUGH', False):
+            self.assertEqual(negotiate_output(TrackFormat(96000, 24, None)), (44100, 2))
+
+    def test_null_device_takes_anything(self):
+        device_capabilities.cache_clear()
+        try:
+            with patch('hifi_appliance.audio.miniaudio.AUDIO_BACKENDS', ['null']):
+                self.assertEqual(device_capabilities(), (None, None))
+            with patch('hifi_appliance.audio.miniaudio.AUDIO_OUTPUT_RATES', [44100]):
+                device_capabilities.cache_clear()
+                with patch('hifi_appliance.audio.miniaudio.AUDIO_BACKENDS', ['null']):
+                    self.assertEqual(device_capabilities(), ({44100}, None))
+        finally:
+            device_capabilities.cache_clear()
+
+
+class SinkTestCase(unittest.TestCase):
+    """The sink without a device, frames are read as the device thread would."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+        patch.dict(os.environ, {'PATH': '%s%s%s' % (SIM_BIN_PATH, os.pathsep, os.environ.get('PATH', ''))}).start()
+        patch('hifi_appliance.audio.miniaudio.device_capabilities', return_value=(None, None)).start()
+        patch.object(MiniaudioSink, '_start_device', lambda sink: None).start()
+
+        self.cache = ResampleCache(self.tmp_path.joinpath('resampled'), 10 * 1024 * 1024)
+        self.frames_played = []
+
+    def tearDown(self):
+        patch.stopall()
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def create_sink(self):
+        sink = MiniaudioSink(lambda: None, self.frames_played.append, self.cache)
+        sink.frames_callback_executor.submit = lambda callback, *args: callback(*args)
+        return sink
+
+    def write_track(self, name, samples, sample_rate, bits_per_sample):
+        path = self.tmp_path.joinpath(name)
+        write_flac(str(path), samples.astype('<i%d' % (2 if bits_per_sample == 16 else 4)).tobytes(), sample_rate, bits_per_sample)
+        return str(path)
+
+    def read_all(self, sink, frames=4096):
+        generator = sink._read_frames()
+        next(generator)
+        sink.resume()
+        data = b''
+        try:
+            while True:
+                data += bytes(generator.send(frames))
+        except StopIteration:
+            return data
+
+    def test_probe(self):
+        track = self.write_track('hires.flac', numpy.zeros((100, 2)), 96000, 24)
+        self.assertEqual(probe_track(track), TrackFormat(96000, 24, None))
+        self.assertEqual(probe_track(str(self.tmp_path.joinpath('missing.flac'))), TrackFormat(44100, 16, None))
+
+    def test_passthrough(self):
+        samples = numpy.random.default_rng(0).integers(-2 ** 31, 2 ** 31, size=(9600, 2))
+        track = self.write_track('hires.flac', samples, 96000, 24)
+
+        sink = self.create_sink()
+        self.assertEqual(sink.buffer_track(track), 4410)
+        self.assertEqual((sink.output_rate, sink.sample_width), (96000, 4))
+        self.assertEqual(self.read_all(sink), samples.astype('<i4').tobytes())
+        self.assertEqual(sum(self.frames_played), 4410)
+
+    def test_resampled_and_cached(self):
+        hires = self.write_track('hires.flac', numpy.zeros((9600, 2)), 96000, 24)
+        cd = self.write_track('cd.flac', sine(1000, 44100, 44100), 44100, 16)
+
+        sink = self.create_sink()
+        sink.buffer_track(hires)
+        self.assertEqual(sink.buffer_track(cd), 44100)
+        self.cache.close()
+        self.assertEqual(len(list(self.tmp_path.joinpath('resampled').iterdir())), 1)
+
+        data = self.read_all(sink)
+        self.assertEqual(len(data), (9600 + 96000) * 8)
+        resampled = numpy.frombuffer(data[9600 * 8:], dtype='<i4').reshape(-1, 2) / 65536
+        self.assertLess(numpy.abs(resampled - sine(1000, 96000, 96000))[100:-100].max(), 3)
+
+        # the second time round from the cache, also when seeking into it
+        with patch('hifi_appliance.audio.miniaudio.PolyphaseResampler') as resampler:
+            sink = self.create_sink()
+            sink.buffer_track(hires)
+            self.assertEqual(sink.buffer_track(cd), 44100)
+            self.assertEqual(sink.buffer_track(cd, 22050), 22050)
+            resampler.assert_not_called()
+        self.assertEqual(self.read_all(sink)[9600 * 8:], data[9600 * 8:] + data[-48000 * 8:])
+
+    def test_sixteen_bit_stream(self):
+        cd = self.write_track('cd.flac', numpy.full((4410, 2), 1000), 44100, 16)
+        hires = self.write_track('hires.flac', numpy.full((9600, 2), 1000 * 65536), 96000, 24)
+
+        sink = self.create_sink()
+        sink.buffer_track(cd)
+        self.assertEqual((sink.output_rate, sink.sample_width), (44100, 2))
+        self.assertEqual(sink.buffer_track(hires), 4410)
+        self.assertEqual(self.read_all(sink), numpy.full((8820, 2), 1000, dtype='<i2').tobytes())
+
+    def test_track_longer_than_buffer(self):
+        samples = numpy.random.default_rng(0).integers(-32768, 32768, size=(44100, 2))
+        track = self.write_track('cd.flac', samples, 44100, 16)
+
+        with patch('hifi_appliance.audio.miniaudio.BUFFER_SIZE', 10000):
+            sink = self.create_sink()
+            self.assertEqual(sink.buffer_track(track), 44100)
+            self.assertEqual(self.read_all(sink, frames=1000), samples.astype('<i2').tobytes())
@@ -0,0 +1,77 @@
+import logging
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from hifi_appliance.state import ResumePositions
+
+
+class ResumePositionsTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name).joinpath('state', 'resume_positions')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_in_memory(self):
+        positions = ResumePositions()
+        positions.update('disc_1', 3, 1000)
+
+        self.assertEqual(positions.get('disc_1'), (3, 1000))
+        self.assertIsNone(positions.get('disc_2'))
+
+        positions.forget('disc_1')
+        self.assertIsNone(positions.get('disc_1'))
+
+    def test_kept_across_restarts(self):
+        positions = ResumePositions(self.path)
+        positions.update('disc_1', 3, 1000)
+        positions.update('disc_2', 1, 0)
+        positions.forget('disc_2')
+
+        positions = ResumePositions(self.path)
+        self.assertEqual(positions.get('disc_1'), (3, 1000))
+        self.assertIsNone(positions.get('disc_2'))
+        self.assertFalse(self.path.with_name('resume_positions.tmp').exists())
+
+    def test_writes_throttled(self):
+        with patch('hifi_appliance.state.positions.time.monotonic', return_value=100):
+            positions = ResumePositions(self.path, interval=10)
+            positions.update('disc_1', 1, 1000)
+            positions.update('disc_1', 1, 2000)
+        self.assertEqual(ResumePositions(self.path).get('disc_1'), (1, 1000))
+
+        with patch('hifi_appliance.state.positions.time.monotonic', return_value=105):
+            positions.update('disc_1', 1, 3000, save=True)
+        self.assertEqual(ResumePositions(self.path).get('disc_1'), (1, 3000))
+
+        with patch('hifi_appliance.state.positions.time.monotonic', return_value=110):
+            positions.update('disc_1', 1, 4000)
+        with patch('hifi_appliance.state.positions.time.monotonic', return_value=112):
+            positions.update('disc_1', 1, 5000)
+        self.assertEqual(ResumePositions(self.path).get('disc_1'), (1, 3000))
+
+        positions.flush()
+        self.assertEqual(ResumePositions(self.path).get('disc_1'), (1, 5000))
+
+    def test_least_recently_played_dropped(self):
+        positions = ResumePositions(self.path, max_discs=2)
+        positions.update('disc_1', 1, 0)
+        positions.update('disc_2', 1, 0)
+        positions.update('disc_1', 2, 0)
+        positions.update('disc_3', 1, 0)
+
+        positions = ResumePositions(self.path)
+        self.assertEqual(len(positions), 2)
+        self.assertIsNone(positions.get('disc_2'))
+        self.assertEqual(positions.get('disc_1'), (2, 0))
+
+    def test_unreadable_file(self):
+        self.path.parent.mkdir(parents=True)
+        self.path.write_text('{"disc_1": [1')
+
+        positions = ResumePositions(self.path)
+        self.assertEqual(len(positions), 0)
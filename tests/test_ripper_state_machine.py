@@ -17,6 +17,7 @@ class RipperNewDiscTestCase(unittest.TestCase):
         self.write_meta_func = MagicMock()
         self.move_track_func = MagicMock()
         self.write_disc_id_func = MagicMock()
+        self.rename_func = MagicMock()
         self.on_state_change_callback = MagicMock()
 
         self.ripper = create_ripper(
@@ -25,6 +26,7 @@ class RipperNewDiscTestCase(unittest.TestCase):
             self.write_meta_func,
             self.move_track_func,
             self.write_disc_id_func,
+            self.rename_func,
             self.on_state_change_callback
         )
 
@@ -166,3 +168,45 @@ class RipperNewDiscTestCase(unittest.TestCase):
             self.ripper.track_list[2],
             str(expected_track_path.joinpath('03 Positrons - Maybe Tomorrow.flac'))
         )
+
+    def test_disc_meta_update_renames_ripped_tracks(self):
+        album_path = Path(MUSIC_PATH_NAME).joinpath('Positrons - The Long One Gone', 'CD1')
+        new_album_path = Path(MUSIC_PATH_NAME).joinpath('Positrons - The Long One', 'CD1')
+
+        self.ripper.start(self.disc_meta)
+        self.assertTrue(self.ripper.rip_track())
+
+        disc_meta = dict(self.disc_meta, title='The Long One')
+        disc_meta['tracks'] = [dict(track) for track in self.disc_meta['tracks']]
+        disc_meta['tracks'][0]['title'] = 'Good Days'
+
+        self.assertTrue(self.ripper.disc_meta_update(disc_meta))
+        self.assertEqual(self.ripper.state, RipperStates.RIPPING)
+
+        self.rename_func.assert_has_calls([
+            call(album_path, new_album_path),
+            call(
+                new_album_path.joinpath('01 Positrons - Good Days Outside.flac'),
+                new_album_path.joinpath('01 Positrons - Good Days.flac')
+            )
+        ])
+        self.write_meta_func.assert_called_with(
+            str(new_album_path.joinpath('01 Positrons - Good Days Outside.flac')),
+            'Positrons', 'Good Days', 'The Long One', 1, 3
+        )
+        self.assertEqual(self.ripper.track_list, [str(new_album_path.joinpath('01 Positrons - Good Days.flac'))])
+
+        self.assertTrue(self.ripper.rip_track())
+        self.move_track_func.assert_called_with(
+            Path('/tmp/blabla'),
+            new_album_path.joinpath('02 Positrons - Funny Grass.flac')
+        )
+
+    def test_disc_meta_update_needs_same_tracks(self):
+        self.ripper.start(self.disc_meta)
+
+        disc_meta = dict(self.disc_meta, tracks=self.disc_meta['tracks'][:2])
+        self.assertFalse(self.ripper.disc_meta_update(disc_meta))
+
+        self.assertIs(self.ripper.disc_meta, self.disc_meta)
+        self.rename_func.assert_not_called()
@@ -0,0 +1,167 @@
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+# hifi_appliance.ripping imports hifi_appliance.disc, which needs libdiscid
+# unless the stand-in comes first
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim', 'pylib'))
+
+from hifi_appliance.config import CD_DEVICE
+from hifi_appliance.daemons import CdpDaemon
+from hifi_appliance.ripping import DriveRipper
+from hifi_appliance.ripping import Ripping
+from hifi_appliance.ripping import encode_track
+
+
+INGEST_DEVICE = '/dev/sr1'
+
+
+class RippingDrivesTestCase(unittest.TestCase):
+    """Commands arrive as bytes and name the drive last, CD_DEVICE when they don't."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        patch.object(CdpDaemon, '__init__', return_value=None).start()
+        patch('hifi_appliance.ripping.CD_DEVICES', [INGEST_DEVICE]).start()
+        patch('hifi_appliance.ripping.DriveRipper', side_effect=lambda device, *args: MagicMock(device=device)).start()
+
+        self.ripping = Ripping(None)
+        self.drives = self.ripping.drives
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_drives(self):
+        self.assertEqual(list(self.drives), [CD_DEVICE, INGEST_DEVICE])
+
+    def test_start_on_ingest_drive(self):
+        disc_meta = {'disc_id': 'disc_id', 'tracks': [{}, {}]}
+        self.ripping.command_start([json.dumps(disc_meta).encode('ascii'), INGEST_DEVICE.encode('ascii')])
+
+        self.drives[INGEST_DEVICE].start.assert_called_once_with(disc_meta)
+        self.drives[CD_DEVICE].start.assert_not_called()
+
+    def test_start_on_playback_drive(self):
+        self.ripping.command_start([json.dumps({'tracks': []}).encode('ascii')])
+
+        self.drives[CD_DEVICE].start.assert_called_once_with({'tracks': []})
+        self.drives[INGEST_DEVICE].start.assert_not_called()
+
+    def test_meta_update_known_disc_and_eject(self):
+        device = INGEST_DEVICE.encode('ascii')
+        self.ripping.command_disc_meta_update([json.dumps({'tracks': [{}]}).encode('ascii'), device])
+        self.ripping.command_known_disc([device])
+        self.ripping.command_eject([device])
+
+        drive = self.drives[INGEST_DEVICE]
+        drive.update_disc_meta.assert_called_once_with({'tracks': [{}]})
+        drive.known_disc.assert_called_once_with()
+        drive.eject.assert_called_once_with()
+        self.drives[CD_DEVICE].eject.assert_not_called()
+
+    def test_unconfigured_drive(self):
+        self.assertIsNone(self.ripping.get_drive([b'/dev/sr9'], 0))
+
+
+class DriveRipperTestCase(unittest.TestCase):
+    """The drive reads the next track while the one before is encoded."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+        self.events = []
+        self.encodes = {}
+        encoder_executor = MagicMock(submit=self.submit_encode)
+
+        self.callbacks = []
+        self.drive = DriveRipper(INGEST_DEVICE, encoder_executor, MagicMock(), self.callbacks.append)
+        self.drive.state_machine = MagicMock(disc_meta={'tracks': [{}, {}, {}]})
+        self.drive.read_track = self.read_track
+        self.drive.verify_checksum = MagicMock(return_value=None)
+        self.drive.record_checksum = MagicMock()
+
+    def read_track(self, track_number, paranoia_args, de_emphasis=False):
+        self.events.append(('read', track_number))
+        return ('/tmp/track_%s.pcm' % track_number, None, 0)
+
+    def submit_encode(self, func, pcm_filename):
+        self.events.append(('encode', pcm_filename))
+        self.encodes[pcm_filename] = Future()
+        return self.encodes[pcm_filename]
+
+    def encoded(self, track_number):
+        self.encodes['/tmp/track_%s.pcm' % track_number].set_result('/tmp/track_%s.flac' % track_number)
+
+    def test_next_track_read_while_encoding(self):
+        thread = ThreadPoolExecutor(max_workers=1)
+        first = thread.submit(self.drive.grab_and_convert_track, 1)
+
+        # the drive is on to track 2 before track 1 is encoded
+        self.wait_for(lambda: ('read', 2) in self.events)
+        self.assertFalse(first.done())
+        self.encoded(1)
+        self.assertEqual(first.result(timeout=5), '/tmp/track_1.flac')
+
+        self.encoded(2)
+        self.assertEqual(self.drive.grab_and_convert_track(2), '/tmp/track_2.flac')
+        self.encoded(3)
+        self.assertEqual(self.drive.grab_and_convert_track(3), '/tmp/track_3.flac')
+
+        self.assertEqual([event for event in self.events if event[0] == 'read'], [('read', 1), ('read', 2), ('read', 3)])
+        self.assertEqual(self.drive.encoding, {})
+        thread.shutdown()
+
+    def test_eject_deletes_tracks_read_ahead(self):
+        thread = ThreadPoolExecutor(max_workers=1)
+        first = thread.submit(self.drive.grab_and_convert_track, 1)
+        self.wait_for(lambda: ('read', 2) in self.events)
+        self.encoded(1)
+        first.result(timeout=5)
+
+        with patch('hifi_appliance.ripping.Path') as path:
+            self.drive.eject()
+            self.encoded(2)
+            path.assert_called_once_with('/tmp/track_2.flac')
+            path.return_value.unlink.assert_called_once_with()
+        thread.shutdown()
+
+    def test_ingest_drive_ejected_on_io_loop(self):
+        self.drive.state_machine.disc_meta = {'tracks': [{}]}
+        self.drive.load_accuraterip_entry = MagicMock()
+
+        with patch('hifi_appliance.ripping.subprocess.call') as call:
+            self.drive.rip_disc(1)
+        call.assert_called_once_with(['eject', INGEST_DEVICE])
+
+        self.drive.state_machine.eject.assert_not_called()
+        self.assertEqual(self.callbacks, [self.drive.eject])
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+
+class EncodeTrackTestCase(unittest.TestCase):
+    def test_ffmpeg_failure_raised(self):
+        error = subprocess.CalledProcessError(1, 'ffmpeg')
+        with patch('hifi_appliance.ripping.subprocess.run', side_effect=error), \
+                patch('hifi_appliance.ripping.tempfile.mkstemp', return_value=(None, '/tmp/track_1.flac')), \
+                patch('hifi_appliance.ripping.Path') as path:
+            with self.assertRaises(subprocess.CalledProcessError):
+                encode_track('/tmp/track_1.pcm')
+
+        # neither the raw track nor the partial FLAC is left behind
+        self.assertEqual(
+            sorted(call.args for call in path.call_args_list),
+            [('/tmp/track_1.flac',), ('/tmp/track_1.pcm',)]
+        )
+        self.assertEqual(path.return_value.unlink.call_count, 2)
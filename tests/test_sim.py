@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import mutagen
+
+# the simulated drive reads TOC fixtures through hifi_appliance.disc, which
+# needs libdiscid unless the stand-in comes first
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim', 'pylib'))
+
+from hifi_appliance.meta import RemoteMeta
+from tests.sim.drive import read_flac_pcm
+from tests.sim.drive import SimulatedDisc
+from tests.sim.drive import write_flac
+from tests.sim.musicbrainz import FIXTURES_PATH
+from tests.sim.musicbrainz import MusicbrainzStandIn
+
+
+SIM_PATH = Path(os.path.dirname(__file__)).joinpath('sim')
+TOC_PATH = Path(os.path.dirname(__file__)).joinpath('data', 'toc')
+
+
+class SimulatedDiscTestCase(unittest.TestCase):
+    def test_disc_ids_match_musicbrainz(self):
+        for fixture in FIXTURES_PATH.iterdir():
+            response = json.loads(fixture.read_text())
+            disc = response['disc']
+            simulated = SimulatedDisc([int(o) for o in disc['offset-list']], int(disc['sectors']))
+            self.assertEqual(simulated.disc_id, disc['id'])
+
+    def test_disc_from_toc(self):
+        disc = SimulatedDisc.from_file(TOC_PATH.joinpath('cdtext'))
+
+        self.assertEqual(disc.track_count, 11)
+        self.assertEqual(disc.title, 'The Division Bell')
+        self.assertEqual(disc.tracks[0]['title'], 'Cluster One')
+        self.assertEqual(sum(disc.track_lengths()) * 588, 175854336)
+
+    def test_emphasized_disc_from_toc(self):
+        disc = SimulatedDisc.from_file(TOC_PATH.joinpath('emphasis'))
+
+        self.assertEqual([track['pre_emphasis'] for track in disc.tracks], [False, True, True])
+        self.assertEqual(disc.toc_text().count('\nPRE_EMPHASIS'), 2)
+
+    def test_scaled_disc(self):
+        disc = SimulatedDisc.from_file(FIXTURES_PATH.joinpath('cd_08'), scale=0.01)
+
+        self.assertEqual(disc.track_count, 8)
+        self.assertTrue(all(length >= 300 for length in disc.track_lengths()))
+        self.assertEqual(len(b''.join(disc.iter_pcm(1))), disc.track_bytes(1))
+
+    def test_flac_stand_in_is_taggable(self):
+        pcm_data = b'\x01\x02\x03\x04' * 44100
+        (_, path) = tempfile.mkstemp()
+        write_flac(path, pcm_data)
+
+        flac = mutagen.File(path)
+        self.assertEqual(flac.info.total_samples, 44100)
+        flac['title'] = 'Title'
+        flac.save()
+
+        self.assertEqual(mutagen.File(path)['title'], ['Title'])
+        self.assertEqual(read_flac_pcm(Path(path).read_bytes()), pcm_data)
+        os.unlink(path)
+
+
+class ToolStandInTestCase(unittest.TestCase):
+    def setUp(self):
+        self.env = dict(os.environ)
+        self.env['PYTHONPATH'] = str(SIM_PATH.joinpath('pylib'))
+        self.env['CDP_SIM_DISC'] = str(FIXTURES_PATH.joinpath('cd_08'))
+        self.env['CDP_SIM_SCALE'] = '0.005'
+        self.env['CDP_SIM_READ_SPEED'] = '1000'
+        self.disc = SimulatedDisc.from_file(FIXTURES_PATH.joinpath('cd_08'), scale=0.005)
+
+    def _run(self, tool, *args, **kwargs):
+        return subprocess.run(
+            [sys.executable, str(SIM_PATH.joinpath('bin', tool))] + list(args),
+            env=self.env, capture_output=True, **kwargs
+        )
+
+    def test_cd_paranoia(self):
+        result = self._run('cd-paranoia', '-Y', '-e', '-r', '2', '-')
+
+        self.assertEqual(result.stdout, b''.join(self.disc.iter_pcm(2)))
+        self.assertIn(b'##: 0 [read]', result.stderr)
+
+    def test_cd_paranoia_read_errors(self):
+        self.env['CDP_SIM_ERROR_RATE'] = '1'
+
+        fast = self._run('cd-paranoia', '-Y', '-e', '-r', '1', '-')
+        secure = self._run('cd-paranoia', '-S', '4', '-e', '-r', '1', '-')
+
+        self.assertIn(b'[skip]', fast.stderr)
+        self.assertNotIn(b'[skip]', secure.stderr)
+
+    def test_cdrdao(self):
+        self.env['CDP_SIM_DISC'] = str(TOC_PATH.joinpath('cdtext'))
+
+        (_, path) = tempfile.mkstemp()
+        self._run('cdrdao', 'read-toc', '--fast-toc', '--device', '/dev/sr0', path)
+        toc = Path(path).read_text()
+
+        self.assertIn('TITLE "The Division Bell"', toc)
+        self.assertEqual(toc.count('TRACK AUDIO'), 11)
+        os.unlink(path)
+
+    def test_ffmpeg_round_trip(self):
+        pcm_data = b''.join(self.disc.iter_pcm(1))
+        (_, flac_path) = tempfile.mkstemp()
+
+        self._run('ffmpeg', '-f', 's16le', '-i', '-', '-f', 'flac', flac_path, input=pcm_data)
+        decoded = self._run('ffmpeg', '-i', flac_path, '-f', 's16le', '-')
+
+        self.assertEqual(decoded.stdout, pcm_data)
+        os.unlink(flac_path)
+
+
+class MusicbrainzStandInTestCase(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        # other test cases patch out musicbrainzngs setup without restoring it
+        patch.stopall()
+        self.stand_in = MusicbrainzStandIn.from_fixtures().start()
+
+    def tearDown(self):
+        self.stand_in.stop()
+
+    def _query(self, disc_id):
+        import hifi_appliance.meta.musicbrainz as musicbrainz
+        original = (musicbrainz.MUSICBRAINZ_HOST, musicbrainz.MUSICBRAINZ_USE_HTTPS)
+        musicbrainz.MUSICBRAINZ_HOST, musicbrainz.MUSICBRAINZ_USE_HTTPS = self.stand_in.host, False
+        try:
+            return RemoteMeta().query(disc_id)
+        finally:
+            musicbrainz.MUSICBRAINZ_HOST, musicbrainz.MUSICBRAINZ_USE_HTTPS = original
+
+    def test_known_disc(self):
+        disc_meta = self._query('VYyHlY0Pj.OzVIZ2O08uuzsFOdw-')
+
+        self.assertEqual(disc_meta['title'], 'The Many Faces of Daft Punk')
+        self.assertEqual(disc_meta['cd'], 2)
+        self.assertEqual(disc_meta['total_cds'], 3)
+        self.assertEqual(disc_meta['duration'], 163390500)
+        self.assertNotIn('artist', disc_meta)
+
+    def test_unknown_disc(self):
+        self.assertIsNone(self._query('unknown-disc-id'))
+        self.assertEqual(self.stand_in.requests, ['/ws/2/discid/unknown-disc-id'])
@@ -0,0 +1,41 @@
+import unittest
+
+from hifi_appliance.constants import SAMPLE_RATE
+from hifi_appliance.meta import TocFingerprintIndex
+
+
+def seconds(*lengths):
+    return [int(length * SAMPLE_RATE) for length in lengths]
+
+
+class TocFingerprintIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = TocFingerprintIndex(tolerance=2)
+        self.index.add('album', seconds(200, 180, 240, 300))
+        self.index.add('other album', seconds(100, 120, 140, 160))
+        self.index.add('single', seconds(200, 180))
+
+    def test_exact_layout(self):
+        self.assertEqual(self.index.match(seconds(200, 180, 240, 300)), 'album')
+
+    def test_other_pressing(self):
+        self.assertEqual(self.index.match(seconds(200.5, 179, 240, 301.9)), 'album')
+
+    def test_beyond_tolerance(self):
+        self.assertIsNone(self.index.match(seconds(200, 180, 240, 303)))
+
+    def test_different_track_count(self):
+        self.assertIsNone(self.index.match(seconds(200, 180, 240)))
+        self.assertIsNone(self.index.match(seconds(200, 180, 240, 300, 10)))
+
+    def test_closest_wins(self):
+        self.index.add('remaster', seconds(201, 181, 241, 301))
+        self.assertEqual(self.index.match(seconds(200.9, 181, 240.8, 301)), 'remaster')
+        self.assertEqual(self.index.match(seconds(200, 180.1, 240, 300)), 'album')
+
+    def test_too_few_tracks(self):
+        self.assertEqual(len(self.index), 2)
+        self.assertIsNone(self.index.match(seconds(200, 180)))
+
+    def test_empty(self):
+        self.assertIsNone(TocFingerprintIndex(tolerance=2).match(seconds(200, 180, 240)))
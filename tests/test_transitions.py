@@ -0,0 +1,171 @@
+import logging
+import os
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy
+
+from hifi_appliance.audio import MiniaudioSink
+from hifi_appliance.audio import TransitionEngine
+from tests.sim.drive import write_flac
+
+
+RATE = 1000  # frames per second, keeps the numbers small
+
+SIM_BIN_PATH = Path(__file__).resolve().parent.joinpath('sim', 'bin')
+
+
+def track(*parts):
+    """Stereo 16 bit PCM of (seconds, level) parts."""
+    return numpy.concatenate([numpy.full((int(seconds * RATE), 2), level, dtype='<i2') for (seconds, level) in parts])
+
+
+def stream(engine, *tracks):
+    """All the engine puts into the stream for `tracks` and the frames per track."""
+    (data, frames) = (b'', [])
+    for (pcm, album_changed) in tracks:
+        (chunks, track_frames) = engine.append(pcm.tobytes(), album_changed)
+        data += b''.join(bytes(chunk) for chunk in chunks)
+        frames.append(track_frames)
+    data += bytes(engine.flush())
+    return (numpy.frombuffer(data, dtype='<i2').reshape(-1, 2), frames)
+
+
+class TransitionEngineTestCase(unittest.TestCase):
+    def test_gapless(self):
+        (first, second) = (track((3, 1000)), track((2, -1000)))
+        (output, frames) = stream(TransitionEngine(RATE, 2), (first, False), (second, False))
+
+        numpy.testing.assert_array_equal(output, numpy.concatenate([first, second]))
+        self.assertEqual(frames, [3 * RATE, 2 * RATE])
+
+    def test_nothing_held_back_when_gapless(self):
+        (chunks, frames) = TransitionEngine(RATE, 2).append(track((3, 1000)).tobytes())
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 3 * RATE * 4)
+        self.assertEqual(frames, 3 * RATE)
+
+    def test_crossfade(self):
+        engine = TransitionEngine(RATE, 2, within_album='crossfade', crossfade_seconds=1)
+        (first, second) = (track((3, 1000)), track((2, -1000)))
+        (output, frames) = stream(engine, (first, False), (second, False))
+
+        self.assertEqual(len(output), 4 * RATE)
+        self.assertEqual(frames, [3 * RATE, RATE])
+        numpy.testing.assert_array_equal(output[:2 * RATE], first[:2 * RATE])
+        numpy.testing.assert_array_equal(output[3 * RATE:], second[RATE:])
+
+        # equal power: faded from one to the other, through silence halfway
+        overlap = output[2 * RATE:3 * RATE, 0]
+        self.assertEqual((overlap[0], overlap[RATE // 2 - 1], overlap[-1]), (999, 1, -999))
+        self.assertTrue((numpy.diff(overlap) <= 0).all())
+
+    def test_crossfade_into_short_track(self):
+        engine = TransitionEngine(RATE, 2, within_album='crossfade', crossfade_seconds=1)
+        (output, frames) = stream(engine, (track((3, 1000)), False), (track((0.5, 1000)), False))
+
+        self.assertEqual(len(output), 3 * RATE)
+        self.assertEqual(sum(frames), 3 * RATE)
+
+    def test_full_scale_crossfade_stays_in_range(self):
+        engine = TransitionEngine(RATE, 2, within_album='crossfade', crossfade_seconds=1)
+        (output, _) = stream(engine, (track((2, 32767)), False), (track((2, 32767)), False))
+        self.assertEqual(output.max(), 32767)
+
+    def test_trim(self):
+        engine = TransitionEngine(RATE, 2, within_album='trim')
+        (output, frames) = stream(
+            engine,
+            (track((2, 1000), (1, 0)), False),
+            (track((0.5, 10), (2, -1000), (1, 0)), False)
+        )
+
+        numpy.testing.assert_array_equal(output, track((2, 1000), (2, -1000), (1, 0)))
+        self.assertEqual(frames, [3 * RATE, 2 * RATE])
+
+    def test_trim_after_loud_ending(self):
+        engine = TransitionEngine(RATE, 2, within_album='trim')
+        (output, frames) = stream(
+            engine,
+            (track((2, 1000)), False),
+            (track((1, 0), (2, -1000)), False)
+        )
+
+        numpy.testing.assert_array_equal(output, track((2, 1000), (2, -1000)))
+        self.assertEqual(frames, [2 * RATE, 2 * RATE])
+
+    def test_first_track_not_trimmed(self):
+        engine = TransitionEngine(RATE, 2, within_album='trim')
+        (output, frames) = stream(engine, (track((1, 0), (2, 1000)), False))
+        self.assertEqual(len(output), 3 * RATE)
+
+    def test_silent_track_not_trimmed_away(self):
+        engine = TransitionEngine(RATE, 2, within_album='trim')
+        (output, _) = stream(engine, (track((2, 1000)), False), (track((3, 0)), False))
+        self.assertEqual(len(output), 5 * RATE)
+
+    def test_transition_between_albums(self):
+        engine = TransitionEngine(RATE, 2, between_albums='crossfade', crossfade_seconds=1)
+        (output, frames) = stream(
+            engine,
+            (track((2, 1000)), False),
+            (track((2, 1000)), False),
+            (track((2, 1000)), True)
+        )
+
+        self.assertEqual(len(output), 5 * RATE)
+        self.assertEqual(frames, [2 * RATE, 2 * RATE, RATE])
+
+    def test_unknown_transition(self):
+        with self.assertRaises(ValueError):
+            TransitionEngine(RATE, 2, within_album='segue')
+
+
+class SinkTransitionTestCase(unittest.TestCase):
+    """Transitions through the sink, frames are read as the device thread would."""
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+        patch.dict(os.environ, {'PATH': '%s%s%s' % (SIM_BIN_PATH, os.pathsep, os.environ.get('PATH', ''))}).start()
+        patch('hifi_appliance.audio.miniaudio.device_capabilities', return_value=(None, None)).start()
+        patch('hifi_appliance.audio.miniaudio.TRANSITION', 'crossfade').start()
+        patch('hifi_appliance.audio.miniaudio.CROSSFADE_SECONDS', 1).start()
+        patch.object(MiniaudioSink, '_start_device', lambda sink: None).start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.tmp_dir.cleanup()
+
+    def write_track(self, name, seconds, level):
+        path = self.tmp_path.joinpath(name)
+        write_flac(str(path), numpy.full((seconds * 44100, 2), level, dtype='<i2').tobytes())
+        return str(path)
+
+    def read_all(self, sink):
+        generator = sink._read_frames()
+        next(generator)
+        sink.resume()
+        data = b''
+        try:
+            while True:
+                data += bytes(generator.send(4096))
+        except StopIteration:
+            return numpy.frombuffer(data, dtype='<i2').reshape(-1, 2)
+
+    def test_crossfade(self):
+        sink = MiniaudioSink(lambda: None, lambda frames: None)
+        self.assertEqual(sink.buffer_track(self.write_track('01.flac', 3, 1000)), 3 * 44100)
+        self.assertEqual(sink.buffer_track(self.write_track('02.flac', 2, -1000)), 44100)
+
+        output = self.read_all(sink)
+        self.assertEqual(len(output), 4 * 44100)
+        self.assertEqual((output[0, 0], output[-1, 0]), (1000, -1000))
+
+    def test_end_held_back_played_without_next_track(self):
+        sink = MiniaudioSink(lambda: None, lambda frames: None)
+        sink.buffer_track(self.write_track('01.flac', 3, 1000))
+
+        numpy.testing.assert_array_equal(self.read_all(sink), numpy.full((3 * 44100, 2), 1000))